@@ -0,0 +1,289 @@
+"""
+Benchmarks the post processors of this package on synthetic data of several sizes.
+
+Timed are BurnedSeverityPostProcessor.process_observations on a pair of Sentinel-2 observations, _process of the
+functional diversity metrics post processor on lai, cab and cw and the full run of the functional diversity metrics
+post processor with run_post_processor, from GeoTiff files to GeoTiff files. Each benchmark is run in a fresh process,
+so that its peak memory can be recorded. Results are saved as JSON and can be compared to those of an earlier
+version:
+
+    python benchmarks/benchmark_post_processors.py -o results_0.6.1.json --sizes 1000 2000
+    python benchmarks/benchmark_post_processors.py -o results_0.7.json --sizes 1000 2000 -c results_0.6.1.json
+
+When compared, the script exits with status 1 if any benchmark has become slower than the given tolerance allows.
+Note that the functional diversity metrics are derived plot by plot, so that they take long on large rasters.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from typing import List
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+BURNED_SEVERITY = 'burned_severity'
+FUNCTIONAL_DIVERSITY = 'functional_diversity'
+RUN_POST_PROCESSOR = 'run_post_processor'
+BENCHMARKS = [BURNED_SEVERITY, FUNCTIONAL_DIVERSITY, RUN_POST_PROCESSOR]
+DEFAULT_SIZES = [1000, 2000, 5000, 10000]
+RESULTS_VERSION = 1
+
+_BandData = namedtuple('BandData', ['observations'])
+_FD_INDICATORS = ['cvh', 'mnnd', 'fe', 'fdiv']
+_FD_VARIABLES = {'lai': (0.0, 7.0), 'cab': (10.0, 80.0), 'cw': (0.005, 0.05)}
+_FD_DATE = '2017156'
+_PIXEL_SIZE = 10
+_UPPER_LEFT = (500000, 4400000)
+_PROJECTION = 'EPSG:32630'
+# the scale of the structures in the synthetic rasters, in pixels
+_FEATURE_SIZE = 100
+_NO_DATA_FRACTION = 0.01
+_SEED = 42
+
+
+class SyntheticObservations(object):
+    """
+    Stands in for a pair of Sentinel-2 observations of which the second one shows a burned area.
+    """
+
+    def __init__(self, size: int, seed: int = _SEED):
+        from multiply_core.observations import DataTypeConstants
+        from multiply_post_processing.burned_severity_post_processor import _SENTINEL_2_DICT
+        self.dates = [datetime(2017, 6, 5), datetime(2017, 6, 15)]
+        self._data_type = DataTypeConstants.S2_L2
+        random = np.random.RandomState(seed)
+        no_data = _SENTINEL_2_DICT['no_data'] * _SENTINEL_2_DICT['scale_factor']
+        burned = _get_field(size, random) > 0.6
+        self._bands = {}
+        for band_name, reflectance, change in [(_SENTINEL_2_DICT['nir'], (0.2, 0.4), -0.15),
+                                               (_SENTINEL_2_DICT['smir'], (0.15, 0.3), 0.05),
+                                               (_SENTINEL_2_DICT['swir'], (0.08, 0.2), 0.1)]:
+            before = _scale(_get_field(size, random), reflectance)
+            after = before + change * burned + random.normal(0.0, 0.005, (size, size)).astype(np.float32)
+            for date, band_data in zip(self.dates, [before, after]):
+                band_data[random.random_sample((size, size)) < _NO_DATA_FRACTION] = no_data
+                self._bands[(date, band_name)] = band_data
+
+    def get_data_type(self, date: datetime) -> str:
+        return self._data_type
+
+    def set_no_data_value(self, date: datetime, band_name: str, no_data_value: float):
+        pass
+
+    def get_band_data_by_name(self, date: datetime, band_name: str, retrieve_uncertainty: bool = True) -> _BandData:
+        return _BandData(self._bands[(date, band_name)])
+
+
+def create_traits(size: int, seed: int = _SEED) -> dict:
+    """
+    :return: Synthetic rasters of lai, cab and cw, with some pixels missing
+    """
+    random = np.random.RandomState(seed)
+    traits = {}
+    for variable_name in _FD_VARIABLES:
+        trait = _scale(_get_field(size, random), _FD_VARIABLES[variable_name])
+        trait[random.random_sample((size, size)) < _NO_DATA_FRACTION] = np.nan
+        traits[variable_name] = trait
+    return traits
+
+
+def write_traits(traits: dict, data_path: str) -> str:
+    """
+    Writes trait rasters as GeoTiff files, named the way variable files are recognized.
+    :return: The region of interest covered by the files, as WKT in the reference system of the files
+    """
+    import gdal
+    import osr
+    srs = osr.SpatialReference()
+    srs.SetFromUserInput(_PROJECTION)
+    driver = gdal.GetDriverByName('GTiff')
+    height, width = next(iter(traits.values())).shape
+    for variable_name in traits:
+        file_name = os.path.join(data_path, '{}_A{}.tif'.format(variable_name, _FD_DATE))
+        dataset = driver.Create(file_name, width, height, 1, gdal.GDT_Float32)
+        dataset.SetGeoTransform((_UPPER_LEFT[0], _PIXEL_SIZE, 0, _UPPER_LEFT[1], 0, -_PIXEL_SIZE))
+        dataset.SetProjection(srs.ExportToWkt())
+        dataset.GetRasterBand(1).SetNoDataValue(float('nan'))
+        dataset.GetRasterBand(1).WriteArray(traits[variable_name])
+        dataset = None
+    min_x, max_y = _UPPER_LEFT
+    max_x = min_x + width * _PIXEL_SIZE
+    min_y = max_y - height * _PIXEL_SIZE
+    return 'POLYGON (({0} {3}, {2} {3}, {2} {1}, {0} {1}, {0} {3}))'.format(min_x, min_y, max_x, max_y)
+
+
+def run_benchmark(benchmark: str, size: int, repeat: int, trace_memory: bool) -> dict:
+    """
+    Runs a benchmark. The data is created before the benchmark is timed.
+    :param benchmark: One of BENCHMARKS
+    :param size: The width and height of the synthetic rasters
+    :param repeat: How often the benchmark is timed
+    :param trace_memory: If True, the benchmark is run once more while tracemalloc traces the memory it allocates
+    :return: The times of the runs in seconds and the peak memory in bytes
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    work_path = tempfile.mkdtemp(prefix='multiply_benchmark_')
+    try:
+        function = _prepare(benchmark, size, work_path)
+        peak_rss_before = _get_peak_rss()
+        times = []
+        for i in range(repeat):
+            start_time = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start_time)
+        result = {'benchmark': benchmark, 'size': size, 'times': times, 'min_time': min(times),
+                  'median_time': statistics.median(times), 'pixels_per_second': size * size / min(times),
+                  'peak_rss': _get_peak_rss(), 'peak_rss_increase': _get_peak_rss() - peak_rss_before}
+        if trace_memory:
+            tracemalloc.start()
+            try:
+                function()
+                result['peak_traced_memory'] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        return result
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+
+
+def run_benchmarks(benchmarks: List[str], sizes: List[int], repeat: int = 3, trace_memory: bool = False) -> dict:
+    """
+    Runs each benchmark on each size in a fresh process.
+    :return: The results together with a description of the environment they have been obtained in
+    """
+    from multiply_post_processing.version import __version__
+    results = []
+    for benchmark in benchmarks:
+        for size in sizes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                result = executor.submit(run_benchmark, benchmark, size, repeat, trace_memory).result()
+            logging.getLogger().info(f'{benchmark} on {size} x {size} pixels: {result["min_time"]:.3f} s')
+            results.append(result)
+    return {'results_version': RESULTS_VERSION, 'version': __version__, 'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'processor': platform.processor(), 'cpu_count': os.cpu_count(), 'repeat': repeat, 'results': results}
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.1) -> List[str]:
+    """
+    Compares benchmark results to those of a baseline. Benchmarks are compared by their fastest run.
+    :param tolerance: The fraction by which a benchmark may be slower than in the baseline
+    :return: Descriptions of the benchmarks that have become slower than the tolerance allows
+    """
+    baseline_times = {(result['benchmark'], result['size']): result['min_time'] for result in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        baseline_time = baseline_times.get((result['benchmark'], result['size']))
+        if baseline_time is None:
+            continue
+        ratio = result['min_time'] / baseline_time
+        logging.getLogger().info(f'{result["benchmark"]} on {result["size"]} x {result["size"]} pixels: '
+                                 f'{ratio:.2f} times the time of version {baseline["version"]}')
+        if ratio > 1 + tolerance:
+            regressions.append(f'{result["benchmark"]} on {result["size"]} x {result["size"]} pixels took '
+                               f'{result["min_time"]:.3f} s instead of {baseline_time:.3f} s')
+    return regressions
+
+
+def _prepare(benchmark: str, size: int, work_path: str):
+    if benchmark == BURNED_SEVERITY:
+        from multiply_post_processing.burned_severity_post_processor import BurnedSeverityPostProcessor
+        post_processor = BurnedSeverityPostProcessor(['GeoCBI'])
+        observations = SyntheticObservations(size)
+        return lambda: post_processor.process_observations(observations)
+    if benchmark == FUNCTIONAL_DIVERSITY:
+        from multiply_post_processing.functional_diversity_metrics_post_processor import _pre_process, _process
+        pre_processed_traits = _pre_process(create_traits(size))
+        return lambda: _process(pre_processed_traits, _FD_INDICATORS)
+    if benchmark == RUN_POST_PROCESSOR:
+        from multiply_post_processing.post_processing import run_post_processor
+        data_path = os.path.join(work_path, 'data')
+        output_path = os.path.join(work_path, 'output')
+        os.makedirs(data_path)
+        roi = write_traits(create_traits(size), data_path)
+        return lambda: run_post_processor('FunctionalDiversityMetrics', data_path, output_path, roi, _PIXEL_SIZE,
+                                          indicator_names=_FD_INDICATORS, variable_names=list(_FD_VARIABLES),
+                                          roi_grid=_PROJECTION, destination_grid=_PROJECTION, resume=False)
+    raise ValueError('Unknown benchmark {}. Choose from {}.'.format(benchmark, ', '.join(BENCHMARKS)))
+
+
+def _get_field(size: int, random: np.random.RandomState) -> np.ndarray:
+    # a smooth field in [0, 1] with structures of about _FEATURE_SIZE pixels and some noise
+    num_features = size // _FEATURE_SIZE + 2
+    coarse = random.random_sample((num_features, num_features)).astype(np.float32)
+    rows = np.linspace(0, num_features - 1, size, dtype=np.float32)
+    columns = np.linspace(0, num_features - 1, size, dtype=np.float32)
+    indexes = np.arange(num_features)
+    # the coarse field is interpolated along the rows first, then along the columns
+    interpolated_rows = np.array([np.interp(columns, indexes, row) for row in coarse], dtype=np.float32)
+    field = np.empty((size, size), dtype=np.float32)
+    for j in range(size):
+        field[:, j] = np.interp(rows, indexes, interpolated_rows[:, j])
+    field += random.normal(0.0, 0.05, (size, size)).astype(np.float32)
+    return np.clip(field, 0.0, 1.0)
+
+
+def _scale(field: np.ndarray, value_range: tuple) -> np.ndarray:
+    return (value_range[0] + field * (value_range[1] - value_range[0])).astype(np.float32)
+
+
+def _get_peak_rss() -> int:
+    if resource is None:
+        return 0
+    # Linux gives kibibytes, macOS bytes
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if platform.system() == 'Darwin' else peak_rss * 1024
+
+
+def _read_results(results_file: str) -> dict:
+    with open(results_file, 'r') as results:
+        return json.load(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the MULTIPLY post processors on synthetic data')
+    parser.add_argument("-o", "--output_file", help="The JSON file the results are written to.", required=True)
+    parser.add_argument("-b", "--benchmarks", nargs='+', choices=BENCHMARKS, default=BENCHMARKS,
+                        help="The benchmarks to run (default is all).")
+    parser.add_argument("-s", "--sizes", nargs='+', type=int, default=DEFAULT_SIZES,
+                        help="The widths and heights of the synthetic rasters in pixels (default is {}).".format(
+                            ' '.join([str(size) for size in DEFAULT_SIZES])))
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="How often each benchmark is timed "
+                                                                    "(default is 3).")
+    parser.add_argument("--trace_memory", action="store_true", help="Runs each benchmark once more to record the "
+                                                                   "peak of the memory it allocates.")
+    parser.add_argument("-c", "--compare", help="A JSON file with results of an earlier version to compare to.")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.1,
+                        help="The fraction by which a benchmark may be slower than in the results compared to "
+                             "(default is 0.1).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    benchmark_results = run_benchmarks(args.benchmarks, args.sizes, args.repeat, args.trace_memory)
+    with open(args.output_file, 'w') as output_file:
+        json.dump(benchmark_results, output_file, indent=2)
+    if args.compare is not None:
+        found_regressions = compare(benchmark_results, _read_results(args.compare), args.tolerance)
+        for regression in found_regressions:
+            logging.warning(regression)
+        if len(found_regressions) > 0:
+            sys.exit(1)
@@ -1,7 +1,46 @@
-from .post_processor import EODataPostProcessor, PostProcessor, PostProcessorCreator, PostProcessorType, \
-    VariablePostProcessor
-from .burned_severity_post_processor import BurnedSeverityPostProcessorCreator
-from .functional_diversity_metrics_post_processor import FunctionalDiversityMetricsPostProcessorCreator
-from .post_processing import add_post_processor_creator, get_available_indicators, get_post_processor_description,\
-    get_post_processor_names, run_post_processing, run_post_processor, get_post_processor_creators
+import importlib
+
 from .version import __version__
+
+# Everything is imported when it is accessed first, so that importing the package does not pull in GDAL, SciPy or
+# scikit-learn, e.g., when post processors are only listed.
+_EXPORTS = {
+    'EODataPostProcessor': 'post_processor',
+    'PostProcessor': 'post_processor',
+    'PostProcessorCreator': 'post_processor',
+    'PostProcessorType': 'post_processor',
+    'VariablePostProcessor': 'post_processor',
+    'BurnedSeverityPostProcessorCreator': 'burned_severity_post_processor',
+    'FunctionalDiversityMetricsPostProcessorCreator': 'functional_diversity_metrics_post_processor',
+    'add_indicator_library': 'indicators',
+    'add_post_processor_creator': 'registry',
+    'get_available_indicator_names': 'registry',
+    'get_available_indicators': 'registry',
+    'get_post_processor_creators': 'registry',
+    'get_post_processor_description': 'registry',
+    'get_post_processor_names': 'registry',
+    'iterate_post_processing': 'post_processing',
+    'iterate_post_processor': 'post_processing',
+    'run_post_processing': 'post_processing',
+    'run_post_processor': 'post_processing',
+}
+
+__all__ = sorted(_EXPORTS) + ['__version__']
+
+
+def __getattr__(name: str):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    # submodules are accessed as attributes, e.g., by the entry points of the post processor creators
+    try:
+        return importlib.import_module('.' + name, __name__)
+    except ModuleNotFoundError as e:
+        if e.name != '{}.{}'.format(__name__, name):
+            raise
+    raise AttributeError('module {} has no attribute {}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
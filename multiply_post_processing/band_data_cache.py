@@ -0,0 +1,213 @@
+import logging
+import numpy as np
+
+from collections import OrderedDict
+from datetime import datetime
+from threading import Event, RLock, Semaphore, Thread
+from typing import Callable, Hashable, List, NamedTuple, Optional
+
+from multiply_core.observations import ObservationsWrapper
+
+from multiply_post_processing.instrumentation import stage
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+
+class BandDataCache(object):
+    """
+    A least-recently-used cache for band data that has been read and reprojected. Entries are evicted as soon as the
+    arrays held by the cache exceed a memory budget. Cached arrays are made read-only, as they are shared between all
+    users of the cache.
+    """
+
+    def __init__(self, max_size: int):
+        """
+        :param max_size: The memory budget of the cache in bytes
+        """
+        self._max_size = max_size
+        self._size = 0
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = RLock()
+
+    def get_size(self) -> int:
+        """
+        :return: The number of bytes currently held by the cache
+        """
+        return self._size
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, load: Callable[[], NamedTuple]) -> NamedTuple:
+        """
+        :param key: The key of the band data
+        :param load: A function that reads the band data. It is called if the band data is not cached. If the band
+        data is currently being loaded by another thread, this waits for it instead.
+        :return: The band data
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            loading = self._loading.get(key)
+            if loading is None:
+                loading = self._loading[key] = Event()
+                is_loading = True
+            else:
+                is_loading = False
+        if not is_loading:
+            loading.wait()
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    return self._entries[key]
+            # loading failed or the band data could not be kept, so it is read once more
+            observation_data = load()
+            self.put(key, observation_data)
+            return observation_data
+        try:
+            observation_data = load()
+            self.put(key, observation_data)
+        finally:
+            with self._lock:
+                self._loading.pop(key)
+            loading.set()
+        return observation_data
+
+    def put(self, key: Hashable, observation_data: NamedTuple):
+        size = _get_size(observation_data)
+        if size > self._max_size:
+            return
+        _set_read_only(observation_data)
+        with self._lock:
+            if key in self._entries:
+                self._size -= _get_size(self._entries.pop(key))
+            self._entries[key] = observation_data
+            self._size += size
+            while self._size > self._max_size:
+                _, evicted_observation_data = self._entries.popitem(last=False)
+                self._size -= _get_size(evicted_observation_data)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class CachingObservationsWrapper(object):
+    """
+    Wraps observations so that band data is taken from a band data cache. Everything else is handed through to the
+    wrapped observations.
+    """
+
+    def __init__(self, observations: ObservationsWrapper, band_data_cache: BandDataCache, grid_key: Hashable):
+        """
+        :param observations: The observations to be wrapped
+        :param band_data_cache: The cache to take band data from
+        :param grid_key: Identifies the grid the observations are reprojected to
+        """
+        self._observations = observations
+        self._band_data_cache = band_data_cache
+        self._grid_key = grid_key
+        self._no_data_values = {}
+
+    def __getattr__(self, name: str):
+        return getattr(self._observations, name)
+
+    def set_no_data_value(self, date: datetime, band_name: str, no_data_value: float):
+        self._no_data_values[(date, band_name)] = no_data_value
+        self._observations.set_no_data_value(date, band_name, no_data_value)
+
+    def get_band_data_by_name(self, date: datetime, band_name: str,
+                              retrieve_uncertainty: bool = True) -> NamedTuple:
+        key = _get_key(date, band_name, self._grid_key, self._no_data_values.get((date, band_name)),
+                       retrieve_uncertainty)
+        return self._band_data_cache.get(
+            key, lambda: _read_band_data(self._observations, date, band_name, retrieve_uncertainty))
+
+
+class BandDataPrefetcher(object):
+    """
+    Reads band data into a band data cache in a background thread before it is requested. The band data is read in
+    steps, e.g., one step per date. The prefetcher stays at most a given number of steps ahead of the steps that are
+    in use.
+    """
+
+    def __init__(self, observations: ObservationsWrapper, band_data_cache: BandDataCache, grid_key: Hashable,
+                 steps: List[List[tuple]], depth: int = 1, num_steps_in_use: int = 1):
+        """
+        :param observations: The observations to read from
+        :param band_data_cache: The cache to read into
+        :param grid_key: Identifies the grid the observations are reprojected to
+        :param steps: The band data to be read, as lists of tuples of date, band name and no data value
+        :param depth: The number of steps to read ahead of the steps in use
+        :param num_steps_in_use: The number of steps that are in use at the same time
+        """
+        self._observations = observations
+        self._band_data_cache = band_data_cache
+        self._grid_key = grid_key
+        self._steps = steps
+        self._permits = Semaphore(depth + num_steps_in_use)
+        self._closed = False
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        for step in self._steps:
+            self._permits.acquire()
+            if self._closed:
+                return
+            for date, band_name, no_data_value in step:
+                key = _get_key(date, band_name, self._grid_key, no_data_value, False)
+                try:
+                    self._band_data_cache.get(key, lambda: self._read(date, band_name, no_data_value))
+                except Exception as e:
+                    # band data will be read again when it is requested, that is where the error will surface
+                    logging.debug(f'Could not prefetch band {band_name} of {date}: {e}')
+
+    def _read(self, date: datetime, band_name: str, no_data_value: Optional[float]) -> NamedTuple:
+        if no_data_value is not None:
+            self._observations.set_no_data_value(date, band_name, no_data_value)
+        return _read_band_data(self._observations, date, band_name, False)
+
+    def advance(self):
+        """
+        Signals that the earliest step in use is no longer needed.
+        """
+        self._permits.release()
+
+    def close(self):
+        self._closed = True
+        self._permits.release()
+        self._thread.join()
+
+
+def _read_band_data(observations: ObservationsWrapper, date: datetime, band_name: str,
+                    retrieve_uncertainty: bool) -> NamedTuple:
+    # band data is reprojected while it is read, so the time of the read stage includes the reprojection
+    with stage('read') as counts:
+        observation_data = observations.get_band_data_by_name(date, band_name, retrieve_uncertainty)
+        counts['bytes_read'] = _get_size(observation_data)
+        if isinstance(observation_data[0], np.ndarray):
+            counts['pixels'] = observation_data[0].size
+    return observation_data
+
+
+def _get_key(date: datetime, band_name: str, grid_key: Hashable, no_data_value: Optional[float],
+             retrieve_uncertainty: bool) -> tuple:
+    return date, band_name, grid_key, no_data_value, retrieve_uncertainty
+
+
+def _get_size(observation_data: NamedTuple) -> int:
+    size = 0
+    for element in observation_data:
+        if isinstance(element, np.ndarray):
+            size += element.nbytes
+    return size
+
+
+def _set_read_only(observation_data: NamedTuple):
+    for element in observation_data:
+        if isinstance(element, np.ndarray):
+            element.flags.writeable = False
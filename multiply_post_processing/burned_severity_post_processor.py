@@ -22,10 +22,24 @@ _LANDSAT_8_DICT = {'scale_factor': 0.0001, 'version': '_1'}
 _DATA_DICTS = {DataTypeConstants.AWS_S2_L2: _SENTINEL_2_DICT, DataTypeConstants.S2_L2: _SENTINEL_2_DICT}
 _INDICATOR_NAMES = ['GeoCBI']
 _INDICATOR_DESCRIPTIONS = [get_indicator('GeoCBI')]
+# the number of pixels for which the burned severity is derived at once
+_BLOCK_SIZE = 1 << 18
+# The revision of the derivation of the burned severity. It is part of the version of the post processor, so that
+# results derived by an earlier revision are neither taken from result caches nor regarded as done by resumed runs.
+# Revision 2: the GeoCBI is computed in the units the bands are read in. multiply_core hands out Sentinel-2 bands as
+# scaled reflectances, not as digital numbers, so these are used as they are instead of being converted to digital
+# numbers and truncated. Results agree with revision 1 within 1e-6, but are not bit-identical.
+# Revision 3: on windows, the thresholds of the burned mask are taken from the whole scene.
+_REVISION = 3
+# the indices of the second observation whose scene means are the thresholds of the burned mask
+_STATISTICS_INDEX_NAMES = ['mirbi_1', 'nbr2_1', 'nir_1']
 
 logging.getLogger().setLevel(logging.INFO)
 
 
+# calc_nbr, calc_mirbi, calc_nbr2 and mask_values derive the indices on whole scenes of digital numbers. They are not
+# used by the post processor, which derives them with calc_geo_cbi, but are kept as public reference implementations
+# that calc_geo_cbi is tested against.
 def calc_nbr(swir, nir, comp_mask, no_data, scale_factor):
     logging.info('Calculating: NBR')
 
@@ -98,12 +112,287 @@ def mask_values(array, NoData):
     y = np.ma.masked_values(array, NoData)
     mean = y.mean()
 
-    print(mean)
+    logging.info('Mean: {}'.format(mean))
     return mean
 
 
+def calc_geo_cbi(smir_0: np.ndarray, swir_0: np.ndarray, nir_0: np.ndarray, smir_1: np.ndarray, swir_1: np.ndarray,
+                 nir_1: np.ndarray, no_data: int, scale_factor: float, block_size: int = _BLOCK_SIZE,
+                 statistics: Optional[dict] = None) -> np.ndarray:
+    """
+    Derives the GeoCBI from the bands of two observations. The indices are computed in the units the bands are given
+    in, with the scale factor folded into their formulas, block by block on buffers that are allocated once. A first
+    pass over the blocks accumulates the scene means of MIRBI, NBR2 and NIR of the second observation, which are the
+    thresholds of the burned mask, a second pass applies them. Only the GeoCBI is held for the whole scene.
+    :param smir_0: The short wave infrared band at 1.6 µm of the first observation, either as digital numbers or as
+    reflectances. If all bands are digital numbers, they are used as they are, otherwise they are used as reflectances.
+    Bands of reflectances are expected to have no_data * scale_factor where there is no data.
+    :param swir_0: The short wave infrared band at 2.2 µm of the first observation
+    :param nir_0: The near infrared band of the first observation
+    :param no_data: The no data value of the bands, as digital number. This is also the no data value of the GeoCBI.
+    :param scale_factor: The factor that converts digital numbers to reflectances
+    :param block_size: The number of pixels that are processed at once
+    :param statistics: If the bands cover a part of a scene, the statistics of the whole scene as derived by
+    calc_geo_cbi_statistics and summed up over its parts. The thresholds are then taken from them instead of the
+    first pass.
+    :return: The GeoCBI, with no_data where no burned area has been detected
+    """
+    bands = {'smir_0': smir_0, 'swir_0': swir_0, 'nir_0': nir_0, 'smir_1': smir_1, 'swir_1': swir_1, 'nir_1': nir_1}
+    return _create_geo_cbi_kernel(bands, no_data, scale_factor, block_size).compute(bands, statistics)
+
+
+def calc_geo_cbi_statistics(smir_0: np.ndarray, swir_0: np.ndarray, smir_1: np.ndarray, swir_1: np.ndarray,
+                            nir_1: np.ndarray, no_data: int, scale_factor: float,
+                            block_size: int = _BLOCK_SIZE) -> dict:
+    """
+    Derives the masked sums and counts of MIRBI, NBR2 and NIR of the second observation, from which the thresholds
+    of the burned mask are derived. The statistics of the parts of a scene add up to those of the whole scene. For
+    the parameters, see calc_geo_cbi.
+    :return: A dictionary with the sum and count of each index, e.g., 'sum_mirbi_1' and 'count_mirbi_1'
+    """
+    bands = {'smir_0': smir_0, 'swir_0': swir_0, 'smir_1': smir_1, 'swir_1': swir_1, 'nir_1': nir_1}
+    return _create_geo_cbi_kernel(bands, no_data, scale_factor, block_size).derive_statistics(bands)
+
+
+def _create_geo_cbi_kernel(bands: dict, no_data: int, scale_factor: float, block_size: int):
+    digital_numbers = all([_is_digital_number(np.asarray(band)) for band in bands.values()])
+    return _GeoCBIKernel(no_data, scale_factor, max(1, min(block_size, np.size(bands['smir_0']))), digital_numbers)
+
+
+class _GeoCBIKernel(object):
+    # Works on the bands in the units they are given in, either digital numbers or reflectances. NBR and NBR2 do not
+    # depend on the scale of the bands, MIRBI is 10 * swir - 9.8 * smir + 2 on reflectances. The thresholds on NIR are
+    # given in digital numbers. Sums and differences of digital numbers are taken as int32, so that they do not
+    # overflow for int16 bands.
+
+    def __init__(self, no_data: int, scale_factor: float, block_size: int, digital_numbers: bool = True):
+        # the value of one digital number in the units of the bands
+        unit = 1 if digital_numbers else scale_factor
+        self._no_data = no_data
+        self._band_no_data = no_data * unit
+        self._scale_factor = scale_factor
+        self._digital_numbers = digital_numbers
+        self._swir_factor = 10 * scale_factor / unit
+        self._smir_factor = 9.8 * scale_factor / unit
+        self._nir_threshold = -0.01 * unit
+        self._block_size = block_size
+        self._converted_bands = {}
+        data_type = np.int32 if digital_numbers else np.float64
+        self._sum = np.empty(block_size, dtype=data_type)
+        self._difference = np.empty(block_size, dtype=data_type)
+        self._first = np.empty(block_size, dtype=np.float64)
+        self._second = np.empty(block_size, dtype=np.float64)
+        self._mirbi_1 = np.empty(block_size, dtype=np.float32)
+        self._nbr2_1 = np.empty(block_size, dtype=np.float32)
+        self._diff_mirbi = np.empty(block_size, dtype=np.float32)
+        self._diff_nbr2 = np.empty(block_size, dtype=np.float32)
+        self._nbr_0 = np.empty(block_size, dtype=np.float32)
+        self._nbr_1 = np.empty(block_size, dtype=np.float32)
+        self._s_mask = np.empty(block_size, dtype=bool)
+        self._nir_mask = np.empty(block_size, dtype=bool)
+        self._burned_mask = np.empty(block_size, dtype=bool)
+        self._condition = np.empty(block_size, dtype=bool)
+
+    def compute(self, bands: dict, statistics: Optional[dict] = None) -> np.ndarray:
+        shape = np.shape(bands['smir_0'])
+        bands = self._prepare(bands)
+        num_pixels = bands['smir_0'].size
+        geo_cbi = np.empty(num_pixels, dtype=np.float64)
+        # the thresholds of the burned mask are scene means
+        if statistics is None:
+            statistics = self._derive_statistics(bands)
+        mean_mirbi_1, mean_nbr2_1, mean_nir_1 = [
+            _MaskedMean(no_data, statistics['sum_' + index_name], statistics['count_' + index_name]).get_mean()
+            for index_name, no_data in zip(_STATISTICS_INDEX_NAMES, self._get_index_no_data_values())]
+        logging.info('Calculating GeoCBI')
+        for block in self._get_blocks(num_pixels):
+            self._compute_geo_cbi(bands, block, mean_mirbi_1, mean_nbr2_1, mean_nir_1, geo_cbi[block])
+        return geo_cbi.reshape(shape)
+
+    def derive_statistics(self, bands: dict) -> dict:
+        return self._derive_statistics(self._prepare(bands))
+
+    def _prepare(self, bands: dict) -> dict:
+        bands = {band_name: np.ravel(bands[band_name]) for band_name in bands}
+        # no data is compared in the data type of a band, as the band holds it in that precision
+        self._band_no_data_values = {band_name: np.asarray(self._band_no_data, dtype=self._get_data_type(band))
+                                     for band_name, band in bands.items()}
+        return bands
+
+    def _get_blocks(self, num_pixels: int) -> List[slice]:
+        return [slice(start, min(start + self._block_size, num_pixels))
+                for start in range(0, num_pixels, self._block_size)]
+
+    def _get_index_no_data_values(self) -> list:
+        return [self._no_data, self._no_data, self._band_no_data_values['nir_1']]
+
+    def _derive_statistics(self, bands: dict) -> dict:
+        logging.info('Calculating scene means')
+        means = [_MaskedMean(no_data) for no_data in self._get_index_no_data_values()]
+        for block in self._get_blocks(bands['smir_0'].size):
+            band_data = self._read(bands, block, ['smir_0', 'swir_0', 'smir_1', 'swir_1', 'nir_1'])
+            condition = self._condition[:block.stop - block.start]
+            for mean, index in zip(means, self._compute_indices_of_second_observation(band_data)[:3]):
+                mean.add(index, condition)
+        statistics = {}
+        for index_name, mean in zip(_STATISTICS_INDEX_NAMES, means):
+            statistics['sum_' + index_name] = mean.sum
+            statistics['count_' + index_name] = mean.count
+        return statistics
+
+    def _compute_indices_of_second_observation(self, band_data: dict) -> tuple:
+        # returns MIRBI, NBR2 and NIR of the second observation and the mask of the SMIR and SWIR bands, which is
+        # narrowed to where NBR2 is defined
+        smir_0, swir_0, smir_1, swir_1, nir_1 = [band_data[band_name]
+                                                 for band_name in ['smir_0', 'swir_0', 'smir_1', 'swir_1', 'nir_1']]
+        mirbi_1 = self._mirbi_1[:smir_0.size]
+        nbr2_1 = self._nbr2_1[:smir_0.size]
+        s_mask = self._get_s_mask(band_data)
+        self._calc_mirbi(smir_1, swir_1, s_mask, mirbi_1)
+        self._narrow_to_non_zero_sum(smir_1, swir_1, s_mask)
+        self._calc_normalized_difference(smir_1, swir_1, s_mask, nbr2_1)
+        return mirbi_1, nbr2_1, nir_1, s_mask
+
+    def _compute_geo_cbi(self, bands: dict, block: slice, mean_mirbi_1, mean_nbr2_1, mean_nir_1,
+                         geo_cbi: np.ndarray):
+        num_pixels = block.stop - block.start
+        band_data = self._read(bands, block, ['smir_0', 'swir_0', 'nir_0', 'smir_1', 'swir_1', 'nir_1'])
+        mirbi_1, nbr2_1, nir_1, s_mask = self._compute_indices_of_second_observation(band_data)
+        smir_0, swir_0, nir_0, swir_1 = [band_data[band_name] for band_name in ['smir_0', 'swir_0', 'nir_0', 'swir_1']]
+        condition = self._condition[:num_pixels]
+        # differences are not masked, as the burned mask comprises the masks of the bands they are derived from
+        diff_mirbi = self._diff_mirbi[:num_pixels]
+        self._calc_mirbi(smir_0, swir_0, s_mask, diff_mirbi)
+        np.subtract(mirbi_1, diff_mirbi, out=diff_mirbi)
+        self._narrow_to_non_zero_sum(smir_0, swir_0, s_mask)
+        diff_nbr2 = self._diff_nbr2[:num_pixels]
+        self._calc_normalized_difference(smir_0, swir_0, s_mask, diff_nbr2)
+        np.subtract(nbr2_1, diff_nbr2, out=diff_nbr2)
+        nir_mask = self._nir_mask[:num_pixels]
+        np.not_equal(nir_1, self._band_no_data_values['nir_1'], out=nir_mask)
+        np.not_equal(nir_0, self._band_no_data_values['nir_0'], out=condition)
+        np.logical_and(nir_mask, condition, out=nir_mask)
+        diff_nir = self._difference[:num_pixels]
+        np.subtract(nir_1, nir_0, out=diff_nir, dtype=diff_nir.dtype)
+        burned_mask = self._burned_mask[:num_pixels]
+        np.logical_and(s_mask, nir_mask, out=burned_mask)
+        for comparison, array, threshold in [(np.greater, mirbi_1, mean_mirbi_1), (np.greater, diff_mirbi, 0.25),
+                                             (np.less, nbr2_1, mean_nbr2_1), (np.less, diff_nbr2, -0.05),
+                                             (np.less, nir_1, mean_nir_1), (np.less, diff_nir, self._nir_threshold)]:
+            comparison(array, threshold, out=condition)
+            np.logical_and(burned_mask, condition, out=burned_mask)
+        self._narrow_to_non_zero_sum(nir_1, swir_1, burned_mask)
+        self._narrow_to_non_zero_sum(nir_0, swir_0, burned_mask)
+        nbr_1 = self._nbr_1[:num_pixels]
+        nbr_0 = self._nbr_0[:num_pixels]
+        self._calc_normalized_difference(nir_1, swir_1, burned_mask, nbr_1)
+        self._calc_normalized_difference(nir_0, swir_0, burned_mask, nbr_0)
+        # RBR is the difference of the NBRs relative to the NBR before the fire
+        np.subtract(nbr_0, nbr_1, out=nbr_1)
+        np.add(nbr_0, 1.001, out=nbr_0)
+        np.divide(nbr_1, nbr_0, out=geo_cbi, dtype=np.float64)
+        np.multiply(geo_cbi, 2.80278, out=geo_cbi)
+        np.add(geo_cbi, 1.07541, out=geo_cbi)
+        np.minimum(geo_cbi, 3.0, out=geo_cbi)
+        np.logical_not(burned_mask, out=condition)
+        np.copyto(geo_cbi, self._no_data, where=condition)
+
+    def _read(self, bands: dict, block: slice, band_names: List[str]) -> dict:
+        band_data = {}
+        for band_name in band_names:
+            band = bands[band_name][block]
+            if self._digital_numbers or not _is_digital_number(band):
+                band_data[band_name] = band
+                continue
+            # digital numbers among reflectances are scaled
+            if band_name not in self._converted_bands:
+                self._converted_bands[band_name] = np.empty(self._block_size, dtype=np.float64)
+            band_data[band_name] = self._converted_bands[band_name][:band.size]
+            np.multiply(band, self._scale_factor, out=band_data[band_name])
+        return band_data
+
+    def _get_data_type(self, band: np.ndarray) -> np.dtype:
+        if not self._digital_numbers and _is_digital_number(band):
+            return np.dtype(np.float64)
+        return band.dtype
+
+    def _get_s_mask(self, band_data: dict) -> np.ndarray:
+        s_mask = self._s_mask[:band_data['swir_1'].size]
+        condition = self._condition[:s_mask.size]
+        np.not_equal(band_data['swir_1'], self._band_no_data_values['swir_1'], out=s_mask)
+        for band_name in ['swir_0', 'smir_1', 'smir_0']:
+            np.not_equal(band_data[band_name], self._band_no_data_values[band_name], out=condition)
+            np.logical_and(s_mask, condition, out=s_mask)
+        return s_mask
+
+    def _narrow_to_non_zero_sum(self, first: np.ndarray, second: np.ndarray, mask: np.ndarray):
+        # pixels where the denominator of a normalized difference vanishes are excluded
+        condition = self._condition[:first.size]
+        sum_ = self._sum[:first.size]
+        np.add(first, second, out=sum_, dtype=sum_.dtype)
+        np.not_equal(sum_, 0, out=condition)
+        np.logical_and(mask, condition, out=mask)
+
+    def _calc_mirbi(self, smir: np.ndarray, swir: np.ndarray, mask: np.ndarray, out: np.ndarray):
+        # 10 * swir - 9.8 * smir + 2, see calc_mirbi
+        swir_term = self._first[:smir.size]
+        smir_term = self._second[:smir.size]
+        np.multiply(swir, self._swir_factor, out=swir_term)
+        np.multiply(smir, self._smir_factor, out=smir_term)
+        np.subtract(swir_term, smir_term, out=swir_term)
+        np.add(swir_term, 2, out=swir_term)
+        np.copyto(out, swir_term, casting='same_kind')
+        self._set_no_data(mask, out)
+
+    def _calc_normalized_difference(self, first: np.ndarray, second: np.ndarray, mask: np.ndarray, out: np.ndarray):
+        # (first - second) / (first + second) where the mask is set, see calc_nbr2 and calc_nbr
+        sum_ = self._sum[:first.size]
+        difference = self._difference[:first.size]
+        index = self._first[:first.size]
+        np.add(first, second, out=sum_, dtype=sum_.dtype)
+        np.subtract(first, second, out=difference, dtype=difference.dtype)
+        np.divide(difference, sum_, out=index, where=mask)
+        np.copyto(out, index, casting='same_kind', where=mask)
+        self._set_no_data(mask, out)
+
+    def _set_no_data(self, mask: np.ndarray, out: np.ndarray):
+        condition = self._condition[:mask.size]
+        np.logical_not(mask, out=condition)
+        np.copyto(out, self._no_data, where=condition)
+
+
+class _MaskedMean(object):
+    # Accumulates the mean of the values that are not no data over the blocks of a scene
+
+    def __init__(self, no_data: int, sum_: float = 0.0, count: int = 0):
+        self._no_data = no_data
+        self.sum = sum_
+        self.count = count
+
+    def add(self, values: np.ndarray, condition: np.ndarray):
+        np.not_equal(values, self._no_data, out=condition)
+        self.sum += float(np.sum(values, where=condition, dtype=np.float64))
+        self.count += int(np.count_nonzero(condition))
+
+    def get_mean(self):
+        if self.count == 0:
+            return self._no_data
+        mean = self.sum / self.count
+        logging.info('Mean: {}'.format(mean))
+        return mean
+
+
+def _is_digital_number(band: np.ndarray) -> bool:
+    return np.issubdtype(band.dtype, np.integer)
+
+
 class BurnedSeverityPostProcessor(EODataPostProcessor):
 
+    @classmethod
+    def get_version(cls) -> str:
+        # the revision of the derivation is appended, see _REVISION
+        return '{}+r{}'.format(super().get_version(), _REVISION)
+
     @classmethod
     def get_num_time_steps(cls) -> int:
         return 2
@@ -119,97 +408,70 @@ class BurnedSeverityPostProcessor(EODataPostProcessor):
             return []
         return [data_dict['nir'], data_dict['smir'], data_dict['swir']]
 
+    @classmethod
+    def get_band_no_data_value(cls, data_type: str, band_name: str) -> Optional[float]:
+        data_dict = cls._get_data_dict(data_type)
+        if data_dict is None:
+            return None
+        # bands are read as reflectances, see _REVISION
+        return data_dict['no_data'] * data_dict['scale_factor']
+
     @staticmethod
     def _get_data_dict(data_type: str) -> Optional[dict]:
         if data_type in _DATA_DICTS:
             return _DATA_DICTS[data_type]
 
-    def process_observations(self, observations: ObservationsWrapper) -> dict:
+    def derive_statistics(self, observations: ObservationsWrapper) -> Optional[dict]:
+        if not self._can_process(observations):
+            return None
+        data_dict = self._get_data_dict(observations.get_data_type(observations.dates[0]))
+        smir_0, swir_0, nir_0, smir_1, swir_1, nir_1 = self._read_bands(observations)
+        return calc_geo_cbi_statistics(smir_0, swir_0, smir_1, swir_1, nir_1, data_dict['no_data'],
+                                       data_dict['scale_factor'])
+
+    def process_observations(self, observations: ObservationsWrapper, statistics: Optional[dict] = None) -> dict:
+        if not self._can_process(observations):
+            return [np.array([], dtype=np.float64)]
+        data_dict = self._get_data_dict(observations.get_data_type(observations.dates[0]))
+        smir_0, swir_0, nir_0, smir_1, swir_1, nir_1 = self._read_bands(observations)
+        # Band data might be shared with others, so it is not altered in place. It is read as reflectances, which are
+        # used as they are.
+        geo_cbi = calc_geo_cbi(smir_0, swir_0, nir_0, smir_1, swir_1, nir_1, data_dict['no_data'],
+                               data_dict['scale_factor'], statistics=statistics)
+        results = {'geocbi': geo_cbi}
+        return results
+
+    @staticmethod
+    def _can_process(observations: ObservationsWrapper) -> bool:
         # If we do not have exactly two observations of the same data type wrapped we'll exit.
         if len(observations.dates) != 2:
             logging.info("Not exactly two observations provided. Exiting.")
-            return [np.array([], dtype=np.float64)]
+            return False
         data_type = observations.get_data_type(observations.dates[0])
         other_data_type = observations.get_data_type(observations.dates[1])
         if data_type != other_data_type:
             logging.warning('Found types of different data. Cannot determine burned severity. Exiting.')
-            return [np.array([], dtype=np.float64)]
+            return False
+        return True
+
+    def _read_bands(self, observations: ObservationsWrapper) -> tuple:
+        # returns SMIR, SWIR and NIR of the first and then of the second observation
+        data_type = observations.get_data_type(observations.dates[0])
         data_dict = self._get_data_dict(data_type)
-        no_data = data_dict['no_data']
-        scale_factor = data_dict['scale_factor']
-        observations.set_no_data_value(observations.dates[0], data_dict['smir'], no_data * scale_factor)
-        observations.set_no_data_value(observations.dates[0], data_dict['swir'], no_data * scale_factor)
-        observations.set_no_data_value(observations.dates[1], data_dict['smir'], no_data * scale_factor)
-        observations.set_no_data_value(observations.dates[1], data_dict['swir'], no_data * scale_factor)
+        band_no_data = self.get_band_no_data_value(data_type, data_dict['smir'])
+        observations.set_no_data_value(observations.dates[0], data_dict['smir'], band_no_data)
+        observations.set_no_data_value(observations.dates[0], data_dict['swir'], band_no_data)
+        observations.set_no_data_value(observations.dates[1], data_dict['smir'], band_no_data)
+        observations.set_no_data_value(observations.dates[1], data_dict['swir'], band_no_data)
         smir_0 = observations.get_band_data_by_name(observations.dates[0], data_dict['smir'], False).observations
         swir_0 = observations.get_band_data_by_name(observations.dates[0], data_dict['swir'], False).observations
         smir_1 = observations.get_band_data_by_name(observations.dates[1], data_dict['smir'], False).observations
         swir_1 = observations.get_band_data_by_name(observations.dates[1], data_dict['swir'], False).observations
-        smir_0 /= scale_factor
-        smir_1 /= scale_factor
-        swir_0 /= scale_factor
-        swir_1 /= scale_factor
-        smir_0 = smir_0.astype(np.int)
-        smir_1 = smir_1.astype(np.int)
-        swir_0 = swir_0.astype(np.int)
-        swir_1 = swir_1.astype(np.int)
-        logging.info('Calculating SWIR/SMIR Mask')
-        swir_mask = (swir_1 != no_data) * (swir_0 != no_data)
-        smir_mask = (smir_1 != no_data) * (smir_0 != no_data)
-        s_mask = swir_mask * smir_mask
-        logging.info('Calculating MIRBI')
-        mirbi_1 = calc_mirbi(smir_1, swir_1, s_mask, no_data, scale_factor)
-        mean_mirbi_1 = mask_values(mirbi_1, no_data)
-        mirbi_0 = calc_mirbi(smir_0, swir_0, s_mask, no_data, scale_factor)
-        logging.info('Calculating difMIRBI')
-        diff_mirbi = mirbi_1 - mirbi_0
-        diff_mirbi *= s_mask + no_data * np.invert(s_mask)
-        logging.info('Calculating NBR2')
-        nbr2_1 = calc_nbr2(smir_1, swir_1, s_mask, no_data, scale_factor)
-        mean_nbr2_1 = mask_values(nbr2_1, no_data)
-        nbr2_0 = calc_nbr2(smir_0, swir_0, s_mask, no_data, scale_factor)
-        logging.info('Calculating difNBR2')
-        diff_nbr2 = nbr2_1 - nbr2_0
-        diff_nbr2 = diff_nbr2 * s_mask + no_data * np.invert(s_mask)
-        observations.set_no_data_value(observations.dates[0], data_dict['nir'], no_data * scale_factor)
-        observations.set_no_data_value(observations.dates[1], data_dict['nir'], no_data * scale_factor)
+        observations.set_no_data_value(observations.dates[0], data_dict['nir'], band_no_data)
+        observations.set_no_data_value(observations.dates[1], data_dict['nir'], band_no_data)
         nir_0 = observations.get_band_data_by_name(observations.dates[0], data_dict['nir'], False).observations
         nir_1 = observations.get_band_data_by_name(observations.dates[1], data_dict['nir'], False).observations
-        nir_0 /= scale_factor
-        nir_1 /= scale_factor
-        nir_0 = nir_0.astype(np.int)
-        nir_1 = nir_1.astype(np.int)
-        logging.info('Calculating NIR Mask')
-        nir_mask = (nir_1 != no_data) * (nir_0 != no_data)
-        logging.info('Calculating NIR')
-        mean_nir_1 = mask_values(nir_1, no_data)
-        logging.info('Calculating difNIR')
-        diff_nir = nir_1 - nir_0
-        diff_nir = diff_nir * nir_mask + no_data * np.invert(nir_mask)
-
-        logging.info('Calculating Burned Mask')
-        mean_mirbi_mask = mirbi_1 > mean_mirbi_1
-        diff_mirbi_mask = diff_mirbi > 0.25
-        mean_nbr2_1_mask = nbr2_1 < mean_nbr2_1
-        diff_nbr2_mask = diff_nbr2 < -0.05
-        mean_nir_1_mask = nir_1 < mean_nir_1
-        diff_nir_mask = diff_nir < -0.01
-        burned_mask = s_mask * nir_mask * mean_mirbi_mask * diff_mirbi_mask * mean_nbr2_1_mask * diff_nbr2_mask * \
-                      mean_nir_1_mask * diff_nir_mask
-        logging.info('Calculating NBR')
-        nbr_1 = calc_nbr(swir_1, nir_1, burned_mask, no_data, scale_factor)
-        nbr_0 = calc_nbr(swir_0, nir_0, burned_mask, no_data, scale_factor)
-        logging.info('Calculating difNBR')
-        diff_nbr = (nbr_0 - nbr_1) * burned_mask + no_data * np.invert(burned_mask)
-        logging.info('Calculating RBR')
-        rbr = diff_nbr / (nbr_0 + 1.001)
-        rbr = rbr * burned_mask + no_data * np.invert(burned_mask)
-        geo_cbi = rbr
-        geo_cbi[geo_cbi != no_data] *= 2.80278
-        geo_cbi[geo_cbi != no_data] += 1.07541
-        geo_cbi[geo_cbi > 3.0] = 3.0
-        results = {'geocbi': geo_cbi}
-        return results
+        return smir_0, swir_0, nir_0, smir_1, swir_1, nir_1
 
     @classmethod
     def get_name(cls) -> str:
@@ -1,9 +1,9 @@
 import click
 
 from multiply_post_processing.version import __version__
-from multiply_post_processing import get_available_indicators, get_post_processor_description, get_post_processor_names, \
-    run_post_processor, run_post_processing
-from typing import List
+from multiply_post_processing.registry import get_available_indicator_names, get_post_processor_description, \
+    get_post_processor_names
+from typing import List, Optional
 
 __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 
@@ -27,15 +27,59 @@ __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 @click.option("-dg", "--destination_grid", metavar='<destination_grid>',
               help="A representation of the spatial reference system in which the output shall be given, either as "
                    "EPSG-code or as WKT representation. If not given, it is tried to derive this from <roi_grid>.")
+@click.option("-ts", "--tile_size", metavar='<tile_size>', type=int,
+              help="If given, the post processor is run block-wise on windows of at most <tile_size> x <tile_size> "
+                   "pixels of the output grid. Only supported by post processors working on EO data.")
+@click.option("-w", "--workers", metavar='<workers>', type=int, default=1,
+              help="The number of processes to distribute the work among. Default is 1.")
+@click.option("-f", "--format", "output_format", metavar='<format>', default='GeoTiff',
+              type=click.Choice(['GeoTiff', 'COG', 'NetCDF']),
+              help="The format of the output files, either GeoTiff, COG (Cloud Optimized GeoTiff) or NetCDF. For "
+                   "NetCDF, the results of all dates are appended to one data cube per indicator. "
+                   "Default is GeoTiff.")
+@click.option("-c", "--compression", metavar='<compression>', type=click.Choice(['DEFLATE', 'ZSTD', 'LZW']),
+              help="The compression of the output files, one of DEFLATE, ZSTD or LZW. Compressed output is tiled. "
+                   "NetCDF supports DEFLATE and ZSTD only. If not given, output is not compressed.")
+@click.option("--overviews", is_flag=True, help="Adds overviews to the output files. Only supported for format COG.")
+@click.option("--resume", is_flag=True,
+              help="Skips results that have been written by an earlier run into <output_path> and whose input data "
+                   "has not changed since.")
+@click.option("-rc", "--result_cache_path", metavar='<result_cache_path>',
+              help="A directory in which derived indicators are cached, so that they are not derived again when the "
+                   "same input data is processed on the same grid and tiles by another run.")
+@click.option("-rcs", "--result_cache_size", metavar='<result_cache_size>', type=int, default=10240,
+              help="The size limit of the result cache in MiB. Default is 10240.")
+@click.option("-ii", "--input_index_path", metavar='<input_index_path>',
+              help="A file in which the valid files at <input_path> are indexed, so that only files that have "
+                   "been added to <input_path> since are validated. Files that are modified in place are not "
+                   "validated again; replace them or delete the index file.")
+@click.option("-m", "--metrics", "metrics_path", metavar='<metrics_path>',
+              help="A file to which the wall time, bytes read and written and throughput of each stage of the run "
+                   "are reported, along with its progress, estimated time to completion and peak memory. Files "
+                   "ending with '.prom' are written as Prometheus textfile, others as JSON lines.")
+@click.option("--profile", is_flag=True,
+              help="Profiles each stage of the run with cProfile and tracemalloc and writes profile dumps and "
+                   "reports of the largest allocations to the directory 'profile' in <output_path>.")
 def run_processor(post_processor: str, input_path: str, output_path: str = None, roi: str = None,
-                  spatial_resolution: str = None, roi_grid: str = None, destination_grid: str = None):
+                  spatial_resolution: str = None, roi_grid: str = None, destination_grid: str = None,
+                  tile_size: int = None, workers: int = 1, output_format: str = 'GeoTiff',
+                  compression: str = None, overviews: bool = False, resume: bool = False,
+                  result_cache_path: str = None, result_cache_size: int = 10240,
+                  input_index_path: str = None, metrics_path: str = None, profile: bool = False):
     """
     Runs post processor <post_processor> on data located at <input_path>.
     """
+    _check_compression(output_format, compression)
+    # post processing is only imported when it is run, so that the other commands start fast
+    from multiply_post_processing.post_processing import run_post_processor
     if output_path is None:
         output_path = input_path
     spatial_resolution = int(spatial_resolution)
-    run_post_processor(post_processor, input_path, output_path, roi, spatial_resolution, roi_grid, destination_grid)
+    run_post_processor(post_processor, input_path, output_path, roi, spatial_resolution, roi_grid=roi_grid,
+                       destination_grid=destination_grid, output_format=output_format, tile_size=tile_size,
+                       workers=workers, compression=compression, overviews=overviews, resume=resume,
+                       result_cache_path=result_cache_path, result_cache_size=result_cache_size,
+                       input_index_path=input_index_path, metrics_path=metrics_path, profile=profile)
 
 
 # noinspection PyShadowingBuiltins
@@ -57,16 +101,67 @@ def run_processor(post_processor: str, input_path: str, output_path: str = None,
 @click.option("-dg", "--destination_grid", metavar='<destination_grid>',
               help="A representation of the spatial reference system in which the output shall be given, either as "
                    "EPSG-code or as WKT representation. If not given, it is tried to derive this from <roi_grid>.")
+@click.option("-ts", "--tile_size", metavar='<tile_size>', type=int,
+              help="If given, post processors working on EO data are run block-wise on windows of at most "
+                   "<tile_size> x <tile_size> pixels of the output grid.")
+@click.option("-w", "--workers", metavar='<workers>', type=int, default=1,
+              help="The number of processes to distribute the work among. Default is 1.")
+@click.option("-f", "--format", "output_format", metavar='<format>', default='GeoTiff',
+              type=click.Choice(['GeoTiff', 'COG', 'NetCDF']),
+              help="The format of the output files, either GeoTiff, COG (Cloud Optimized GeoTiff) or NetCDF. For "
+                   "NetCDF, the results of all dates are appended to one data cube per indicator. "
+                   "Default is GeoTiff.")
+@click.option("-c", "--compression", metavar='<compression>', type=click.Choice(['DEFLATE', 'ZSTD', 'LZW']),
+              help="The compression of the output files, one of DEFLATE, ZSTD or LZW. Compressed output is tiled. "
+                   "NetCDF supports DEFLATE and ZSTD only. If not given, output is not compressed.")
+@click.option("--overviews", is_flag=True, help="Adds overviews to the output files. Only supported for format COG.")
+@click.option("--resume", is_flag=True,
+              help="Skips results that have been written by an earlier run into <output_path> and whose input data "
+                   "has not changed since.")
+@click.option("-rc", "--result_cache_path", metavar='<result_cache_path>',
+              help="A directory in which derived indicators are cached, so that they are not derived again when the "
+                   "same input data is processed on the same grid and tiles by another run.")
+@click.option("-rcs", "--result_cache_size", metavar='<result_cache_size>', type=int, default=10240,
+              help="The size limit of the result cache in MiB. Default is 10240.")
+@click.option("-ii", "--input_index_path", metavar='<input_index_path>',
+              help="A file in which the valid files at <input_path> are indexed, so that only files that have "
+                   "been added to <input_path> since are validated. Files that are modified in place are not "
+                   "validated again; replace them or delete the index file.")
+@click.option("-m", "--metrics", "metrics_path", metavar='<metrics_path>',
+              help="A file to which the wall time, bytes read and written and throughput of each stage of the run "
+                   "are reported, along with its progress, estimated time to completion and peak memory. Files "
+                   "ending with '.prom' are written as Prometheus textfile, others as JSON lines.")
+@click.option("--profile", is_flag=True,
+              help="Profiles each stage of the run with cProfile and tracemalloc and writes profile dumps and "
+                   "reports of the largest allocations to the directory 'profile' in <output_path>.")
 def process_indicators(indicator_names: List[str], input_path: str, output_path: str = None, roi: str = None,
-                       spatial_resolution: int = None, roi_grid: str = None, destination_grid: str = None):
+                       spatial_resolution: int = None, roi_grid: str = None, destination_grid: str = None,
+                       tile_size: int = None, workers: int = 1, output_format: str = 'GeoTiff',
+                       compression: str = None, overviews: bool = False, resume: bool = False,
+                       result_cache_path: str = None, result_cache_size: int = 10240,
+                       input_index_path: str = None, metrics_path: str = None, profile: bool = False):
     """
     Retrieves indicators <indicator_names> on data located at <input_path>.
     """
-    print(type(indicators))
+    _check_compression(output_format, compression)
+    from multiply_post_processing.post_processing import run_post_processing
     if output_path is None:
         output_path = input_path
     spatial_resolution = int(spatial_resolution)
-    run_post_processing(indicator_names, input_path, output_path, roi, spatial_resolution, roi_grid, destination_grid)
+    run_post_processing(indicator_names, input_path, output_path, roi, spatial_resolution, roi_grid=roi_grid,
+                        destination_grid=destination_grid, output_format=output_format, tile_size=tile_size,
+                        workers=workers, compression=compression, overviews=overviews, resume=resume,
+                        result_cache_path=result_cache_path, result_cache_size=result_cache_size,
+                        input_index_path=input_index_path, metrics_path=metrics_path, profile=profile)
+
+
+def _check_compression(output_format: str, compression: Optional[str]):
+    # rejects compressions the output format does not support before any input data is read
+    from multiply_post_processing.writers import check_compression
+    try:
+        check_compression(output_format, compression)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="'--compression'")
 
 
 # noinspection PyShadowingBuiltins
@@ -94,10 +189,10 @@ def describe(post_processor: str):
 @click.command(name="indicators")
 def indicators():
     """
-    Lists the provided indicators.
+    Lists the names of provided indicators.
     """
-    available_indicators = get_available_indicators()
-    print(available_indicators)
+    available_indicator_names = get_available_indicator_names()
+    print(available_indicator_names)
 
 
 
@@ -0,0 +1,110 @@
+import fnmatch
+import gdal
+import os
+import osr
+
+from multiply_core.observations import DataTypeConstants, get_valid_type
+from typing import List, Optional
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+# The bounds of a footprint, given as min longitude, min latitude, max longitude and max latitude
+Bounds = List[float]
+
+# the number of points per edge at which bounds are transformed, so that curved edges are covered, too
+_NUM_EDGE_POINTS = 21
+
+# For products that are directories, the patterns of the band rasters inside them whose footprint is the footprint of
+# the product, per data type. All bands of a Sentinel-2 tile cover the same area.
+_BAND_RASTER_PATTERNS = {
+    DataTypeConstants.AWS_S2_L2: ['*_sur.tif'],
+    DataTypeConstants.S2_L2: ['*_sur.tif']
+}
+# the patterns of band rasters in products of any other data type
+_DEFAULT_BAND_RASTER_PATTERNS = ['*.tif', '*.tiff', '*.jp2']
+
+
+def get_footprint(url: str) -> Optional[Bounds]:
+    """
+    Determines the geographic bounds of a raster file. Only the header of the file is read. For products that are
+    directories, such as Sentinel-2 L2 products, the header of a band raster inside the product is read.
+    :param url: The raster file or product directory
+    :return: The bounds of the file in geographic coordinates or None, if they cannot be determined, e.g., because
+    the file cannot be opened by GDAL or is not georeferenced.
+    """
+    if os.path.isdir(url):
+        url = _get_band_raster(url)
+        if url is None:
+            return None
+    dataset = gdal.Open(url)
+    if dataset is None:
+        return None
+    projection = dataset.GetProjection()
+    if projection is None or projection == '':
+        return None
+    geo_transform = dataset.GetGeoTransform()
+    min_x = geo_transform[0]
+    max_y = geo_transform[3]
+    max_x = min_x + dataset.RasterXSize * geo_transform[1] + dataset.RasterYSize * geo_transform[2]
+    min_y = max_y + dataset.RasterXSize * geo_transform[4] + dataset.RasterYSize * geo_transform[5]
+    source_srs = osr.SpatialReference()
+    source_srs.ImportFromWkt(projection)
+    set_traditional_axis_order(source_srs)
+    return transform_bounds([min(min_x, max_x), min(min_y, max_y), max(min_x, max_x), max(min_y, max_y)],
+                            source_srs, get_geographic_srs())
+
+
+def _get_band_raster(product_path: str) -> Optional[str]:
+    data_type = get_valid_type(product_path)
+    for pattern in _BAND_RASTER_PATTERNS.get(data_type, []) + _DEFAULT_BAND_RASTER_PATTERNS:
+        for root, directory_names, file_names in os.walk(product_path):
+            directory_names.sort()
+            for file_name in sorted(file_names):
+                if fnmatch.fnmatch(file_name, pattern):
+                    return os.path.join(root, file_name)
+    return None
+
+
+def transform_bounds(bounds: List[float], source_srs: osr.SpatialReference,
+                     target_srs: osr.SpatialReference) -> List[float]:
+    """
+    :param bounds: Bounds as min x, min y, max x and max y in the source spatial reference system
+    :return: The bounds that enclose the given bounds in the target spatial reference system
+    """
+    transformation = osr.CoordinateTransformation(source_srs, target_srs)
+    min_x, min_y, max_x, max_y = bounds
+    xs = []
+    ys = []
+    for i in range(_NUM_EDGE_POINTS):
+        fraction = i / (_NUM_EDGE_POINTS - 1)
+        x = min_x + fraction * (max_x - min_x)
+        y = min_y + fraction * (max_y - min_y)
+        for point in [(x, min_y), (x, max_y), (min_x, y), (max_x, y)]:
+            transformed_point = transformation.TransformPoint(point[0], point[1])
+            xs.append(transformed_point[0])
+            ys.append(transformed_point[1])
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def get_geographic_srs() -> osr.SpatialReference:
+    """
+    :return: The spatial reference system of footprints, with longitude as first and latitude as second axis
+    """
+    srs = osr.SpatialReference()
+    srs.SetWellKnownGeogCS('WGS84')
+    set_traditional_axis_order(srs)
+    return srs
+
+
+def set_traditional_axis_order(srs: osr.SpatialReference):
+    """
+    Makes a spatial reference system expect x or longitude first, as GDAL 2 does. GDAL 3 follows the axis order of
+    the authority, which is latitude first for geographic systems.
+    """
+    if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+
+def intersects(bounds: Bounds, other_bounds: Bounds) -> bool:
+    return bounds[0] <= other_bounds[2] and other_bounds[0] <= bounds[2] and \
+           bounds[1] <= other_bounds[3] and other_bounds[1] <= bounds[3]
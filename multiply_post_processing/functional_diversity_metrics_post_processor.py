@@ -1,8 +1,10 @@
 import logging
+import time
 from abc import ABCMeta, abstractmethod
 
 from multiply_post_processing import PostProcessorCreator, PostProcessor, VariablePostProcessor, PostProcessorType
 from multiply_post_processing.indicators import get_indicator
+from multiply_post_processing.instrumentation import get_instrumentation
 from multiply_core.variables import Variable
 import numpy as np
 from scipy.sparse.csgraph import minimum_spanning_tree
@@ -40,9 +42,10 @@ def _pre_process(variables:  dict) -> dict:
 
 def _pre_process_trait(trait: np.array) -> np.array:
     """
-    Assign No-Data-Value and standardize
+    Assign No-Data-Value and standardize. The trait is not altered, as its data might be shared with other post
+    processors.
     """
-    trait[trait == 0] = _NO_DATA_VALUE
+    trait = np.where(trait == 0, _NO_DATA_VALUE, trait)
     reshaped_trait = trait.reshape(-1, 1)
     scale_all = sk.StandardScaler()
     transformed_reshaped_trait = scale_all.fit_transform(reshaped_trait)
@@ -175,6 +178,9 @@ def _process(variable_data: dict, indicator_names: List[str]) -> dict:
     columns = first_var.shape[1]
 
     functions = _get_functions(indicator_names, rows, columns, x_offset, y_offset)
+    # the metrics are derived plot by plot, so their times are summed up and handed to the instrumentation once
+    instrumentation = get_instrumentation()
+    function_times = [0.0] * len(functions)
 
     for row in np.arange(x_offset, rows, x_size):
         for column in np.arange(y_offset, columns, y_size):
@@ -214,10 +220,20 @@ def _process(variable_data: dict, indicator_names: List[str]) -> dict:
                     estd = est.T[noutliers]
             except:  # if outlier detection failed
                 estd = est.T
-            for func in functions:
-                func.apply_function(estd, row, column)
+            if instrumentation is None:
+                for func in functions:
+                    func.apply_function(estd, row, column)
+            else:
+                for i, func in enumerate(functions):
+                    start_time = time.perf_counter()
+                    func.apply_function(estd, row, column)
+                    function_times[i] += time.perf_counter() - start_time
 
     logging.info("Finished derival of functional diversity metrics")
+    if instrumentation is not None:
+        for func, function_time in zip(functions, function_times):
+            instrumentation.add('compute.' + func.get_name(), nested=True, calls=1, wall_time=function_time,
+                                pixels=rows * columns)
 
     output = {}
     for func in functions:
@@ -0,0 +1,221 @@
+import gdal
+import math
+import osr
+
+from multiply_core.util import Reprojection
+from shapely.geometry import Polygon
+from shapely.wkt import loads
+from typing import List, Optional, Tuple, Union
+
+from multiply_post_processing.footprint import Bounds, get_geographic_srs, set_traditional_axis_order, \
+    transform_bounds
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+# A window of a grid, given as x offset, y offset, width and height in pixels
+Window = Tuple[int, int, int, int]
+
+# the number of source pixels by which the part of a source raster that is read exceeds the grid, so that resampling
+# at the edges of the grid has all the pixels it needs
+_WARP_MARGIN = 4
+
+
+class OutputGrid(object):
+    """
+    The grid on which the results of a post processing run are given. It is derived once per run and shared by
+    everything that reads or writes data on it.
+    """
+
+    def __init__(self, geo_transform: tuple, projection: str, width: int, height: int):
+        self.geo_transform = tuple(geo_transform)
+        self.projection = projection
+        self.width = width
+        self.height = height
+        self._srs = None
+
+    def __getstate__(self):
+        # spatial reference systems cannot be pickled, so they are recreated when needed
+        state = self.__dict__.copy()
+        state['_srs'] = None
+        return state
+
+    def __eq__(self, other):
+        return isinstance(other, OutputGrid) and self.geo_transform == other.geo_transform and \
+               self.projection == other.projection and self.width == other.width and self.height == other.height
+
+    def __hash__(self):
+        return hash((self.geo_transform, self.projection, self.width, self.height))
+
+    def get_srs(self) -> osr.SpatialReference:
+        """
+        :return: The spatial reference system of the grid.
+        """
+        if self._srs is None:
+            self._srs = _get_reference_system(self.projection)
+        return self._srs
+
+    def get_windows(self, tile_size: Optional[int] = None) -> List[Window]:
+        """
+        :param tile_size: The maximum edge length of a window in pixels. If None, a single window covers the grid.
+        :return: The windows covering the grid, row by row.
+        """
+        if tile_size is None:
+            return [(0, 0, self.width, self.height)]
+        if tile_size < 1:
+            raise ValueError('Tile size must be a positive number of pixels.')
+        windows = []
+        for y_offset in range(0, self.height, tile_size):
+            for x_offset in range(0, self.width, tile_size):
+                windows.append((x_offset, y_offset, min(tile_size, self.width - x_offset),
+                                min(tile_size, self.height - y_offset)))
+        return windows
+
+    def get_bounds(self, window: Optional[Window] = None) -> List[float]:
+        """
+        :param window: A window of the grid. If None, the bounds of the whole grid are returned.
+        :return: The bounds of the window as min x, min y, max x and max y in the spatial reference system of the grid.
+        """
+        if window is None:
+            window = (0, 0, self.width, self.height)
+        x_offset, y_offset, width, height = window
+        min_x = self.geo_transform[0] + x_offset * self.geo_transform[1]
+        max_y = self.geo_transform[3] + y_offset * self.geo_transform[5]
+        max_x = min_x + width * self.geo_transform[1]
+        min_y = max_y + height * self.geo_transform[5]
+        return [min_x, min_y, max_x, max_y]
+
+    def get_geographic_bounds(self, window: Optional[Window] = None) -> Bounds:
+        """
+        :param window: A window of the grid. If None, the bounds of the whole grid are returned.
+        :return: The bounds of the window in geographic coordinates, comparable to the footprints of input files.
+        """
+        # a separate spatial reference system is used, so that the axis order of the one of the grid is kept
+        srs = _get_reference_system(self.projection)
+        set_traditional_axis_order(srs)
+        return transform_bounds(self.get_bounds(window), srs, get_geographic_srs())
+
+    def get_window_grid(self, window: Window) -> 'OutputGrid':
+        """
+        :param window: A window of the grid
+        :return: The grid covered by the window
+        """
+        x_offset, y_offset, width, height = window
+        geo_transform = list(self.geo_transform)
+        geo_transform[0] += x_offset * self.geo_transform[1] + y_offset * self.geo_transform[2]
+        geo_transform[3] += x_offset * self.geo_transform[4] + y_offset * self.geo_transform[5]
+        return OutputGrid(tuple(geo_transform), self.projection, width, height)
+
+    def get_reprojection(self, window: Optional[Window] = None) -> Reprojection:
+        """
+        :param window: A window of the grid. If None, the whole grid is covered.
+        :return: A reprojection onto the window.
+        """
+        srs = self.get_srs()
+        return Reprojection(self.get_bounds(window), self.geo_transform[1], -self.geo_transform[5], srs, srs)
+
+
+def get_source_subset(dataset: gdal.Dataset, grid: OutputGrid, window: Optional[Window] = None) -> gdal.Dataset:
+    """
+    Restricts a source raster to the part that is needed to reproject it onto a grid, so that only this part is read.
+    :param dataset: The source raster
+    :param grid: The grid the source raster shall be reprojected onto
+    :param window: A window of the grid. If None, the whole grid is covered.
+    :return: A virtual raster of the part of the source raster that covers the grid, plus a margin. The source raster
+    itself, if it is not georeferenced, rotated or covered by the grid completely anyway.
+    """
+    projection = dataset.GetProjection()
+    geo_transform = dataset.GetGeoTransform()
+    if projection is None or projection == '' or geo_transform[2] != 0 or geo_transform[4] != 0:
+        return dataset
+    source_srs = osr.SpatialReference()
+    source_srs.ImportFromWkt(projection)
+    set_traditional_axis_order(source_srs)
+    grid_srs = _get_reference_system(grid.projection)
+    set_traditional_axis_order(grid_srs)
+    min_x, min_y, max_x, max_y = transform_bounds(grid.get_bounds(window), grid_srs, source_srs)
+    columns = sorted([(min_x - geo_transform[0]) / geo_transform[1], (max_x - geo_transform[0]) / geo_transform[1]])
+    rows = sorted([(max_y - geo_transform[3]) / geo_transform[5], (min_y - geo_transform[3]) / geo_transform[5]])
+    x_offset = max(0, int(math.floor(columns[0])) - _WARP_MARGIN)
+    y_offset = max(0, int(math.floor(rows[0])) - _WARP_MARGIN)
+    x_end = min(dataset.RasterXSize, int(math.ceil(columns[1])) + _WARP_MARGIN)
+    y_end = min(dataset.RasterYSize, int(math.ceil(rows[1])) + _WARP_MARGIN)
+    if x_end <= x_offset or y_end <= y_offset:
+        # the grid does not intersect the source raster, so a single pixel at its edge will do
+        x_offset = min(x_offset, dataset.RasterXSize - 1)
+        y_offset = min(y_offset, dataset.RasterYSize - 1)
+        x_end = x_offset + 1
+        y_end = y_offset + 1
+    if x_offset == 0 and y_offset == 0 and x_end == dataset.RasterXSize and y_end == dataset.RasterYSize:
+        return dataset
+    return gdal.Translate('', dataset, format='VRT', srcWin=[x_offset, y_offset, x_end - x_offset, y_end - y_offset])
+
+
+def get_output_grid(spatial_resolution: int, roi: Union[str, Polygon], roi_grid: Optional[str] = None,
+                    destination_grid: Optional[str] = None) -> OutputGrid:
+    """
+    Derives the grid on which post processing results are given.
+    :param spatial_resolution: The spatial resolution of the grid
+    :param roi: The region of interest, either as shapely Polygon or as WKT
+    :param roi_grid: The spatial reference system the roi is given in, as EPSG-code or as WKT.
+    :param destination_grid: The spatial reference system of the grid, as EPSG-code or as WKT.
+    :return: The grid
+    """
+    if type(roi) is str:
+        roi = loads(roi)
+    roi_center = roi.centroid
+    roi_srs = _get_reference_system(roi_grid)
+    destination_srs = _get_reference_system(destination_grid)
+    wgs84_srs = _get_reference_system('EPSG:4326')
+    if roi_srs is None:
+        if destination_srs is None:
+            roi_srs = wgs84_srs
+            destination_srs = _get_projected_srs(roi_center)
+        else:
+            roi_srs = destination_srs
+    elif destination_srs is None:
+        if roi_srs.IsSame(wgs84_srs):
+            destination_srs = _get_projected_srs(roi_center)
+        else:
+            raise ValueError('Cannot derive destination grid for roi grid {}. Please specify destination grid'.
+                             format(roi_grid))
+    projection = destination_srs.ExportToWkt()
+    # Warping into a virtual raster makes GDAL lay out the grid the same way as for any actual reprojection,
+    # without having to compute a single pixel.
+    grid_data_set = gdal.Warp('', _get_dummy_data_set(), format='VRT', outputBounds=roi.bounds,
+                              outputBoundsSRS=roi_srs.ExportToWkt(), xRes=spatial_resolution,
+                              yRes=spatial_resolution, dstSRS=projection)
+    return OutputGrid(grid_data_set.GetGeoTransform(), projection, grid_data_set.RasterXSize,
+                      grid_data_set.RasterYSize)
+
+
+# todo the same method is included in inference engine. Find way to harmonize
+def _get_projected_srs(roi_center):
+    utm_zone = int(1 + (roi_center.coords[0][0] + 180.0) / 6.0)
+    is_northern = int(roi_center.coords[0][1] > 0.0)
+    spatial_reference_system = osr.SpatialReference()
+    spatial_reference_system.SetWellKnownGeogCS('WGS84')
+    spatial_reference_system.SetUTM(utm_zone, is_northern)
+    return spatial_reference_system
+
+
+# todo the same method is included in inference engine. Find way to harmonize
+def _get_reference_system(wkt: str) -> Optional[osr.SpatialReference]:
+    if wkt is None:
+        return None
+    spatial_reference = osr.SpatialReference()
+    if wkt.startswith('EPSG:'):
+        epsg_code = int(wkt.split(':')[1])
+        spatial_reference.ImportFromEPSG(epsg_code)
+    else:
+        spatial_reference.ImportFromWkt(wkt)
+    return spatial_reference
+
+
+def _get_dummy_data_set():
+    driver = gdal.GetDriverByName('MEM')
+    dataset = driver.Create('', 1, 1, bands=1)
+    dataset.SetGeoTransform((-180.0, 360.0, 0.0, 90.0, 0.0, -180.0))
+    srs = osr.SpatialReference()
+    srs.SetWellKnownGeogCS("WGS84")
+    dataset.SetProjection(srs.ExportToWkt())
+    return dataset
@@ -1 +1 @@
-from .indicators import get_indicator, get_indicators
+from .indicators import add_indicator_library, get_indicator, get_indicators
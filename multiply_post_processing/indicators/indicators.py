@@ -1,18 +1,97 @@
-import pkg_resources
-import yaml
+import copy
+import hashlib
+import json
+import logging
+import os
+import uuid
 
 from multiply_core.variables import Variable
+from threading import Lock
+from typing import List, Optional
 
 __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 
+INDICATORS_LIBRARY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'indicators_library.yaml')
+# parsed libraries are cached as JSON, which is much faster to read than YAML
+CACHE_PATH_VARIABLE = 'MULTIPLY_INDICATORS_CACHE'
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.multiply', 'indicators')
 
-def get_indicators():
-    return yaml.safe_load(pkg_resources.resource_stream(__name__, 'indicators_library.yaml'))
+_LOCK = Lock()
+_LIBRARIES = []
+_INDICATORS = []
+_INDICATOR_INDEX = {}
 
 
-def get_indicator(indicator_name: str) -> Variable:
-    indicators = get_indicators()
-    for indicator in indicators:
-        if indicator['Variable']['short_name'] == indicator_name:
-            return Variable(indicator['Variable'])
-    return None
+def get_indicators() -> List[dict]:
+    """
+    :return: The entries of all indicator libraries. The library of this package comes first.
+    """
+    _ensure_default_library()
+    return copy.deepcopy(_INDICATORS)
+
+
+def get_indicator(indicator_name: str) -> Optional[Variable]:
+    """
+    :param indicator_name: The short name of an indicator
+    :return: The description of the indicator or None, if no library provides it
+    """
+    _ensure_default_library()
+    return _INDICATOR_INDEX.get(indicator_name)
+
+
+def add_indicator_library(library_file: str):
+    """
+    Registers a further indicator library, e.g., one provided by a plugin. A library is only read once, no matter how
+    often it is registered. Indicators of the same name as an indicator that is registered already are ignored.
+    :param library_file: A YAML file with the same layout as the indicators library of this package
+    """
+    _ensure_default_library()
+    _add_library(library_file)
+
+
+def _ensure_default_library():
+    if len(_LIBRARIES) == 0:
+        _add_library(INDICATORS_LIBRARY)
+
+
+def _add_library(library_file: str):
+    library_file = os.path.abspath(library_file)
+    with _LOCK:
+        if library_file in _LIBRARIES:
+            return
+        for indicator in _read_library(library_file):
+            short_name = indicator['Variable']['short_name']
+            if short_name in _INDICATOR_INDEX:
+                logging.warning(f'Indicator {short_name} of library {library_file} is provided already. Ignoring it.')
+                continue
+            _INDICATORS.append(indicator)
+            _INDICATOR_INDEX[short_name] = Variable(indicator['Variable'])
+        _LIBRARIES.append(library_file)
+
+
+def _read_library(library_file: str) -> List[dict]:
+    with open(library_file, 'rb') as library:
+        content = library.read()
+    cache_path = os.environ.get(CACHE_PATH_VARIABLE, DEFAULT_CACHE_PATH)
+    cache_file = os.path.join(cache_path, '{}.json'.format(hashlib.sha256(content).hexdigest()))
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'r') as cache:
+                return json.load(cache)
+        except (OSError, ValueError):
+            pass
+    # yaml is imported only when a library has to be parsed
+    import yaml
+    indicators = yaml.safe_load(content)
+    temp_file_name = '{}.{}.tmp'.format(cache_file, uuid.uuid4().hex)
+    try:
+        if not os.path.exists(cache_path):
+            os.makedirs(cache_path, exist_ok=True)
+        with open(temp_file_name, 'w') as cache:
+            json.dump(indicators, cache)
+        os.replace(temp_file_name, cache_file)
+    except OSError as e:
+        logging.getLogger().info(f'Could not cache indicator library {library_file}: {e}')
+        if os.path.exists(temp_file_name):
+            os.remove(temp_file_name)
+    return indicators
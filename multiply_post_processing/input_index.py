@@ -0,0 +1,355 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+from multiply_core.observations import get_valid_files, is_valid
+from multiply_core.util import FileRef
+from threading import Lock
+from typing import Dict, List
+
+from multiply_post_processing.footprint import Bounds, get_footprint
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+_SCHEMA = ['CREATE TABLE IF NOT EXISTS scans (data_path TEXT, data_type TEXT, state TEXT, '
+           'PRIMARY KEY (data_path, data_type))',
+           'CREATE TABLE IF NOT EXISTS file_refs (data_path TEXT, data_type TEXT, url TEXT, start_time TEXT, '
+           'end_time TEXT, mime_type TEXT)',
+           'CREATE INDEX IF NOT EXISTS file_refs_by_type_and_date ON file_refs (data_path, data_type, start_time)',
+           'CREATE TABLE IF NOT EXISTS footprints (id INTEGER PRIMARY KEY, url TEXT UNIQUE, state TEXT, '
+           'has_bounds INTEGER)',
+           'CREATE TABLE IF NOT EXISTS directories (data_path TEXT, path TEXT, mtime INTEGER, '
+           'PRIMARY KEY (data_path, path))',
+           'CREATE TABLE IF NOT EXISTS entries (data_path TEXT, directory TEXT, name TEXT, '
+           'PRIMARY KEY (data_path, directory, name))']
+# the state of a data type whose file refs are kept up to date with the recorded directory entries
+_SCANNED = 'entries'
+# directories modified more recently than this are listed again on the next refresh, as further changes within the
+# resolution of modification times could not be told apart
+_MTIME_RESOLUTION_NS = 2 * 1000 * 1000 * 1000
+# the bounds of footprints are kept in an R-tree, if SQLite provides one, so that footprints that intersect a region
+# are found without comparing all of them
+_R_TREE_SCHEMA = 'CREATE VIRTUAL TABLE IF NOT EXISTS footprint_bounds USING rtree (id, min_x, max_x, min_y, max_y)'
+_TABLE_SCHEMA = 'CREATE TABLE IF NOT EXISTS footprint_bounds (id INTEGER PRIMARY KEY, min_x REAL, max_x REAL, ' \
+                'min_y REAL, max_y REAL)'
+
+
+class InputFileIndex(object):
+    """
+    A persistent index of the input files in data directories, kept in a SQLite database. For each directory and data
+    type, it records the valid files together with their time ranges, so that a directory does not need to be
+    searched for valid files again. Also, it records the entries and modification times of the directory and its
+    subdirectories. Only subdirectories whose modification time has changed are listed again, files that have been
+    removed from them are dropped and only those that have been added are searched for valid files. Files that are
+    modified in place do not change the modification time of their directory, so they are not validated again. Such
+    files must be replaced, e.g., by writing them under another name and renaming them, or the index file must be
+    deleted.
+    Also, the index records the footprints of files, so that files can be selected by the region they cover.
+    """
+
+    def __init__(self, index_path: str):
+        """
+        :param index_path: The file the index is kept in
+        """
+        self._index_path = index_path
+        self._lock = Lock()
+        directory = os.path.dirname(index_path)
+        if directory != '' and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        try:
+            with connection:
+                for statement in _SCHEMA:
+                    connection.execute(statement)
+                try:
+                    connection.execute(_R_TREE_SCHEMA)
+                except sqlite3.OperationalError:
+                    logging.getLogger().info('SQLite provides no R-tree. Footprints are compared one by one.')
+                    connection.execute(_TABLE_SCHEMA)
+        finally:
+            connection.close()
+
+    def get_valid_files(self, data_path: str, data_types: List[str]) -> List[FileRef]:
+        """
+        :param data_path: The directory to find valid files in
+        :param data_types: The data types the files shall be of
+        :return: File refs of the valid files, in the order of the data types
+        """
+        self._refresh(data_path, data_types)
+        file_refs = []
+        urls = set()
+        connection = self._connect()
+        try:
+            for data_type in data_types:
+                rows = connection.execute('SELECT url, start_time, end_time, mime_type FROM file_refs '
+                                          'WHERE data_path = ? AND data_type = ? ORDER BY rowid',
+                                          (os.path.abspath(data_path), data_type)).fetchall()
+                for url, start_time, end_time, mime_type in rows:
+                    if url not in urls:
+                        urls.add(url)
+                        file_refs.append(FileRef(url, start_time, end_time, mime_type))
+        finally:
+            connection.close()
+        return file_refs
+
+    def get_data_files_by_date(self, data_path: str, variable_names: List[str]) -> Dict[str, Dict[str, str]]:
+        """
+        :param data_path: The directory to find files of variables in
+        :param variable_names: The names of the variables
+        :return: For each date a file of any of the variables is given for, a dictionary of variable names and the
+        files the variables are read from
+        """
+        self._refresh(data_path, variable_names)
+        data_files_by_date = {}
+        connection = self._connect()
+        try:
+            for variable_name in variable_names:
+                rows = connection.execute('SELECT start_time, url FROM file_refs WHERE data_path = ? AND '
+                                          'data_type = ? ORDER BY rowid',
+                                          (os.path.abspath(data_path), variable_name)).fetchall()
+                for start_time, url in rows:
+                    if start_time not in data_files_by_date:
+                        data_files_by_date[start_time] = {}
+                    # like in a search of the directory, the first file that is valid for a variable is used
+                    if variable_name not in data_files_by_date[start_time]:
+                        data_files_by_date[start_time][variable_name] = url
+        finally:
+            connection.close()
+        return data_files_by_date
+
+    def get_intersecting_urls(self, urls: List[str], bounds: Bounds) -> List[str]:
+        """
+        :param urls: Input files
+        :param bounds: A region in geographic coordinates, see footprint.Bounds
+        :return: The input files whose footprints intersect the region, in the given order. Files without a known
+        footprint are always included.
+        """
+        self._refresh_footprints(urls)
+        connection = self._connect()
+        try:
+            rows = connection.execute('SELECT footprints.url FROM footprint_bounds JOIN footprints ON '
+                                      'footprint_bounds.id = footprints.id WHERE footprint_bounds.max_x >= ? AND '
+                                      'footprint_bounds.min_x <= ? AND footprint_bounds.max_y >= ? AND '
+                                      'footprint_bounds.min_y <= ?',
+                                      (bounds[0], bounds[2], bounds[1], bounds[3])).fetchall()
+            selected_urls = set([row[0] for row in rows])
+            rows = connection.execute('SELECT url FROM footprints WHERE has_bounds = 0').fetchall()
+            selected_urls.update([row[0] for row in rows])
+        finally:
+            connection.close()
+        return [url for url in urls if url in selected_urls]
+
+    def _refresh_footprints(self, urls: List[str]):
+        with self._lock:
+            connection = self._connect()
+            try:
+                for url in urls:
+                    state = _get_file_state(url)
+                    row = connection.execute('SELECT id, state FROM footprints WHERE url = ?', (url,)).fetchone()
+                    if row is not None and row[1] == state:
+                        continue
+                    footprint = get_footprint(url)
+                    with connection:
+                        if row is not None:
+                            connection.execute('DELETE FROM footprint_bounds WHERE id = ?', (row[0],))
+                            connection.execute('DELETE FROM footprints WHERE id = ?', (row[0],))
+                        cursor = connection.execute('INSERT INTO footprints (url, state, has_bounds) VALUES (?, ?, ?)',
+                                                    (url, state, int(footprint is not None)))
+                        if footprint is not None:
+                            connection.execute('INSERT INTO footprint_bounds VALUES (?, ?, ?, ?, ?)',
+                                               (cursor.lastrowid, footprint[0], footprint[2], footprint[1],
+                                                footprint[3]))
+            finally:
+                connection.close()
+
+    def _refresh(self, data_path: str, data_types: List[str]):
+        # the directory is searched under the path it is given by, but recorded under its absolute path
+        key_path = os.path.abspath(data_path)
+        with self._lock:
+            connection = self._connect()
+            try:
+                with connection:
+                    row = connection.execute('SELECT path FROM directories WHERE data_path = ? LIMIT 1',
+                                             (key_path,)).fetchone()
+                    if row is None:
+                        # nothing is known about the directory, so all data types are searched for from scratch
+                        connection.execute('DELETE FROM scans WHERE data_path = ?', (key_path,))
+                        connection.execute('DELETE FROM file_refs WHERE data_path = ?', (key_path,))
+                        self._record_directories(connection, data_path, key_path, os.curdir)
+                    else:
+                        self._apply_changes(connection, data_path, key_path)
+                    rows = connection.execute('SELECT data_type FROM scans WHERE data_path = ? AND state = ?',
+                                              (key_path, _SCANNED)).fetchall()
+                    scanned_data_types = set([row[0] for row in rows])
+                    for data_type in data_types:
+                        if data_type in scanned_data_types:
+                            continue
+                        file_refs = get_valid_files(data_path, [data_type])
+                        connection.execute('DELETE FROM file_refs WHERE data_path = ? AND data_type = ?',
+                                           (key_path, data_type))
+                        _insert_file_refs(connection, key_path, data_type, file_refs)
+                        connection.execute('INSERT OR REPLACE INTO scans VALUES (?, ?, ?)',
+                                           (key_path, data_type, _SCANNED))
+            finally:
+                connection.close()
+
+    def _apply_changes(self, connection: sqlite3.Connection, data_path: str, key_path: str):
+        added_paths = []
+        removed_paths = []
+        rows = connection.execute('SELECT path, mtime FROM directories WHERE data_path = ?', (key_path,)).fetchall()
+        for path, mtime in rows:
+            directory = _join(data_path, path)
+            try:
+                stat = os.stat(directory)
+            except OSError:
+                # the directory has been removed, which shows in the entries of its parent
+                continue
+            if stat.st_mtime_ns == mtime:
+                continue
+            names = set(_list_directory(directory, self._index_path))
+            entry_rows = connection.execute('SELECT name FROM entries WHERE data_path = ? AND directory = ?',
+                                            (key_path, path)).fetchall()
+            recorded_names = set([entry_row[0] for entry_row in entry_rows])
+            for name in sorted(names - recorded_names):
+                added_paths.append(os.path.join(path, name))
+            for name in sorted(recorded_names - names):
+                removed_paths.append(os.path.join(path, name))
+                connection.execute('DELETE FROM entries WHERE data_path = ? AND directory = ? AND name = ?',
+                                   (key_path, path, name))
+            connection.executemany('INSERT INTO entries VALUES (?, ?, ?)',
+                                   [(key_path, path, name) for name in sorted(names - recorded_names)])
+            connection.execute('UPDATE directories SET mtime = ? WHERE data_path = ? AND path = ?',
+                               (_get_mtime_to_record(stat), key_path, path))
+        if not os.path.isdir(data_path):
+            removed_paths.append(os.curdir)
+        if len(removed_paths) > 0:
+            _remove_paths(connection, data_path, key_path, removed_paths)
+        for path in added_paths:
+            if os.path.isdir(_join(data_path, path)):
+                self._record_directories(connection, data_path, key_path, path)
+        if len(added_paths) > 0:
+            _add_file_refs(connection, data_path, key_path, added_paths)
+
+    def _record_directories(self, connection: sqlite3.Connection, data_path: str, key_path: str, path: str):
+        for root, directory_names, file_names in os.walk(_join(data_path, path)):
+            relative_path = os.path.normpath(os.path.relpath(root, data_path))
+            try:
+                stat = os.stat(root)
+            except OSError:
+                continue
+            names = [name for name in directory_names + file_names
+                     if not _is_index_file(os.path.join(root, name), self._index_path)]
+            connection.execute('INSERT OR REPLACE INTO directories VALUES (?, ?, ?)',
+                               (key_path, relative_path, _get_mtime_to_record(stat)))
+            connection.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                                   [(key_path, relative_path, name) for name in names])
+
+    def _connect(self) -> sqlite3.Connection:
+        # several processes might use the index, so they wait for each other instead of failing
+        return sqlite3.connect(self._index_path, timeout=60)
+
+
+def _get_file_state(url: str) -> str:
+    try:
+        stat = os.stat(url)
+    except OSError:
+        return ''
+    return '{}:{}'.format(stat.st_size, stat.st_mtime_ns)
+
+
+def _insert_file_refs(connection: sqlite3.Connection, key_path: str, data_type: str, file_refs: List[FileRef]):
+    connection.executemany('INSERT INTO file_refs VALUES (?, ?, ?, ?, ?, ?)',
+                           [(key_path, data_type, file_ref.url, file_ref.start_time, file_ref.end_time,
+                             file_ref.mime_type) for file_ref in file_refs])
+
+
+def _add_file_refs(connection: sqlite3.Connection, data_path: str, key_path: str, added_paths: List[str]):
+    # For each data type, the added entries of a directory are searched when any of them might be valid
+    added_paths_by_directory = {}
+    for path in added_paths:
+        added_paths_by_directory.setdefault(os.path.dirname(path) or os.curdir, []).append(path)
+    rows = connection.execute('SELECT data_type FROM scans WHERE data_path = ? AND state = ?',
+                              (key_path, _SCANNED)).fetchall()
+    for data_type in [row[0] for row in rows]:
+        for directory, paths in added_paths_by_directory.items():
+            paths = [_join(data_path, path) for path in paths]
+            # directories might contain valid files or be valid products themselves
+            if not any([os.path.isdir(path) or is_valid(path, data_type) for path in paths]):
+                continue
+            _insert_file_refs(connection, key_path, data_type,
+                              _get_valid_files_of_entries(_join(data_path, directory), paths, data_type))
+
+
+def _get_valid_files_of_entries(directory: str, paths: List[str], data_type: str) -> List[FileRef]:
+    # File refs can only be derived by searching a directory for valid files. So that the other entries of the
+    # directory are not searched again, the added entries are linked into a directory of their own, which is searched
+    # instead, and the urls found there are mapped back.
+    try:
+        with tempfile.TemporaryDirectory() as staging_directory:
+            for path in paths:
+                os.symlink(os.path.abspath(path), os.path.join(staging_directory, os.path.basename(path)))
+            file_refs = []
+            for file_ref in get_valid_files(staging_directory, [data_type]):
+                url = file_ref.url
+                if _is_at_or_below(url, [staging_directory]):
+                    url = os.path.join(directory, os.path.relpath(url, staging_directory))
+                file_refs.append(FileRef(url, file_ref.start_time, file_ref.end_time, file_ref.mime_type))
+            return file_refs
+    except OSError:
+        # symbolic links might not be permitted, in which case the whole directory is searched
+        return [file_ref for file_ref in get_valid_files(directory, [data_type])
+                if _is_at_or_below(file_ref.url, paths)]
+
+
+def _remove_paths(connection: sqlite3.Connection, data_path: str, key_path: str, removed_paths: List[str]):
+    rows = connection.execute('SELECT rowid, url FROM file_refs WHERE data_path = ?', (key_path,)).fetchall()
+    removed_urls = [_join(data_path, path) for path in removed_paths]
+    connection.executemany('DELETE FROM file_refs WHERE rowid = ?',
+                           [(row_id,) for row_id, url in rows if _is_at_or_below(url, removed_urls)])
+    for path in removed_paths:
+        if path == os.curdir:
+            connection.execute('DELETE FROM directories WHERE data_path = ?', (key_path,))
+            connection.execute('DELETE FROM entries WHERE data_path = ?', (key_path,))
+            continue
+        prefix = path + os.sep
+        connection.execute('DELETE FROM directories WHERE data_path = ? AND (path = ? OR substr(path, 1, ?) = ?)',
+                           (key_path, path, len(prefix), prefix))
+        connection.execute('DELETE FROM entries WHERE data_path = ? AND (directory = ? OR '
+                           'substr(directory, 1, ?) = ?)', (key_path, path, len(prefix), prefix))
+
+
+def _is_at_or_below(url: str, paths: List[str]) -> bool:
+    url = os.path.normpath(os.path.abspath(url))
+    for path in paths:
+        path = os.path.normpath(os.path.abspath(path))
+        if url == path or url.startswith(path.rstrip(os.sep) + os.sep):
+            return True
+    return False
+
+
+def _join(data_path: str, path: str) -> str:
+    # paths are joined so that file refs read the same as when the data path is searched as a whole
+    if path == os.curdir:
+        return data_path
+    return os.path.join(data_path, path)
+
+
+def _list_directory(directory: str, index_path: str) -> List[str]:
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    return [name for name in names if not _is_index_file(os.path.join(directory, name), index_path)]
+
+
+def _is_index_file(path: str, index_path: str) -> bool:
+    # the index itself might be kept in the directory, together with the journal SQLite writes next to it
+    return os.path.abspath(path).startswith(os.path.abspath(index_path))
+
+
+def _get_mtime_to_record(stat: os.stat_result) -> int:
+    if time.time_ns() - stat.st_mtime_ns < _MTIME_RESOLUTION_NS:
+        return -1
+    return stat.st_mtime_ns
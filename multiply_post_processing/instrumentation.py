@@ -0,0 +1,275 @@
+import json
+import logging
+import os
+import time
+
+from contextlib import contextmanager
+from threading import local, Lock
+from typing import Iterator, Optional
+
+from multiply_post_processing.profiling import StageProfiler
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+PROMETHEUS_FILE_EXTENSION = '.prom'
+_METRIC_PREFIX = 'multiply_post_processing'
+_COUNTS = ['calls', 'wall_time', 'bytes_read', 'bytes_written', 'pixels']
+# progress is written at most this often, in seconds, except for the final report
+_REPORT_INTERVAL = 1.0
+
+_INSTRUMENTATION = None
+
+
+class Instrumentation(object):
+    """
+    Collects per stage of a post processing run, e.g., discovery, read, reproject, compute or write, the wall time
+    spent in it, the bytes read and written and the pixels processed. Together with the progress of the run, its
+    estimated time to completion and the peak memory, these metrics are reported either as JSON lines or as a
+    Prometheus textfile.
+    """
+
+    def __init__(self, metrics_path: Optional[str] = None, profile: bool = False):
+        """
+        :param metrics_path: The file the metrics are reported to. If it ends with '.prom', it is a Prometheus textfile
+        that is replaced on every report, otherwise a JSON line is appended per report. If None, metrics are only
+        collected.
+        :param profile: Whether the stages shall also be profiled, see StageProfiler
+        """
+        self._metrics_path = metrics_path
+        self._profiler = StageProfiler() if profile else None
+        self._stages = {}
+        self._peak_worker_rss = 0
+        self._lock = Lock()
+        self._open_stages = local()
+        self._start_time = time.time()
+        self._last_report_time = None
+
+    def add(self, stage: str, nested: bool = False, **counts):
+        """
+        Adds to the metrics of a stage.
+        :param stage: The name of the stage
+        :param nested: If True, the wall time has been spent within the stage that is currently open in this thread
+        and is not counted for that stage, see stage
+        :param counts: Any of calls, wall_time, bytes_read, bytes_written and pixels
+        """
+        nested_times = getattr(self._open_stages, 'nested_times', [])
+        if nested and len(nested_times) > 0:
+            nested_times[-1] += counts.get('wall_time', 0)
+        with self._lock:
+            stage_metrics = self._stages.get(stage)
+            if stage_metrics is None:
+                stage_metrics = self._stages[stage] = {count: 0 for count in _COUNTS}
+            for count in counts:
+                stage_metrics[count] += counts[count]
+
+    @contextmanager
+    def stage(self, stage: str, **counts) -> Iterator[dict]:
+        """
+        Measures the wall time of a stage. Stages may be nested, e.g., band data may be read while an indicator is
+        computed. The time spent in a nested stage is not counted for the enclosing stage.
+        :param stage: The name of the stage
+        :param counts: Counts to add to the metrics of the stage, see add
+        :return: A dictionary to which further counts can be added while in the stage
+        """
+        counts = dict(counts)
+        if not hasattr(self._open_stages, 'nested_times'):
+            self._open_stages.nested_times = []
+        nested_times = self._open_stages.nested_times
+        nested_times.append(0.0)
+        if self._profiler is not None:
+            self._profiler.enter(stage)
+        start_time = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            elapsed_time = time.perf_counter() - start_time
+            if self._profiler is not None:
+                self._profiler.exit(stage)
+            wall_time = elapsed_time - nested_times.pop()
+            if len(nested_times) > 0:
+                nested_times[-1] += elapsed_time
+            self.add(stage, calls=1, wall_time=wall_time, **counts)
+
+    def get_snapshot(self) -> dict:
+        """
+        :return: The metrics collected so far, e.g., to be merged into the instrumentation of another process
+        """
+        with self._lock:
+            snapshot = {'stages': {stage: dict(self._stages[stage]) for stage in self._stages},
+                        'peak_rss': max(_get_peak_rss(), self._peak_worker_rss)}
+        if self._profiler is not None:
+            snapshot['profiles'] = self._profiler.get_data()
+        return snapshot
+
+    def merge(self, snapshot: dict):
+        """
+        Adds the metrics collected by the instrumentation of another process, see get_snapshot.
+        """
+        for stage in snapshot['stages']:
+            self.add(stage, **snapshot['stages'][stage])
+        with self._lock:
+            self._peak_worker_rss = max(self._peak_worker_rss, snapshot['peak_rss'])
+        if self._profiler is not None and 'profiles' in snapshot:
+            self._profiler.merge(snapshot['profiles'])
+
+    def is_profiling(self) -> bool:
+        return self._profiler is not None
+
+    def write_profiles(self, profile_path: str):
+        """
+        Writes the profiles of the stages to a directory, see StageProfiler.write.
+        """
+        if self._profiler is not None:
+            self._profiler.write(profile_path)
+
+    def close(self):
+        if self._profiler is not None:
+            self._profiler.close()
+
+    def report(self, done: int, total: int, force: bool = False):
+        """
+        Reports the metrics together with the progress of the run.
+        :param done: The number of units of work, e.g., results, that have been completed
+        :param total: The number of units of work of the run
+        :param force: If False, the report is skipped when the last one has been written less than a second ago
+        """
+        now = time.time()
+        if self._metrics_path is None or \
+                (not force and self._last_report_time is not None and now - self._last_report_time < _REPORT_INTERVAL):
+            return
+        self._last_report_time = now
+        record = self.get_record(done, total, now)
+        try:
+            if self._metrics_path.endswith(PROMETHEUS_FILE_EXTENSION):
+                _write_prometheus_textfile(self._metrics_path, record)
+            else:
+                with open(self._metrics_path, 'a') as metrics_file:
+                    metrics_file.write(json.dumps(record) + '\n')
+        except OSError as e:
+            logging.warning(f'Could not report metrics: {e}')
+
+    def get_record(self, done: int, total: int, now: Optional[float] = None) -> dict:
+        """
+        :return: The metrics together with the progress of the run. The time to completion is estimated from the
+        throughput so far.
+        """
+        if now is None:
+            now = time.time()
+        elapsed_time = now - self._start_time
+        eta = None
+        if 0 < done <= total:
+            eta = (total - done) * elapsed_time / done
+        stages = {}
+        with self._lock:
+            for stage in sorted(self._stages):
+                stage_metrics = dict(self._stages[stage])
+                stage_metrics['pixels_per_second'] = \
+                    stage_metrics['pixels'] / stage_metrics['wall_time'] if stage_metrics['wall_time'] > 0 else None
+                stages[stage] = stage_metrics
+            peak_worker_rss = self._peak_worker_rss
+        return {'time': now, 'elapsed_time': elapsed_time, 'done': done, 'total': total, 'eta': eta,
+                'peak_rss': _get_peak_rss(), 'peak_worker_rss': peak_worker_rss, 'stages': stages}
+
+
+def get_instrumentation() -> Optional[Instrumentation]:
+    """
+    :return: The instrumentation of the current run or None, if the run is not instrumented
+    """
+    return _INSTRUMENTATION
+
+
+def set_instrumentation(instrumentation: Optional[Instrumentation]):
+    global _INSTRUMENTATION
+    _INSTRUMENTATION = instrumentation
+
+
+@contextmanager
+def instrument(metrics_path: Optional[str], profile_path: Optional[str] = None) -> \
+        Iterator[Optional[Instrumentation]]:
+    """
+    Instruments everything that is run within the context.
+    :param metrics_path: The file metrics are reported to, see Instrumentation
+    :param profile_path: If given, the stages are profiled, too. The profiles are written to this directory when the
+    context is left.
+    If neither is given, nothing is instrumented.
+    """
+    if metrics_path is None and profile_path is None:
+        yield None
+        return
+    previous_instrumentation = get_instrumentation()
+    instrumentation = Instrumentation(metrics_path, profile_path is not None)
+    set_instrumentation(instrumentation)
+    try:
+        yield instrumentation
+    finally:
+        set_instrumentation(previous_instrumentation)
+        try:
+            if profile_path is not None:
+                instrumentation.write_profiles(profile_path)
+        finally:
+            instrumentation.close()
+
+
+@contextmanager
+def stage(name: str, **counts) -> Iterator[dict]:
+    """
+    Measures a stage with the instrumentation of the current run, see Instrumentation.stage. Does nothing if the run is
+    not instrumented.
+    """
+    instrumentation = _INSTRUMENTATION
+    if instrumentation is None:
+        yield {}
+        return
+    with instrumentation.stage(name, **counts) as stage_counts:
+        yield stage_counts
+
+
+def report(done: int, total: int, force: bool = False):
+    """
+    Reports the progress of the current run, see Instrumentation.report. Does nothing if the run is not instrumented.
+    """
+    instrumentation = _INSTRUMENTATION
+    if instrumentation is not None:
+        instrumentation.report(done, total, force)
+
+
+def _get_peak_rss() -> int:
+    if resource is None:
+        return 0
+    # Linux gives kibibytes, macOS bytes
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if os.uname().sysname == 'Darwin' else peak_rss * 1024
+
+
+def _write_prometheus_textfile(metrics_path: str, record: dict):
+    lines = []
+    for count, metric_type, help_text in [('calls', 'counter', 'Number of times a stage has been entered'),
+                                          ('wall_time', 'counter', 'Wall time spent in a stage in seconds'),
+                                          ('bytes_read', 'counter', 'Bytes read in a stage'),
+                                          ('bytes_written', 'counter', 'Bytes written in a stage'),
+                                          ('pixels', 'counter', 'Pixels processed in a stage')]:
+        name = '{}_stage_{}_total'.format(_METRIC_PREFIX, count)
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+        for stage_name in record['stages']:
+            lines.append('{}{{stage="{}"}} {}'.format(name, stage_name, record['stages'][stage_name][count]))
+    for name, help_text in [('done', 'Units of work completed'), ('total', 'Units of work of the run'),
+                            ('elapsed_time', 'Seconds since the run started'),
+                            ('eta', 'Estimated seconds to completion'), ('peak_rss', 'Peak resident set size in bytes'),
+                            ('peak_worker_rss', 'Peak resident set size of a worker process in bytes')]:
+        if record[name] is None:
+            continue
+        lines.append('# HELP {}_{} {}'.format(_METRIC_PREFIX, name, help_text))
+        lines.append('# TYPE {}_{} gauge'.format(_METRIC_PREFIX, name))
+        lines.append('{}_{} {}'.format(_METRIC_PREFIX, name, record[name]))
+    # the textfile is replaced atomically, so that it is never collected half-written
+    temp_file_name = '{}.tmp'.format(metrics_path)
+    with open(temp_file_name, 'w') as metrics_file:
+        metrics_file.write('\n'.join(lines) + '\n')
+    os.replace(temp_file_name, metrics_path)
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+
+from threading import Lock
+from typing import List, Optional
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+MANIFEST_FILE_NAME = 'post_processing_manifest.json'
+JOURNAL_FILE_NAME = 'post_processing_manifest.journal'
+
+# several manifests might record results of different post processors in the same file
+_FILE_LOCK = Lock()
+
+
+class OutputManifest(object):
+    """
+    Records in an output directory which results of a post processor have been written, together with the state of
+    the input files they have been derived from and the version and parameters of the post processor. Results that
+    are recorded and whose input files are unchanged do not need to be derived again. Results of a post processor are
+    discarded from the manifest when its version or parameters change.
+    Results are recorded by appending them to a journal, which is merged into the manifest on close. A journal left
+    behind by an interrupted run is merged when the manifest is opened again.
+    """
+
+    def __init__(self, output_path: str, post_processor_name: str, version: str, parameters: dict):
+        """
+        :param output_path: The directory the manifest is kept in
+        :param post_processor_name: The name of the post processor whose results are recorded
+        :param version: The version of the post processor
+        :param parameters: The parameters of the run that have an effect on the results. Must be serializable as JSON.
+        """
+        self._file_name = os.path.join(output_path, MANIFEST_FILE_NAME)
+        self._journal_file_name = os.path.join(output_path, JOURNAL_FILE_NAME)
+        self._post_processor_name = post_processor_name
+        self._version = version
+        # parameters are normalized by a JSON round trip, so that they can be compared to those read from the file
+        self._parameters = json.loads(json.dumps(parameters))
+        self._lock = Lock()
+        with _FILE_LOCK:
+            manifest = _compact(self._file_name, self._journal_file_name)
+        entry = manifest.get(post_processor_name)
+        if entry is None or entry.get('version') != version or entry.get('parameters') != self._parameters:
+            entry = {'version': version, 'parameters': self._parameters, 'results': {}}
+        self._results = entry['results']
+
+    def is_done(self, key: str, input_urls: List[str]) -> bool:
+        """
+        :param key: Identifies a result, e.g., by its date or pair of dates
+        :param input_urls: The input files the result is derived from
+        :return: True, if the result has been recorded, its input files are unchanged and its output files exist. For
+        results written to data cubes, the data cubes must contain their time step.
+        """
+        with self._lock:
+            result = self._results.get(key)
+        if result is None:
+            return False
+        if result['inputs'] != get_input_states(input_urls):
+            return False
+        for file_name in result['outputs']:
+            if not os.path.exists(file_name):
+                return False
+        if result.get('time_step') is not None:
+            # data cubes are only read when needed, as this requires the writers
+            from multiply_post_processing.writers import get_time_steps
+            for file_name in result['outputs']:
+                if tuple(result['time_step']) not in get_time_steps(file_name):
+                    return False
+        return True
+
+    def mark_done(self, key: str, input_urls: List[str], output_file_names: List[str],
+                  time_step: Optional[tuple] = None):
+        """
+        Records a result and appends it to the journal, so that the record persists when the run is interrupted.
+        :param key: Identifies a result, e.g., by its date or pair of dates
+        :param input_urls: The input files the result is derived from
+        :param output_file_names: The files the result has been written to
+        :param time_step: If the result has been added to data cubes, the time step it has been written to, see
+        writers.get_time_step
+        """
+        result = {'inputs': get_input_states(input_urls), 'outputs': output_file_names}
+        if time_step is not None:
+            result['time_step'] = list(time_step)
+        with self._lock:
+            self._results[key] = result
+        record = {'name': self._post_processor_name, 'version': self._version, 'parameters': self._parameters,
+                  'key': key, 'result': result}
+        with _FILE_LOCK:
+            _make_directory(self._journal_file_name)
+            with open(self._journal_file_name, 'a') as journal_file:
+                journal_file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        """
+        Merges the journal into the manifest.
+        """
+        with _FILE_LOCK:
+            _compact(self._file_name, self._journal_file_name)
+
+
+def get_input_states(urls: List[str]) -> dict:
+    """
+    :return: The size and modification time of each input file. Input files are regarded as changed when either of
+    them changes. Input files that are directories, such as Sentinel-2 products, are represented by a hash of the
+    sizes and modification times of the files they contain, as changing these does not change the directory.
+    """
+    input_states = {}
+    for url in sorted(urls):
+        if os.path.isdir(url):
+            input_states[url] = _get_directory_state(url)
+        elif os.path.exists(url):
+            stat = os.stat(url)
+            input_states[url] = [stat.st_size, stat.st_mtime]
+        else:
+            input_states[url] = None
+    return input_states
+
+
+def _get_directory_state(directory: str) -> str:
+    directory_hash = hashlib.sha1()
+    for path, directory_names, file_names in os.walk(directory):
+        # directories are walked in a fixed order, so that the hash does not depend on the order of listing
+        directory_names.sort()
+        for file_name in sorted(file_names):
+            file_path = os.path.join(path, file_name)
+            stat = os.stat(file_path)
+            directory_hash.update('{}:{}:{}\n'.format(os.path.relpath(file_path, directory), stat.st_size,
+                                                       stat.st_mtime_ns).encode('utf-8'))
+    return directory_hash.hexdigest()
+
+
+def _compact(file_name: str, journal_file_name: str) -> dict:
+    # entries of all post processors are taken from the files, so that none of them is overwritten
+    manifest = _read(file_name)
+    if not os.path.exists(journal_file_name):
+        return manifest
+    with open(journal_file_name, 'r') as journal_file:
+        for line in journal_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last record might be incomplete when a run has been interrupted while writing it
+                continue
+            entry = manifest.get(record['name'])
+            if entry is None or entry.get('version') != record['version'] or \
+                    entry.get('parameters') != record['parameters']:
+                entry = manifest[record['name']] = {'version': record['version'],
+                                                    'parameters': record['parameters'], 'results': {}}
+            entry['results'][record['key']] = record['result']
+    _write(file_name, manifest)
+    os.remove(journal_file_name)
+    return manifest
+
+
+def _read(file_name: str) -> dict:
+    if not os.path.exists(file_name):
+        return {}
+    with open(file_name, 'r') as manifest_file:
+        return json.load(manifest_file)
+
+
+def _write(file_name: str, manifest: dict):
+    # the manifest is replaced atomically, so that it is never left half-written
+    _make_directory(file_name)
+    temp_file_name = '{}.tmp'.format(file_name)
+    with open(temp_file_name, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(temp_file_name, file_name)
+
+
+def _make_directory(file_name: str):
+    directory = os.path.dirname(file_name)
+    if directory != '' and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
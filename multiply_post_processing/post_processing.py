@@ -1,27 +1,47 @@
 import argparse
 import gdal
+import gdal_array
 import logging
+import math
 import numpy as np
 import os
 import osr
-import pkg_resources
+import uuid
 
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import datetime
-from multiply_core.observations import GeoTiffWriter, ObservationsFactory, is_valid, get_valid_files
-from multiply_core.util import FileRef, Reprojection, get_time_from_string
-from multiply_core.variables import Variable
+from multiply_core.observations import ObservationsFactory, is_valid, get_valid_files
+from multiply_core.util import FileRef, get_time_from_string
 from shapely.geometry import Polygon
-from shapely.wkt import loads
-from typing import List, Optional, Union
+from typing import Callable, Iterator, List, Optional, Union
 
-from multiply_post_processing.post_processor import EODataPostProcessor, PostProcessor, PostProcessorCreator, \
-    PostProcessorType, VariablePostProcessor
+from multiply_post_processing.band_data_cache import BandDataCache, BandDataPrefetcher, CachingObservationsWrapper
+from multiply_post_processing.footprint import get_footprint, intersects
+from multiply_post_processing.grid import get_output_grid, get_source_subset, OutputGrid, Window
+from multiply_post_processing.input_index import InputFileIndex
+from multiply_post_processing.instrumentation import get_instrumentation, Instrumentation, instrument, report, \
+    set_instrumentation, stage
+from multiply_post_processing.manifest import get_input_states, OutputManifest
+from multiply_post_processing.post_processor import EODataPostProcessor, PostProcessor, PostProcessorType, \
+    VariablePostProcessor
+from multiply_post_processing.profiling import get_profile_path
+from multiply_post_processing.registry import add_post_processor_creator, get_available_indicators, \
+    get_post_processor, get_post_processor_creators, get_post_processor_description, get_post_processor_names, \
+    get_post_processors, POST_PROCESSOR_CREATOR_REGISTRY
+from multiply_post_processing.result_cache import get_cache_key, ResultCache
+from multiply_post_processing.writers import check_compression, create_data_cube_writer, create_writer, \
+    get_time_step, DATA_CUBE_OUTPUT_FORMATS, SUPPORTED_OUTPUT_FORMATS, WriteQueue
 
 __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 
-POST_PROCESSOR_CREATOR_REGISTRY = []
 SINGLE_NAME_FORMAT = '{}_{}.tif'
 DOUBLE_NAME_FORMAT = '{}_{}_{}.tif'
+DATA_CUBE_NAME_FORMATS = {'NetCDF': '{}.nc'}
+_MAX_PAIRS_PER_TASK = 4
+
+_BAND_DATA_CACHE = None
+_BAND_DATA_CACHE_RUN_ID = None
 
 component_progress_logger = logging.getLogger('ComponentProgress')
 component_progress_logger.setLevel(logging.INFO)
@@ -31,237 +51,1012 @@ component_progress_logging_handler.setLevel(logging.INFO)
 component_progress_logging_handler.setFormatter(component_progress_formatter)
 component_progress_logger.addHandler(component_progress_logging_handler)
 
-def add_post_processor_creator(post_processor_creator: PostProcessorCreator):
-    POST_PROCESSOR_CREATOR_REGISTRY.append(post_processor_creator)
-
 
-registered_post_processor_creators = pkg_resources.iter_entry_points('post_processor_creators')
-for registered_post_processor_creator in registered_post_processor_creators:
-    add_post_processor_creator(registered_post_processor_creator.load())
+def run_post_processing(indicator_names: List[str], data_path: str, output_path: str, roi: Union[str, Polygon],
+                        spatial_resolution: int, variable_names: Optional[List[str]] = None,
+                        roi_grid: Optional[str] = 'EPSG:4326', destination_grid: Optional[str] = None,
+                        output_format: Optional[str] = 'GeoTiff', tile_size: Optional[int] = None,
+                        workers: int = 1, band_cache_size: int = 1024, prefetch_depth: int = 1,
+                        write_queue_depth: int = 2, write_threads: int = 1, compression: Optional[str] = None,
+                        overviews: bool = False, resume: bool = False, result_cache_path: Optional[str] = None,
+                        result_cache_size: int = 10240, input_index_path: Optional[str] = None,
+                        metrics_path: Optional[str] = None, profile: bool = False):
+    check_compression(output_format, compression)
+    post_processors = get_post_processors(indicator_names)
+    result_cache = _get_result_cache(result_cache_path, result_cache_size)
+    input_index = _get_input_index(input_index_path)
+    prefetch_depth, write_threads = _get_threading(prefetch_depth, write_threads, profile)
+    with instrument(metrics_path, get_profile_path(output_path, profile)):
+        # post processors that work on the same input data are run together, so that the data is read only once
+        for post_processor_group in _plan_post_processors(post_processors):
+            _run_post_processors(post_processor_group, data_path, output_path, roi, spatial_resolution,
+                                 variable_names, roi_grid, destination_grid, output_format, tile_size, workers,
+                                 band_cache_size, prefetch_depth, write_queue_depth, write_threads, compression,
+                                 overviews, resume, result_cache, input_index)
 
 
-def get_post_processor_creators() -> List[PostProcessorCreator]:
-    return POST_PROCESSOR_CREATOR_REGISTRY
+def run_post_processor(name: str, data_path: str, output_path: str, roi: Union[str, Polygon],
+                       spatial_resolution: int, indicator_names: Optional[List[str]] = [],
+                       variable_names: Optional[List[str]] = None, roi_grid: Optional[str] = 'EPSG:4326',
+                       destination_grid: Optional[str] = None, output_format: Optional[str] = 'GeoTiff',
+                       tile_size: Optional[int] = None, workers: int = 1, band_cache_size: int = 1024,
+                       prefetch_depth: int = 1, write_queue_depth: int = 2, write_threads: int = 1,
+                       compression: Optional[str] = None, overviews: bool = False, resume: bool = False,
+                       result_cache_path: Optional[str] = None, result_cache_size: int = 10240,
+                       input_index_path: Optional[str] = None, metrics_path: Optional[str] = None,
+                       profile: bool = False):
+    run_actual_post_processor(get_post_processor(name, indicator_names), data_path, output_path, roi,
+                              spatial_resolution, variable_names, roi_grid, destination_grid, output_format,
+                              tile_size, workers, band_cache_size, prefetch_depth, write_queue_depth, write_threads,
+                              compression, overviews, resume, result_cache_path, result_cache_size, input_index_path,
+                              metrics_path, profile)
 
 
-def get_post_processors(requested_indicator_names: List[str]) -> List[PostProcessor]:
+def iterate_post_processing(indicator_names: List[str], data_path: str, roi: Union[str, Polygon],
+                            spatial_resolution: int, variable_names: Optional[List[str]] = None,
+                            roi_grid: Optional[str] = 'EPSG:4326', destination_grid: Optional[str] = None,
+                            tile_size: Optional[int] = None, workers: int = 1, band_cache_size: int = 1024,
+                            prefetch_depth: int = 1, result_cache_path: Optional[str] = None,
+                            result_cache_size: int = 10240, input_index_path: Optional[str] = None) -> Iterator[tuple]:
     """
-    :param requested_indicator_names: Names of the indicators that shall be derived.
-    :return: The post processors that can be used to derive the designated indicators.
+    Like run_post_processing, but instead of being written, results are handed out as they are derived.
+    See iterate_actual_post_processor.
     """
-    post_processors = []
-    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
-        indicator_names = []
-        indicator_descriptions = post_processor_creator.get_indicator_descriptions()
-        for indicator_description in indicator_descriptions:
-            if indicator_description.short_name in requested_indicator_names:
-                indicator_names.append(indicator_description.short_name)
-        if len(indicator_names) > 0:
-            post_processors.append(post_processor_creator.create_post_processor(indicator_names))
-    return post_processors
-
-
-def get_post_processor_names() -> List[str]:
+    post_processors = get_post_processors(indicator_names)
+    result_cache = _get_result_cache(result_cache_path, result_cache_size)
+    input_index = _get_input_index(input_index_path)
+    for post_processor_group in _plan_post_processors(post_processors):
+        yield from _iterate_post_processors(post_processor_group, data_path, roi, spatial_resolution, variable_names,
+                                            roi_grid, destination_grid, tile_size, workers, band_cache_size,
+                                            prefetch_depth, result_cache, input_index)
+
+
+def iterate_post_processor(name: str, data_path: str, roi: Union[str, Polygon], spatial_resolution: int,
+                           indicator_names: Optional[List[str]] = [], variable_names: Optional[List[str]] = None,
+                           roi_grid: Optional[str] = 'EPSG:4326', destination_grid: Optional[str] = None,
+                           tile_size: Optional[int] = None, workers: int = 1, band_cache_size: int = 1024,
+                           prefetch_depth: int = 1, result_cache_path: Optional[str] = None,
+                           result_cache_size: int = 10240, input_index_path: Optional[str] = None) -> Iterator[tuple]:
     """
-    :return: the names of all post processors registered in the post processing component
+    Like run_post_processor, but instead of being written, results are handed out as they are derived.
+    See iterate_actual_post_processor.
     """
-    post_processor_names = []
-    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
-        post_processor_names.append(post_processor_creator.get_name())
-    return post_processor_names
+    return iterate_actual_post_processor(get_post_processor(name, indicator_names), data_path, roi,
+                                         spatial_resolution, variable_names, roi_grid, destination_grid, tile_size,
+                                         workers, band_cache_size, prefetch_depth, result_cache_path,
+                                         result_cache_size, input_index_path)
 
 
-def get_post_processor_description(name: str) -> str:
+# noinspection PyTypeChecker
+def iterate_actual_post_processor(post_processor: PostProcessor, data_path: str, roi: Union[str, Polygon],
+                                  spatial_resolution: int, variable_names: Optional[List[str]] = None,
+                                  roi_grid: Optional[str] = 'EPSG:4326', destination_grid: Optional[str] = None,
+                                  tile_size: Optional[int] = None, workers: int = 1, band_cache_size: int = 1024,
+                                  prefetch_depth: int = 1, result_cache_path: Optional[str] = None,
+                                  result_cache_size: int = 10240,
+                                  input_index_path: Optional[str] = None) -> Iterator[tuple]:
     """
-    :param A name of a post-processor
-    :return: the description of the post processor of the requested name
+    Runs a post processor without writing its results. Results are derived lazily, i.e., only while the returned
+    iterator is consumed. For the parameters, see run_actual_post_processor.
+    :return: An iterator over tuples of indicator name, time range, array and the grid the array is given on. The
+    time range is a tuple of start and end date. For variable post processors, start and end are the same date.
+    If tile_size is given, arrays of EO data post processors cover a window of the output grid, which is described by
+    the grid handed out with them.
     """
-    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
-        if name == post_processor_creator.get_name():
-            return post_processor_creator.get_description()
-    raise ValueError('No post processor with name {} found.'.format(name))
+    return _iterate_post_processors([post_processor], data_path, roi, spatial_resolution, variable_names, roi_grid,
+                                    destination_grid, tile_size, workers, band_cache_size, prefetch_depth,
+                                    _get_result_cache(result_cache_path, result_cache_size),
+                                    _get_input_index(input_index_path))
+
+
+def _iterate_post_processors(post_processors: List[PostProcessor], data_path: str, roi: Union[str, Polygon],
+                             spatial_resolution: int, variable_names: Optional[List[str]], roi_grid: Optional[str],
+                             destination_grid: Optional[str], tile_size: Optional[int], workers: int,
+                             band_cache_size: int, prefetch_depth: int, result_cache: Optional[ResultCache],
+                             input_index: Optional[InputFileIndex]) -> Iterator[tuple]:
+    # the post processors must be of the same type, see _plan_post_processors
+    if post_processors[0].get_type() == PostProcessorType.EO_DATA_POST_PROCESSOR:
+        return _iterate_eo_data_post_processors(post_processors, data_path, roi, spatial_resolution, roi_grid,
+                                                destination_grid, tile_size, workers, band_cache_size,
+                                                prefetch_depth, result_cache, input_index)
+    elif post_processors[0].get_type() == PostProcessorType.VARIABLE_POST_PROCESSOR:
+        if variable_names is None:
+            raise ValueError('No list with variable names be provided.')
+        return _iterate_variable_post_processors(post_processors, data_path, variable_names, roi,
+                                                 spatial_resolution, roi_grid, destination_grid, workers,
+                                                 result_cache, input_index)
+    return iter([])
 
 
-def get_post_processor(name: str, indicator_names: List[str]) -> PostProcessor:
+# noinspection PyTypeChecker
+def run_actual_post_processor(post_processor: PostProcessor, data_path: str, output_path: str,
+                              roi: Union[str, Polygon], spatial_resolution: int,
+                              variable_names: Optional[List[str]] = None, roi_grid: Optional[str] = 'EPSG:4326',
+                              destination_grid: Optional[str] = None, output_format: Optional[str] = 'GeoTiff',
+                              tile_size: Optional[int] = None, workers: int = 1, band_cache_size: int = 1024,
+                              prefetch_depth: int = 1, write_queue_depth: int = 2, write_threads: int = 1,
+                              compression: Optional[str] = None, overviews: bool = False, resume: bool = False,
+                              result_cache_path: Optional[str] = None, result_cache_size: int = 10240,
+                              input_index_path: Optional[str] = None, metrics_path: Optional[str] = None,
+                              profile: bool = False):
     """
-    :param A name of a post-processor
-    :return: the post processor of the requested name
+    Runs a post processor.
+    :param output_format: The format of the output files, either 'GeoTiff', 'COG' (Cloud Optimized GeoTiff) or
+    'NetCDF'. For NetCDF, the results of all dates are appended to one data cube per indicator, named after the
+    indicator. Its chunks are aligned with tile_size.
+    :param tile_size: If given, EO data post processors are executed block-wise on windows of the destination grid
+    with at most tile_size x tile_size pixels, so that peak memory does not depend on the size of the roi. Scene-wide
+    values a post processor depends on are derived in a first pass over all windows, so results do not depend on
+    tile_size. Variable post processors always work on the whole grid.
+    :param workers: The number of processes among which the work is distributed. EO data post processors distribute
+    pairs of observations, results are written in the order of the pairs. Variable post processors distribute dates,
+    results are written as they are completed.
+    :param band_cache_size: The memory budget in MiB of the cache which holds band data that has been read and
+    reprojected, so that dates shared by consecutive pairs of observations are read only once. There is one cache
+    per process.
+    :param prefetch_depth: The number of dates for which EO data post processors read band data in the background
+    while the current pair of observations is processed. 0 disables reading ahead. The band data cache should be
+    large enough to hold the prefetched data.
+    :param write_queue_depth: The number of results per write thread that may wait to be written in the background
+    while further results are computed.
+    :param write_threads: The number of threads that write results in the background. Errors that occur while
+    writing are raised at the end of the run.
+    :param compression: The compression of the output files, one of 'DEFLATE', 'ZSTD' or 'LZW'. Compressed output is
+    tiled. If None, output is not compressed, except for data cubes, which are then compressed with DEFLATE. Data
+    cubes support 'DEFLATE' and 'ZSTD' only. A ValueError is raised before anything is processed if the compression
+    is not supported for the output format.
+    :param overviews: Whether overviews shall be added to the output files. Only supported for output format 'COG'.
+    :param resume: A manifest in the output path records the results that have been written. If True, results that
+    are recorded are not derived again, unless their input files, the parameters or the version of the post processor
+    have changed. Thus, an interrupted run can be continued and newly arrived data only costs its own results. If
+    False, which is the default, all results are derived and recorded.
+    :param result_cache_path: If given, derived indicators are cached in this directory, independent of where they
+    are written to, and taken from there whenever the same indicators are to be derived from the same input files on
+    the same grid and windows by the same version of the post processor again. The cache may be shared by several
+    runs.
+    :param result_cache_size: The size limit of the result cache in MiB. When it is exceeded, the least recently used
+    results are evicted.
+    :param input_index_path: If given, the valid files in the data path are recorded in an index in this file, so
+    that only files that have been added to the data path since are validated. Files that are modified in place are
+    not validated again; they must be replaced or the index file deleted. The index may be shared by several runs.
+    :param metrics_path: If given, the run is instrumented. For each stage, i.e., discovery of input files, reading,
+    reprojection, computation of each indicator and writing, its wall time, the bytes read and written and the pixels
+    processed per second are reported to this file, along with the progress of the run, its estimated time to
+    completion and the peak memory. If the file ends with '.prom', it is a Prometheus textfile, otherwise a JSON line
+    is appended per report.
+    :param profile: If True, each stage is profiled with cProfile and tracemalloc. For each stage, a profile dump, a
+    summary of the functions that took most time and a report of the code locations that allocated most memory are
+    written to the directory 'profile' in the output path. Profiling slows a run down considerably. To attribute
+    time and memory to stages, band data is not read ahead and results are not written in the background.
     """
-    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
-        if name == post_processor_creator.get_name():
-            return post_processor_creator.create_post_processor(indicator_names)
-    raise ValueError('No post processor with name {} found.'.format(name))
+    check_compression(output_format, compression)
+    prefetch_depth, write_threads = _get_threading(prefetch_depth, write_threads, profile)
+    with instrument(metrics_path, get_profile_path(output_path, profile)):
+        _run_post_processors([post_processor], data_path, output_path, roi, spatial_resolution, variable_names,
+                             roi_grid, destination_grid, output_format, tile_size, workers, band_cache_size,
+                             prefetch_depth, write_queue_depth, write_threads, compression, overviews, resume,
+                             _get_result_cache(result_cache_path, result_cache_size),
+                             _get_input_index(input_index_path))
 
 
-def get_available_indicators() -> List[Variable]:
+def _plan_post_processors(post_processors: List[PostProcessor]) -> List[List[PostProcessor]]:
     """
-    :return: the names of the indicators that can be derived using one of the registered post processors.
+    Groups post processors that can be run on a single pass over their input data. EO data post processors are
+    grouped by the EO data types they support. Variable post processors all work on the same variables.
+    :return: The groups of post processors, in the order in which their first member was given
     """
-    indicator_descriptions = []
-    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
-        post_processor_indicator_descriptions = post_processor_creator.get_indicator_descriptions()
-        for indicator_description in post_processor_indicator_descriptions:
-            if indicator_description not in indicator_descriptions:
-                indicator_descriptions.append(indicator_description)
-    return indicator_descriptions
-
-
-# todo almost the same method is included in inference engine. Find way to harmonize
-def _get_reprojection(spatial_resolution: int, roi: Union[str, Polygon], roi_grid: Optional[str] = None,
-                      destination_grid: Optional[str] = None) -> Reprojection:
-    if type(roi) is str:
-        roi = loads(roi)
-    roi_bounds = roi.bounds
-    roi_center = roi.centroid
-    roi_srs = _get_reference_system(roi_grid)
-    destination_srs = _get_reference_system(destination_grid)
-    wgs84_srs = _get_reference_system('EPSG:4326')
-    if roi_srs is None:
-        if destination_srs is None:
-            roi_srs = wgs84_srs
-            destination_srs = _get_projected_srs(roi_center)
-        else:
-            roi_srs = destination_srs
-    elif destination_srs is None:
-        if roi_srs.IsSame(wgs84_srs):
-            destination_srs = _get_projected_srs(roi_center)
+    groups = {}
+    for post_processor in post_processors:
+        if post_processor.get_type() == PostProcessorType.EO_DATA_POST_PROCESSOR:
+            group_key = (post_processor.get_type(),
+                         tuple(sorted(post_processor.get_names_of_supported_eo_data_types())))
         else:
-            raise ValueError('Cannot derive destination grid for roi grid {}. Please specify destination grid'.
-                             format(roi_grid))
-    return Reprojection(roi_bounds, spatial_resolution, spatial_resolution, destination_srs, roi_srs)
+            group_key = (post_processor.get_type(),)
+        if group_key not in groups:
+            groups[group_key] = []
+        groups[group_key].append(post_processor)
+    return list(groups.values())
+
+
+def _run_post_processors(post_processors: List[PostProcessor], data_path: str, output_path: str,
+                         roi: Union[str, Polygon], spatial_resolution: int, variable_names: Optional[List[str]],
+                         roi_grid: Optional[str], destination_grid: Optional[str], output_format: Optional[str],
+                         tile_size: Optional[int], workers: int, band_cache_size: int, prefetch_depth: int,
+                         write_queue_depth: int, write_threads: int, compression: Optional[str], overviews: bool,
+                         resume: bool, result_cache: Optional[ResultCache], input_index: Optional[InputFileIndex]):
+    # the post processors must be of the same type, see _plan_post_processors
+    if post_processors[0].get_type() == PostProcessorType.EO_DATA_POST_PROCESSOR:
+        _run_eo_data_post_processors(post_processors, data_path, output_path, roi, spatial_resolution, roi_grid,
+                                     destination_grid, output_format, tile_size, workers, band_cache_size,
+                                     prefetch_depth, write_queue_depth, write_threads, compression, overviews, resume,
+                                     result_cache, input_index)
+    elif post_processors[0].get_type() == PostProcessorType.VARIABLE_POST_PROCESSOR:
+        if variable_names is None:
+            raise ValueError('No list with variable names be provided.')
+        _run_variable_post_processors(post_processors, data_path, output_path, variable_names, roi,
+                                      spatial_resolution, roi_grid, destination_grid, output_format, workers,
+                                      write_queue_depth, write_threads, compression, overviews, resume, result_cache,
+                                      input_index)
+
+
+def _run_eo_data_post_processors(post_processors: List[EODataPostProcessor], data_path: str, output_path: str,
+                                 roi: Union[str, Polygon], spatial_resolution: int, roi_grid: Optional[str],
+                                 destination_grid: Optional[str], output_format: Optional[str] = 'GeoTiff',
+                                 tile_size: Optional[int] = None, workers: int = 1, band_cache_size: int = 1024,
+                                 prefetch_depth: int = 1, write_queue_depth: int = 2, write_threads: int = 1,
+                                 compression: Optional[str] = None, overviews: bool = False, resume: bool = False,
+                                 result_cache: Optional[ResultCache] = None,
+                                 input_index: Optional[InputFileIndex] = None):
+    if output_format not in SUPPORTED_OUTPUT_FORMATS:
+        logging.warning('Writing of {} not supported. Can not write post-processing results.'.format(output_format))
+        return
+    file_refs, grid, pairs = _prepare_eo_data_post_processors(post_processors, data_path, roi, spatial_resolution,
+                                                              roi_grid, destination_grid, input_index)
+    if len(pairs) == 0:
+        return
+    input_urls = {}
+    for start, end in pairs:
+        input_urls[(start, end)] = [file_ref.url for file_ref in _get_file_refs_in_time_range(file_refs, start, end)]
+    manifests = []
+    pairs_of_post_processors = []
+    for post_processor in post_processors:
+        manifest = OutputManifest(output_path, post_processor.get_name(), post_processor.get_version(),
+                                  _get_run_parameters(post_processor, roi, spatial_resolution, roi_grid,
+                                                      destination_grid, output_format, compression, overviews))
+        pairs_of_post_processor = pairs
+        if resume:
+            pairs_of_post_processor = [(start, end) for start, end in pairs
+                                       if not manifest.is_done(_get_result_key(start, end), input_urls[(start, end)])]
+            if len(pairs_of_post_processor) == 0:
+                logging.getLogger().info(f'All results of {post_processor.get_name()} are present already.')
+        manifests.append(manifest)
+        pairs_of_post_processors.append(pairs_of_post_processor)
+    windows = grid.get_windows(tile_size)
+    num_results = sum([len(pairs_of_post_processor) for pairs_of_post_processor in pairs_of_post_processors]) * \
+        len(windows)
+    if num_results == 0:
+        return
+    results = _get_eo_data_post_processor_results(post_processors, pairs_of_post_processors, file_refs, grid,
+                                                  windows, workers, band_cache_size, prefetch_depth, result_cache)
+    writers = {}
+    num_written_windows = {}
+
+    def write_window(index: int, start: datetime, end: datetime, window: Window, indicator_dict: dict):
+        file_names = _get_output_file_names(output_path, output_format, list(indicator_dict), start, end)
+        with stage('write', **_get_write_counts(indicator_dict)):
+            if output_format in DATA_CUBE_OUTPUT_FORMATS:
+                # a data cube takes the results of all pairs, so it is kept open until the end of the run
+                writer_key = (index, output_format)
+                if writer_key not in writers:
+                    writers[writer_key] = create_data_cube_writer(output_format, file_names, list(indicator_dict),
+                                                                  grid.geo_transform, grid.projection, grid.width,
+                                                                  grid.height, tile_size, compression)
+                writers[writer_key].write(list(indicator_dict.values()), start, end, window[0], window[1])
+            else:
+                writer_key = (index, start, end)
+                if writer_key not in writers:
+                    writers[writer_key] = create_writer(output_format, file_names, grid.geo_transform,
+                                                        grid.projection, grid.width, grid.height, compression,
+                                                        overviews)
+                writers[writer_key].write(list(indicator_dict.values()), window[0], window[1])
+            num_written_windows[(index, start, end)] = num_written_windows.get((index, start, end), 0) + 1
+            if num_written_windows[(index, start, end)] == len(windows):
+                time_step = None
+                if output_format in DATA_CUBE_OUTPUT_FORMATS:
+                    writers[writer_key].flush()
+                    time_step = get_time_step(start, end)
+                else:
+                    writers.pop(writer_key).close()
+                manifests[index].mark_done(_get_result_key(start, end), input_urls[(start, end)], file_names,
+                                           time_step)
+
+    write_queue = WriteQueue(write_queue_depth, write_threads)
+    try:
+        for i, (index, start, end, window, indicator_dict) in enumerate(results):
+            component_progress_logger.info(f'{int((i / num_results) * 100)}')
+            report(i, num_results)
+            # all windows of a pair go to the same files, so they must be written by the same thread. The HDF5
+            # library underneath data cubes is not thread-safe, so all data cubes are written by the same thread.
+            write_key = output_format if output_format in DATA_CUBE_OUTPUT_FORMATS else (index, start, end)
+            write_queue.submit(write_key, write_window, index, start, end, window, indicator_dict)
+    except BaseException:
+        write_queue.close(raise_error=False)
+        _close_writers(writers)
+        _close_manifests(manifests)
+        raise
+    finally:
+        results.close()
+    try:
+        write_queue.close()
+    finally:
+        _close_writers(writers)
+        _close_manifests(manifests)
+    report(num_results, num_results, force=True)
+
+
+def _prepare_eo_data_post_processors(post_processors: List[EODataPostProcessor], data_path: str,
+                                     roi: Union[str, Polygon], spatial_resolution: int, roi_grid: Optional[str],
+                                     destination_grid: Optional[str],
+                                     input_index: Optional[InputFileIndex] = None) -> tuple:
+    """
+    :param post_processors: Post processors that support the same EO data types
+    :return: A tuple of the file refs to process, the output grid and the pairs of dates of consecutive observations.
+    If there are not enough observations, the list of pairs is empty.
+    """
+    supported_eo_data_types = post_processors[0].get_names_of_supported_eo_data_types()
+    grid = get_output_grid(spatial_resolution, roi, roi_grid, destination_grid)
+    with stage('discovery'):
+        file_refs = _get_valid_files(data_path, supported_eo_data_types, input_index)
+        intersecting_urls = set(_get_intersecting_urls([file_ref.url for file_ref in file_refs], grid, input_index))
+        file_refs = [file_ref for file_ref in file_refs if file_ref.url in intersecting_urls]
+    observations_factory = ObservationsFactory()
+    observations = observations_factory.create_observations(file_refs, grid.get_reprojection())
+    if observations.get_num_observations() < 2:
+        names = ', '.join([post_processor.get_name() for post_processor in post_processors])
+        logging.getLogger().info(f'Not enough observations found. Can not conduct post processing for {names}')
+        return file_refs, grid, []
+    num_pairs = observations.get_num_observations() - 1
+    pairs = [(observations.dates[i], observations.dates[i + 1]) for i in range(num_pairs)]
+    return file_refs, grid, pairs
+
+
+def _iterate_eo_data_post_processors(post_processors: List[EODataPostProcessor], data_path: str,
+                                     roi: Union[str, Polygon], spatial_resolution: int, roi_grid: Optional[str],
+                                     destination_grid: Optional[str], tile_size: Optional[int] = None,
+                                     workers: int = 1, band_cache_size: int = 1024, prefetch_depth: int = 1,
+                                     result_cache: Optional[ResultCache] = None,
+                                     input_index: Optional[InputFileIndex] = None) -> Iterator[tuple]:
+    file_refs, grid, pairs = _prepare_eo_data_post_processors(post_processors, data_path, roi, spatial_resolution,
+                                                              roi_grid, destination_grid, input_index)
+    if len(pairs) == 0:
+        return
+    windows = grid.get_windows(tile_size)
+    results = _get_eo_data_post_processor_results(post_processors, [pairs] * len(post_processors), file_refs, grid,
+                                                  windows, workers, band_cache_size, prefetch_depth, result_cache)
+    try:
+        for index, start, end, window, indicator_dict in results:
+            window_grid = grid.get_window_grid(window)
+            for indicator_name in indicator_dict:
+                yield indicator_name, (start, end), indicator_dict[indicator_name], window_grid
+    finally:
+        results.close()
+
+
+def _get_eo_data_post_processor_results(post_processors: List[EODataPostProcessor],
+                                        pairs_of_post_processors: List[List[tuple]], file_refs: List[FileRef],
+                                        grid: OutputGrid, windows: List[Window], workers: int, band_cache_size: int,
+                                        prefetch_depth: int,
+                                        result_cache: Optional[ResultCache] = None) -> Iterator[tuple]:
+    """
+    :param pairs_of_post_processors: For each post processor, the pairs of dates it shall derive indicators for
+    :return: An iterator over tuples of the index of a post processor, start and end date of a pair, a window and the
+    indicators derived for it. Pairs are processed in chunks of consecutive pairs, all windows of a chunk are done
+    before the next chunk is started. So the output files of a pair can be completed early. If there are several
+    windows, the statistics of the scene that post processors depend on are derived in a first pass over all windows.
+    """
+    run_id = uuid.uuid4().hex
+    try:
+        yield from _get_observations_window_results(post_processors, pairs_of_post_processors, file_refs, grid,
+                                                    windows, workers, run_id, band_cache_size, prefetch_depth,
+                                                    result_cache)
+    finally:
+        # the band data of the run is of no use afterwards, so it must not be held until the next run
+        _release_band_data_cache(run_id)
+
+
+def _get_observations_window_results(post_processors: List[EODataPostProcessor],
+                                     pairs_of_post_processors: List[List[tuple]], file_refs: List[FileRef],
+                                     grid: OutputGrid, windows: List[Window], workers: int, run_id: str,
+                                     band_cache_size: int, prefetch_depth: int,
+                                     result_cache: Optional[ResultCache] = None) -> Iterator[tuple]:
+    statistics = {}
+    if len(windows) > 1:
+        statistics = _get_scene_statistics(post_processors, pairs_of_post_processors, file_refs, grid, windows,
+                                           workers, run_id, band_cache_size, result_cache)
+    tasks = _get_observations_window_tasks(post_processors, pairs_of_post_processors, file_refs, grid, windows,
+                                           workers, run_id, band_cache_size, prefetch_depth, result_cache, statistics)
+    if workers <= 1:
+        for task in tasks:
+            window = task[4]
+            for index, start, end, indicator_dict in _iterate_observations_window(*task):
+                yield index, start, end, window, indicator_dict
+        return
+    for task_index, task_results in _map_tasks(_process_observations_window, tasks, workers):
+        window = tasks[task_index][4]
+        for index, start, end, indicator_dict in task_results:
+            yield index, start, end, window, indicator_dict
+
+
+def _get_observations_window_tasks(post_processors: List[EODataPostProcessor],
+                                   pairs_of_post_processors: List[List[tuple]], file_refs: List[FileRef],
+                                   grid: OutputGrid, windows: List[Window], workers: int, run_id: str,
+                                   band_cache_size: int, prefetch_depth: int,
+                                   result_cache: Optional[ResultCache] = None,
+                                   statistics: Optional[dict] = None) -> List[tuple]:
+    """
+    :param statistics: The statistics of the scene, given per index of a post processor, start and end date of a pair.
+    Only those of the pairs of a task are handed to it, together with all windows, so that missing statistics can be
+    derived.
+    """
+    if statistics is None:
+        statistics = {}
+    pairs = _get_all_pairs(pairs_of_post_processors)
+    pairs_per_task = _get_num_pairs_per_task(len(pairs), workers)
+    tasks = []
+    # Tasks are ordered by chunk of pairs first, so that the writers of a pair need not be kept open until the last
+    # window of all pairs is done. Within a task, a date shared by consecutive pairs is read once.
+    for i in range(0, len(pairs), pairs_per_task):
+        pairs_of_task = pairs[i:i + pairs_per_task]
+        pairs_of_post_processors_of_task = [[pair for pair in pairs_of_task if pair in pairs_of_post_processor]
+                                            for pairs_of_post_processor in pairs_of_post_processors]
+        file_refs_of_task = _get_file_refs_in_time_range(file_refs, pairs_of_task[0][0], pairs_of_task[-1][1])
+        statistics_of_task = {key: statistics[key] for key in statistics if (key[1], key[2]) in pairs_of_task}
+        for window in windows:
+            tasks.append((post_processors, pairs_of_post_processors_of_task, file_refs_of_task, grid, window, run_id,
+                          band_cache_size, prefetch_depth, result_cache, statistics_of_task, windows))
+    return tasks
+
+
+def _get_scene_statistics(post_processors: List[EODataPostProcessor], pairs_of_post_processors: List[List[tuple]],
+                          file_refs: List[FileRef], grid: OutputGrid, windows: List[Window], workers: int,
+                          run_id: str, band_cache_size: int, result_cache: Optional[ResultCache] = None) -> dict:
+    """
+    Derives the statistics that post processors depend on for the whole scene, so that results derived on windows
+    are the same as those derived on the whole grid. The statistics of the windows are merged in the order of the
+    windows, so that they do not depend on the number of workers.
+    :return: The merged statistics, given per index of a post processor, start and end date of a pair. They are None
+    for post processors that do not depend on statistics. Pairs with results for all windows in the result cache are
+    left out.
+    """
+    if result_cache is not None:
+        # pairs with results for all windows in the cache need no statistics
+        pairs_of_post_processors = [
+            [(start, end) for start, end in pairs_of_post_processor
+             if not all([_get_pair_cache_key(post_processors[index], file_refs, start, end, grid, window)
+                         in result_cache for window in windows])]
+            for index, pairs_of_post_processor in enumerate(pairs_of_post_processors)]
+    # the statistics of a window are derived from the same pairs and file refs as its indicators
+    tasks = [task[:7] for task in _get_observations_window_tasks(post_processors, pairs_of_post_processors, file_refs,
+                                                                 grid, windows, workers, run_id, band_cache_size, 0)]
+    statistics_of_windows = {}
+    for task_index, task_results in _map_tasks(_derive_statistics_of_window, tasks, workers):
+        for index, start, end, statistics in task_results:
+            statistics_of_windows.setdefault((index, start, end), []).append(statistics)
+    return {key: _merge_statistics(post_processors[key[0]], statistics_of_windows[key])
+            for key in statistics_of_windows}
+
+
+def _derive_scene_statistics(post_processors: List[EODataPostProcessor], index: int, start: datetime, end: datetime,
+                             file_refs: List[FileRef], grid: OutputGrid, windows: List[Window], run_id: str,
+                             band_cache_size: int) -> Optional[dict]:
+    # derives the statistics of the scene for a single post processor and pair, window by window
+    pairs_of_post_processors = [[(start, end)] if i == index else [] for i in range(len(post_processors))]
+    statistics_of_windows = [_derive_statistics_of_window(post_processors, pairs_of_post_processors, file_refs, grid,
+                                                          window, run_id, band_cache_size)[0][3]
+                             for window in windows]
+    return _merge_statistics(post_processors[index], statistics_of_windows)
+
+
+def _merge_statistics(post_processor: EODataPostProcessor, statistics_of_windows: List[Optional[dict]]) -> \
+        Optional[dict]:
+    if None in statistics_of_windows:
+        return None
+    return post_processor.merge_statistics(statistics_of_windows)
+
+
+def _derive_statistics_of_window(post_processors: List[EODataPostProcessor],
+                                 pairs_of_post_processors: List[List[tuple]], file_refs: List[FileRef],
+                                 grid: OutputGrid, window: Window, run_id: str, band_cache_size: int) -> List[tuple]:
+    # Might be executed in another process, see _process_observations_window. Band data is read through the band data
+    # cache of the process. With a single worker, it may still be there when the indicators are derived. Worker
+    # processes end with the statistics pass, so with several workers, the inputs are read again.
+    observations = ObservationsFactory().create_observations(file_refs, grid.get_reprojection(window))
+    band_data_cache = _get_band_data_cache(run_id, band_cache_size)
+    statistics_of_window = []
+    for index, pairs_of_post_processor in enumerate(pairs_of_post_processors):
+        for start, end in pairs_of_post_processor:
+            observations_subset = CachingObservationsWrapper(observations.get_observations_subset(start, end),
+                                                             band_data_cache, (grid, window))
+            with stage('statistics.' + post_processors[index].get_name(), pixels=window[2] * window[3]):
+                statistics = post_processors[index].derive_statistics(observations_subset)
+            statistics_of_window.append((index, start, end, statistics))
+    return statistics_of_window
+
+
+def _get_all_pairs(pairs_of_post_processors: List[List[tuple]]) -> List[tuple]:
+    all_pairs = set()
+    for pairs_of_post_processor in pairs_of_post_processors:
+        all_pairs.update(pairs_of_post_processor)
+    return sorted(all_pairs)
+
+
+def _get_num_pairs_per_task(num_pairs: int, workers: int) -> int:
+    # Consecutive pairs are handed to the same process, so that they can share their common date.
+    return max(1, min(_MAX_PAIRS_PER_TASK, math.ceil(num_pairs / workers)))
+
+
+def _process_observations_window(post_processors: List[EODataPostProcessor],
+                                 pairs_of_post_processors: List[List[tuple]], file_refs: List[FileRef],
+                                 grid: OutputGrid, window: Window, run_id: str, band_cache_size: int,
+                                 prefetch_depth: int, result_cache: Optional[ResultCache] = None,
+                                 statistics: Optional[dict] = None,
+                                 windows: Optional[List[Window]] = None) -> List[tuple]:
+    # Everything passed in here must be picklable, as this function might be executed in another process.
+    return list(_iterate_observations_window(post_processors, pairs_of_post_processors, file_refs, grid, window,
+                                             run_id, band_cache_size, prefetch_depth, result_cache, statistics,
+                                             windows))
+
+
+def _iterate_observations_window(post_processors: List[EODataPostProcessor],
+                                 pairs_of_post_processors: List[List[tuple]], file_refs: List[FileRef],
+                                 grid: OutputGrid, window: Window, run_id: str, band_cache_size: int,
+                                 prefetch_depth: int, result_cache: Optional[ResultCache] = None,
+                                 statistics: Optional[dict] = None,
+                                 windows: Optional[List[Window]] = None) -> Iterator[tuple]:
+    """
+    Derives the indicators of several post processors on a window. The band data of a pair is read once and handed
+    to all post processors.
+    :param statistics: The statistics of the scene, given per index of a post processor, start and end date of a pair.
+    :param windows: All windows of the grid. If there are several, statistics that are missing are derived from all
+    of them, so that no result depends on the window alone.
+    :return: An iterator over tuples of the index of a post processor, start and end date of a pair and the
+    indicators derived for it
+    """
+    if statistics is None:
+        statistics = {}
+    pairs = _get_all_pairs(pairs_of_post_processors)
+    # for each pair, the indexes of the post processors that derive indicators for it and the keys of their results
+    jobs = {pair: [] for pair in pairs}
+    for index, pairs_of_post_processor in enumerate(pairs_of_post_processors):
+        for start, end in pairs_of_post_processor:
+            cache_key = None
+            if result_cache is not None:
+                cache_key = _get_pair_cache_key(post_processors[index], file_refs, start, end, grid, window)
+            jobs[(start, end)].append((index, cache_key))
+    # band data is only needed for pairs with results that are not cached
+    pairs_to_read = [pair for pair in pairs
+                     if any([cache_key is None or cache_key not in result_cache for index, cache_key in jobs[pair]])]
+    observations = ObservationsFactory().create_observations(file_refs, grid.get_reprojection(window))
+    band_data_cache = _get_band_data_cache(run_id, band_cache_size)
+    prefetcher = None
+    if prefetch_depth > 0 and len(pairs_to_read) > 0:
+        steps = []
+        # pairs need not be consecutive, e.g., when some of them have been derived already
+        dates = []
+        for start, end in pairs_to_read:
+            for date in [start, end]:
+                if len(dates) == 0 or dates[-1] != date:
+                    dates.append(date)
+        for date in dates:
+            data_type = observations.get_data_type(date)
+            step = []
+            for post_processor in post_processors:
+                for band_name in post_processor.get_names_of_required_bands(data_type):
+                    band = (date, band_name, post_processor.get_band_no_data_value(data_type, band_name))
+                    if band not in step:
+                        step.append(band)
+            steps.append(step)
+        num_steps_in_use = max([post_processor.get_num_time_steps() for post_processor in post_processors])
+        prefetcher = BandDataPrefetcher(observations, band_data_cache, (grid, window), steps, prefetch_depth,
+                                        num_steps_in_use)
+    try:
+        for start, end in pairs:
+            for index, cache_key in jobs[(start, end)]:
+                if cache_key is not None:
+                    indicator_dict = result_cache.get(cache_key)
+                    if indicator_dict is not None:
+                        yield index, start, end, indicator_dict
+                        continue
+                # every post processor gets observations of its own, as it might set no data values on them
+                observations_subset = CachingObservationsWrapper(observations.get_observations_subset(start, end),
+                                                                 band_data_cache, (grid, window))
+                scene_statistics = None
+                if windows is not None and len(windows) > 1:
+                    if (index, start, end) not in statistics:
+                        # The statistics pass has left out the pair, as all its results were cached, but the result
+                        # of this window has been evicted since.
+                        statistics[(index, start, end)] = _derive_scene_statistics(
+                            post_processors, index, start, end, file_refs, grid, windows, run_id, band_cache_size)
+                    scene_statistics = statistics[(index, start, end)]
+                with stage('compute.' + post_processors[index].get_name(), pixels=window[2] * window[3]):
+                    if scene_statistics is not None:
+                        indicator_dict = post_processors[index].process_observations(observations_subset,
+                                                                                     scene_statistics)
+                    else:
+                        indicator_dict = post_processors[index].process_observations(observations_subset)
+                if cache_key is not None:
+                    result_cache.put(cache_key, indicator_dict)
+                yield index, start, end, indicator_dict
+            if prefetcher is not None and (start, end) in pairs_to_read:
+                prefetcher.advance()
+    finally:
+        if prefetcher is not None:
+            prefetcher.close()
 
 
-# todo the same method is included in inference engine. Find way to harmonize
-def _get_projected_srs(roi_center):
-    utm_zone = int(1 + (roi_center.coords[0][0] + 180.0) / 6.0)
-    is_northern = int(roi_center.coords[0][1] > 0.0)
-    spatial_reference_system = osr.SpatialReference()
-    spatial_reference_system.SetWellKnownGeogCS('WGS84')
-    spatial_reference_system.SetUTM(utm_zone, is_northern)
-    return spatial_reference_system
+def _get_pair_cache_key(post_processor: EODataPostProcessor, file_refs: List[FileRef], start: datetime,
+                        end: datetime, grid: OutputGrid, window: Window) -> str:
+    input_urls = [file_ref.url for file_ref in _get_file_refs_in_time_range(file_refs, start, end)]
+    return get_cache_key(post_processor.get_name(), post_processor.get_version(), post_processor.indicators,
+                         (grid.geo_transform, grid.projection, grid.width, grid.height, window),
+                         get_input_states(input_urls), _format(start), _format(end))
 
 
-# todo the same method is included in inference engine. Find way to harmonize
-def _get_reference_system(wkt: str) -> Optional[osr.SpatialReference]:
-    if wkt is None:
+def _get_input_index(input_index_path: Optional[str]) -> Optional[InputFileIndex]:
+    if input_index_path is None:
         return None
-    spatial_reference = osr.SpatialReference()
-    if wkt.startswith('EPSG:'):
-        epsg_code = int(wkt.split(':')[1])
-        spatial_reference.ImportFromEPSG(epsg_code)
+    return InputFileIndex(input_index_path)
+
+
+def _get_valid_files(data_path: str, data_types: List[str],
+                     input_index: Optional[InputFileIndex] = None) -> List[FileRef]:
+    if input_index is None:
+        return get_valid_files(data_path, data_types)
+    return input_index.get_valid_files(data_path, data_types)
+
+
+def _get_intersecting_urls(urls: List[str], grid: OutputGrid, input_index: Optional[InputFileIndex] = None) -> \
+        List[str]:
+    # Files that do not intersect the grid are dropped before any raster data is read from them. Only their headers
+    # are read to determine their footprints, which are kept in the input index, if there is one.
+    bounds = grid.get_geographic_bounds()
+    if input_index is not None:
+        intersecting_urls = input_index.get_intersecting_urls(urls, bounds)
     else:
-        spatial_reference.ImportFromWkt(wkt)
-    return spatial_reference
+        intersecting_urls = []
+        for url in urls:
+            footprint = get_footprint(url)
+            if footprint is None or intersects(footprint, bounds):
+                intersecting_urls.append(url)
+    if len(intersecting_urls) < len(urls):
+        logging.getLogger().info(f'Skipping {len(urls) - len(intersecting_urls)} input files that do not intersect '
+                                 f'the region of interest')
+    return intersecting_urls
 
 
-def _get_dummy_data_set():
-    driver = gdal.GetDriverByName('MEM')
-    dataset = driver.Create('', 360, 90, bands=1)
-    dataset.SetGeoTransform((-180.0, 1.00, 0.0, 90.0, 0.0, -1.00))
-    srs = osr.SpatialReference()
-    srs.SetWellKnownGeogCS("WGS84")
-    dataset.SetProjection(srs.ExportToWkt())
-    dataset.GetRasterBand(1).WriteArray(np.ones((90, 360)))
-    return dataset
+def _get_result_cache(result_cache_path: Optional[str], result_cache_size: int) -> Optional[ResultCache]:
+    if result_cache_path is None:
+        return None
+    return ResultCache(result_cache_path, result_cache_size * 1024 * 1024)
 
 
-def run_post_processing(indicator_names: List[str], data_path: str, output_path: str, roi: Union[str, Polygon],
-                        spatial_resolution: int, variable_names: Optional[List[str]] = None,
-                        roi_grid: Optional[str] = 'EPSG:4326', destination_grid: Optional[str] = None,
-                        output_format: Optional[str] = 'GeoTiff'):
-    post_processors = get_post_processors(indicator_names)
-    for post_processor in post_processors:
-        run_actual_post_processor(post_processor, data_path, output_path, roi, spatial_resolution, variable_names,
-                                  roi_grid, destination_grid, output_format)
+def _get_band_data_cache(run_id: str, band_cache_size: int) -> BandDataCache:
+    # There is one cache per process. Its content is only valid during one run. Worker processes end with the run,
+    # the cache of the main process is released when the run is done.
+    global _BAND_DATA_CACHE, _BAND_DATA_CACHE_RUN_ID
+    if _BAND_DATA_CACHE is None or _BAND_DATA_CACHE_RUN_ID != run_id:
+        _BAND_DATA_CACHE = BandDataCache(band_cache_size * 1024 * 1024)
+        _BAND_DATA_CACHE_RUN_ID = run_id
+    return _BAND_DATA_CACHE
 
 
-def run_post_processor(name: str, data_path: str, output_path: str, roi: Union[str, Polygon],
-                       spatial_resolution: int, indicator_names: Optional[List[str]] = [],
-                       variable_names: Optional[List[str]] = None, roi_grid: Optional[str] = 'EPSG:4326',
-                       destination_grid: Optional[str] = None, output_format: Optional[str] = 'GeoTiff'):
-    run_actual_post_processor(get_post_processor(name, indicator_names), data_path, output_path, roi,
-                              spatial_resolution, variable_names, roi_grid, destination_grid, output_format)
+def _release_band_data_cache(run_id: str):
+    global _BAND_DATA_CACHE, _BAND_DATA_CACHE_RUN_ID
+    if _BAND_DATA_CACHE is not None and _BAND_DATA_CACHE_RUN_ID == run_id:
+        _BAND_DATA_CACHE.clear()
+        _BAND_DATA_CACHE = None
+        _BAND_DATA_CACHE_RUN_ID = None
 
 
-# noinspection PyTypeChecker
-def run_actual_post_processor(post_processor: PostProcessor, data_path: str, output_path: str,
-                              roi: Union[str, Polygon], spatial_resolution: int,
-                              variable_names: Optional[List[str]] = None, roi_grid: Optional[str] = 'EPSG:4326',
-                              destination_grid: Optional[str] = None, output_format: Optional[str] = 'GeoTiff'):
-    if post_processor.get_type() == PostProcessorType.EO_DATA_POST_PROCESSOR:
-        _run_eo_data_post_processor(post_processor, data_path, output_path, roi, spatial_resolution, roi_grid,
-                                    destination_grid, output_format)
-    elif post_processor.get_type() == PostProcessorType.VARIABLE_POST_PROCESSOR:
-        if variable_names is None:
-            raise ValueError('No list with variable names be provided.')
-        _run_variable_post_processor(post_processor, data_path, output_path, variable_names, roi, spatial_resolution,
-                                     roi_grid, destination_grid, output_format)
+def _get_file_refs_in_time_range(file_refs: List[FileRef], start: Union[datetime, str],
+                                 end: Union[datetime, str]) -> List[FileRef]:
+    # dates are compared by day, as that is the resolution the output is named with
+    start = _to_datetime(start).date()
+    end = _to_datetime(end).date()
+    file_refs_in_time_range = []
+    for file_ref in file_refs:
+        if start <= _to_datetime(file_ref.start_time).date() <= end:
+            file_refs_in_time_range.append(file_ref)
+    return file_refs_in_time_range
 
 
-def _run_eo_data_post_processor(post_processor: EODataPostProcessor, data_path: str, output_path: str,
-                                roi: Union[str, Polygon], spatial_resolution: int, roi_grid: Optional[str],
-                                destination_grid: Optional[str], output_format: Optional[str] = 'GeoTiff'):
-    supported_eo_data_types = post_processor.get_names_of_supported_eo_data_types()
-    file_refs = get_valid_files(data_path, supported_eo_data_types)
-    reprojection = _get_reprojection(spatial_resolution, roi, roi_grid, destination_grid)
-    observations_factory = ObservationsFactory()
-    observations = observations_factory.create_observations(file_refs, reprojection)
-    if observations.get_num_observations() < 2:
-        logging.getLogger().info(f'Not enough observations found. '
-                                 f'Can not conduct post processing for {post_processor.get_name()}')
+def _map_tasks(function: Callable, tasks: List[tuple], workers: int = 1, ordered: bool = True) -> Iterator[tuple]:
+    """
+    Applies a function to the arguments given by each task.
+    :param workers: If larger than one, the tasks are executed in a pool of this many processes. At most twice as
+    many tasks as there are workers are in flight at any time.
+    :param ordered: If True, results are yielded in the order of the tasks, otherwise in the order of their completion.
+    :return: An iterator over tuples of the index of a task and its result.
+    """
+    if workers <= 1:
+        for i, task in enumerate(tasks):
+            yield i, function(*task)
         return
-    for i in range(observations.get_num_observations() - 1):
-        component_progress_logger.info(f'{int((i / (observations.get_num_observations() - 1)) * 100)}')
-        start = observations.dates[i]
-        end = observations.dates[i + 1]
-        observations_subset = observations.get_observations_subset(start, end)
-        indicator_dict = post_processor.process_observations(observations_subset)
-        results = []
-        file_names = []
-        for indicator_name in indicator_dict:
-            results.append(indicator_dict[indicator_name])
-            file_names.append(os.path.join(output_path, DOUBLE_NAME_FORMAT.format(indicator_name,
-                                                                              _format(start), _format(end))))
-        _write(results, file_names, roi, spatial_resolution, roi_grid, destination_grid, output_format)
+    max_in_flight = 2 * workers
+    tasks_to_submit = deque(enumerate(tasks))
+    # metrics collected in the worker processes are handed back with the results
+    instrumentation = get_instrumentation()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        while len(tasks_to_submit) > 0 or len(futures) > 0:
+            while len(tasks_to_submit) > 0 and len(futures) < max_in_flight:
+                i, task = tasks_to_submit.popleft()
+                if instrumentation is None:
+                    futures[executor.submit(function, *task)] = i
+                else:
+                    futures[executor.submit(_call_instrumented, function, instrumentation.is_profiling(), *task)] = i
+            if ordered:
+                future = min(futures, key=futures.get)
+            else:
+                future = next(iter(wait(futures, return_when=FIRST_COMPLETED).done))
+            if instrumentation is None:
+                yield futures.pop(future), future.result()
+            else:
+                result, snapshot = future.result()
+                instrumentation.merge(snapshot)
+                yield futures.pop(future), result
+
+
+def _call_instrumented(function: Callable, profile: bool, *args) -> tuple:
+    # Executed in a worker process. Metrics are collected per task, so that each is merged only once.
+    previous_instrumentation = get_instrumentation()
+    instrumentation = Instrumentation(profile=profile)
+    set_instrumentation(instrumentation)
+    try:
+        return function(*args), instrumentation.get_snapshot()
+    finally:
+        set_instrumentation(previous_instrumentation)
+        instrumentation.close()
+
+
+def _get_threading(prefetch_depth: int, write_threads: int, profile: bool) -> tuple:
+    # profiles are taken per thread, so everything is done in the thread that computes the results
+    if profile:
+        return 0, 0
+    return prefetch_depth, write_threads
+
+
+def _to_datetime(time: Union[datetime, str]) -> datetime:
+    if type(time) == str:
+        time = get_time_from_string(time)
+    return time
 
 
 def _format(time: Union[datetime, str]):
     """
     Output: yyyymmdd
     """
-    if type(time) == str:
-        time = get_time_from_string(time)
-    return time.strftime('%Y%m%d')
-
-
-def _run_variable_post_processor(post_processor: VariablePostProcessor, data_path: str, output_path: str,
-                                 variable_names: List[str], roi: Union[str, Polygon], spatial_resolution: int,
-                                 roi_grid: Optional[str], destination_grid: Optional[str],
-                                 output_format: Optional[str] = 'GeoTiff'):
-    file_refs = get_valid_files(data_path, variable_names)
-    file_ref_groups = _group_file_refs_by_date(file_refs)
-    reprojection = _get_reprojection(spatial_resolution, roi, roi_grid, destination_grid)
-    for i, date in enumerate(file_ref_groups):
-        component_progress_logger.info(f'{int((i / (len(file_ref_groups.keys()))) * 100)}')
-        data_files = {}
-        file_refs_for_date = file_ref_groups[date]
-        for variable_name in variable_names:
-            for file_ref in file_refs_for_date:
-                if is_valid(file_ref.url, variable_name):
-                    data_files[variable_name] = file_ref.url
-                    break
+    return _to_datetime(time).strftime('%Y%m%d')
+
+
+def _run_variable_post_processors(post_processors: List[VariablePostProcessor], data_path: str, output_path: str,
+                                  variable_names: List[str], roi: Union[str, Polygon], spatial_resolution: int,
+                                  roi_grid: Optional[str], destination_grid: Optional[str],
+                                  output_format: Optional[str] = 'GeoTiff', workers: int = 1,
+                                  write_queue_depth: int = 2, write_threads: int = 1,
+                                  compression: Optional[str] = None, overviews: bool = False, resume: bool = False,
+                                  result_cache: Optional[ResultCache] = None,
+                                  input_index: Optional[InputFileIndex] = None):
+    if output_format not in SUPPORTED_OUTPUT_FORMATS:
+        logging.warning('Writing of {} not supported. Can not write post-processing results.'.format(output_format))
+        return
+    grid, dates, data_files_of_dates = _prepare_variable_post_processors(data_path, variable_names, roi,
+                                                                         spatial_resolution, roi_grid,
+                                                                         destination_grid, input_index)
+    manifests = []
+    for post_processor in post_processors:
+        manifests.append(OutputManifest(output_path, post_processor.get_name(), post_processor.get_version(),
+                                        _get_run_parameters(post_processor, roi, spatial_resolution, roi_grid,
+                                                            destination_grid, output_format, compression, overviews,
+                                                            variable_names=variable_names)))
+    # there is one task per date, which is handed the post processors that derive indicators for the date
+    tasks = []
+    task_dates = []
+    task_indexes = []
+    for date, data_files in zip(dates, data_files_of_dates):
+        indexes = list(range(len(post_processors)))
+        if resume:
+            indexes = [index for index in indexes
+                       if not manifests[index].is_done(_get_result_key(date), list(data_files.values()))]
+        if len(indexes) == 0:
+            continue
+        tasks.append(([post_processors[index] for index in indexes], data_files, grid, result_cache,
+                      _get_num_warp_threads(workers)))
+        task_dates.append(date)
+        task_indexes.append(indexes)
+    if len(tasks) == 0:
+        names = ', '.join([post_processor.get_name() for post_processor in post_processors])
+        logging.getLogger().info(f'All results of {names} are present already.')
+        return
+    writers = {}
+
+    def write_date(index: int, date: str, data_files: dict, indicator_dict: dict):
+        file_names = _get_output_file_names(output_path, output_format, list(indicator_dict), date)
+        time_step = None
+        with stage('write', **_get_write_counts(indicator_dict)):
+            if output_format in DATA_CUBE_OUTPUT_FORMATS:
+                writer_key = (index, output_format)
+                if writer_key not in writers:
+                    writers[writer_key] = create_data_cube_writer(output_format, file_names, list(indicator_dict),
+                                                                  grid.geo_transform, grid.projection, grid.width,
+                                                                  grid.height, compression=compression)
+                writers[writer_key].write(list(indicator_dict.values()), _to_datetime(date))
+                writers[writer_key].flush()
+                time_step = get_time_step(_to_datetime(date))
+            else:
+                _write(list(indicator_dict.values()), file_names, grid, output_format, compression, overviews)
+        manifests[index].mark_done(_get_result_key(date), list(data_files.values()), file_names, time_step)
+
+    # time steps written to data cubes out of order must be inserted, which is expensive, so dates are written in order
+    writes_data_cube = output_format in DATA_CUBE_OUTPUT_FORMATS
+    write_queue = WriteQueue(write_queue_depth, write_threads)
+    try:
+        for i, (task_index, indicator_dicts) in enumerate(_map_tasks(_process_variables_of_date, tasks, workers,
+                                                                     ordered=writes_data_cube)):
+            component_progress_logger.info(f'{int((i / len(tasks)) * 100)}')
+            report(i, len(tasks))
+            date = task_dates[task_index]
+            for index, indicator_dict in zip(task_indexes[task_index], indicator_dicts):
+                # the HDF5 library underneath data cubes is not thread-safe, so they are all written by one thread
+                write_key = output_format if writes_data_cube else (index, date)
+                write_queue.submit(write_key, write_date, index, date, tasks[task_index][1], indicator_dict)
+    except BaseException:
+        write_queue.close(raise_error=False)
+        _close_writers(writers)
+        _close_manifests(manifests)
+        raise
+    try:
+        write_queue.close()
+    finally:
+        _close_writers(writers)
+        _close_manifests(manifests)
+    report(len(tasks), len(tasks), force=True)
+
+
+def _prepare_variable_post_processors(data_path: str, variable_names: List[str], roi: Union[str, Polygon],
+                                      spatial_resolution: int, roi_grid: Optional[str],
+                                      destination_grid: Optional[str],
+                                      input_index: Optional[InputFileIndex] = None) -> tuple:
+    """
+    :return: A tuple of the output grid, the sorted dates and, for each date, a dictionary of variable names and
+    the data files the variables are read from
+    """
+    grid = get_output_grid(spatial_resolution, roi, roi_grid, destination_grid)
+    with stage('discovery'):
+        if input_index is not None:
+            data_files_by_date = input_index.get_data_files_by_date(data_path, variable_names)
+        else:
+            file_refs = get_valid_files(data_path, variable_names)
+            file_ref_groups = _group_file_refs_by_date(file_refs)
+            data_files_by_date = {}
+            for date in file_ref_groups:
+                data_files = {}
+                file_refs_for_date = file_ref_groups[date]
+                for variable_name in variable_names:
+                    for file_ref in file_refs_for_date:
+                        if is_valid(file_ref.url, variable_name):
+                            data_files[variable_name] = file_ref.url
+                            break
+                data_files_by_date[date] = data_files
+        urls = [url for data_files in data_files_by_date.values() for url in data_files.values()]
+        intersecting_urls = set(_get_intersecting_urls(urls, grid, input_index))
+    # the variables of a date are processed together, so a date is only dropped when none of its files intersects
+    dates = sorted([date for date in data_files_by_date
+                    if any([url in intersecting_urls for url in data_files_by_date[date].values()])])
+    return grid, dates, [data_files_by_date[date] for date in dates]
+
+
+def _iterate_variable_post_processors(post_processors: List[VariablePostProcessor], data_path: str,
+                                      variable_names: List[str], roi: Union[str, Polygon], spatial_resolution: int,
+                                      roi_grid: Optional[str], destination_grid: Optional[str], workers: int = 1,
+                                      result_cache: Optional[ResultCache] = None,
+                                      input_index: Optional[InputFileIndex] = None) -> Iterator[tuple]:
+    grid, dates, data_files_of_dates = _prepare_variable_post_processors(data_path, variable_names, roi,
+                                                                         spatial_resolution, roi_grid,
+                                                                         destination_grid, input_index)
+    tasks = [(post_processors, data_files, grid, result_cache, _get_num_warp_threads(workers))
+             for data_files in data_files_of_dates]
+    for task_index, indicator_dicts in _map_tasks(_process_variables_of_date, tasks, workers, ordered=False):
+        date = _to_datetime(dates[task_index])
+        for indicator_dict in indicator_dicts:
+            for indicator_name in indicator_dict:
+                yield indicator_name, (date, date), indicator_dict[indicator_name], grid
+
+
+def _process_variables_of_date(post_processors: List[VariablePostProcessor], data_files: dict, grid: OutputGrid,
+                               result_cache: Optional[ResultCache] = None, num_threads: int = 1) -> List[dict]:
+    # Might be executed in another process, see _process_observations_window
+    indicator_dicts = [None] * len(post_processors)
+    cache_keys = [None] * len(post_processors)
+    if result_cache is not None:
+        input_states = get_input_states(list(data_files.values()))
+        for index, post_processor in enumerate(post_processors):
+            cache_keys[index] = get_cache_key(post_processor.get_name(), post_processor.get_version(),
+                                              post_processor.indicators,
+                                              (grid.geo_transform, grid.projection, grid.width, grid.height),
+                                              input_states, sorted(data_files.items()))
+            indicator_dicts[index] = result_cache.get(cache_keys[index])
+    if None not in indicator_dicts:
+        return indicator_dicts
+    # the variables are read once for all post processors. They are handed out read-only, so that no post processor
+    # alters the input of the ones after it.
+    variable_data = _read_variables(data_files, grid, num_threads)
+    for variable_array in variable_data.values():
+        variable_array.setflags(write=False)
+    for index, post_processor in enumerate(post_processors):
+        if indicator_dicts[index] is None:
+            with stage('compute.' + post_processor.get_name(), pixels=grid.width * grid.height):
+                indicator_dicts[index] = post_processor.process_variables(variable_data)
+            if cache_keys[index] is not None:
+                result_cache.put(cache_keys[index], indicator_dicts[index])
+    return indicator_dicts
+
+
+def _read_variables(data_files: dict, grid: OutputGrid, num_threads: int = 1) -> dict:
+    """
+    Reads variables onto a grid. Only the parts of the source rasters that cover the grid are read.
+    :param data_files: A dictionary of variable names and the files the variables are read from
+    :param num_threads: The number of threads the variables are warped with
+    :return: A dictionary of variable names and arrays. The arrays have the data types of the source rasters.
+    """
+    variable_names = list(data_files)
+    datasets = [gdal.Open(data_files[variable_name]) for variable_name in variable_names]
+    sources = [get_source_subset(dataset, grid) for dataset in datasets]
+    if not _can_be_stacked(sources):
+        reprojection = grid.get_reprojection()
         variable_data = {}
-        for variable_name in data_files:
-            dataset = gdal.Open(data_files[variable_name])
-            reprojected_data_set = reprojection.reproject(dataset)
-            variable_data[variable_name] = reprojected_data_set.GetRasterBand(1).ReadAsArray()
-        indicator_dict = post_processor.process_variables(variable_data)
-        results = []
-        file_names = []
-        for indicator_name in indicator_dict:
-            results.append(indicator_dict[indicator_name])
-            file_names.append(os.path.join(output_path, SINGLE_NAME_FORMAT.format(indicator_name, _format(date))))
-        _write(results, file_names, roi, spatial_resolution, roi_grid, destination_grid, output_format)
+        for variable_name, source in zip(variable_names, sources):
+            with stage('reproject', pixels=grid.width * grid.height) as counts:
+                variable_data[variable_name] = reprojection.reproject(source).GetRasterBand(1).ReadAsArray()
+                counts['bytes_read'] = variable_data[variable_name].nbytes
+        return variable_data
+    # The variables of a data type are stacked into one virtual raster, which is warped in a single pass right into a
+    # buffer that holds all of them. The arrays handed out are views on these buffers.
+    indexes_by_data_type = {}
+    for i, source in enumerate(sources):
+        data_type = gdal_array.GDALTypeCodeToNumericTypeCode(source.GetRasterBand(1).DataType)
+        indexes_by_data_type.setdefault(np.dtype(data_type), []).append(i)
+    variable_data = {}
+    for data_type, indexes in indexes_by_data_type.items():
+        buffer = _warp_stacked([sources[i] for i in indexes], grid, data_type, num_threads)
+        for j, i in enumerate(indexes):
+            variable_data[variable_names[i]] = buffer[j]
+    return {variable_name: variable_data[variable_name] for variable_name in variable_names}
+
+
+def _warp_stacked(sources: List[gdal.Dataset], grid: OutputGrid, data_type: np.dtype, num_threads: int) -> np.array:
+    buffer = np.empty((len(sources), grid.height, grid.width), dtype=data_type)
+    stack = gdal.BuildVRT('', sources, separate=True)
+    destination = gdal_array.OpenArray(buffer)
+    destination.SetGeoTransform(grid.geo_transform)
+    destination.SetProjection(grid.get_srs().ExportToWkt())
+    for i, source in enumerate(sources):
+        no_data_value = source.GetRasterBand(1).GetNoDataValue()
+        if no_data_value is not None:
+            destination.GetRasterBand(i + 1).SetNoDataValue(no_data_value)
+        # pixels not covered by a source raster are not touched by the warp
+        buffer[i] = no_data_value if no_data_value is not None else 0
+    with stage('reproject', pixels=len(sources) * grid.width * grid.height, bytes_read=buffer.nbytes):
+        gdal.Warp(destination, stack, multithread=num_threads > 1,
+                  warpOptions=['NUM_THREADS={}'.format(num_threads)])
+    destination = None
+    return buffer
+
+
+def _get_num_warp_threads(workers: int) -> int:
+    # every worker process warps on its own, so the cores are shared among them
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def _can_be_stacked(datasets: List[gdal.Dataset]) -> bool:
+    # rasters can be stacked into one virtual raster when they share reference system and resolution
+    reference_projection = datasets[0].GetProjection()
+    reference_geo_transform = datasets[0].GetGeoTransform()
+    if reference_projection is None or reference_projection == '':
+        return False
+    reference_srs = osr.SpatialReference()
+    reference_srs.ImportFromWkt(reference_projection)
+    for dataset in datasets:
+        geo_transform = dataset.GetGeoTransform()
+        if geo_transform[2] != 0 or geo_transform[4] != 0 or \
+                not math.isclose(geo_transform[1], reference_geo_transform[1]) or \
+                not math.isclose(geo_transform[5], reference_geo_transform[5]):
+            return False
+        srs = osr.SpatialReference()
+        srs.ImportFromWkt(dataset.GetProjection())
+        if not srs.IsSame(reference_srs):
+            return False
+    return True
 
 
 def _group_file_refs_by_date(file_refs: List[FileRef]) -> dict:
@@ -274,17 +1069,64 @@ def _group_file_refs_by_date(file_refs: List[FileRef]) -> dict:
     return file_ref_groups
 
 
-def _write(indicators: List[np.array], file_names: List[str], roi: Union[str, Polygon], spatial_resolution: int,
-           roi_grid: Optional[str], destination_grid: Optional[str], output_format: Optional[str] = 'GeoTiff'):
-    reprojection = _get_reprojection(spatial_resolution, roi, roi_grid, destination_grid)
-    if output_format == 'GeoTiff':
-        reprojected_data_set = reprojection.reproject(_get_dummy_data_set())
-        width = reprojected_data_set.RasterXSize
-        height = reprojected_data_set.RasterYSize
-        geo_transform = reprojected_data_set.GetGeoTransform()
-        srs = reprojection.get_destination_srs()
-        projection = srs.ExportToWkt()
-        writer = GeoTiffWriter(file_names, geo_transform, projection, width, height, None, None)
+def _get_output_file_names(output_path: str, output_format: str, indicator_names: List[str],
+                           start: Union[datetime, str], end: Optional[Union[datetime, str]] = None) -> List[str]:
+    if output_format in DATA_CUBE_OUTPUT_FORMATS:
+        return [os.path.join(output_path, DATA_CUBE_NAME_FORMATS[output_format].format(indicator_name))
+                for indicator_name in indicator_names]
+    if end is None:
+        return [os.path.join(output_path, SINGLE_NAME_FORMAT.format(indicator_name, _format(start)))
+                for indicator_name in indicator_names]
+    return [os.path.join(output_path, DOUBLE_NAME_FORMAT.format(indicator_name, _format(start), _format(end)))
+            for indicator_name in indicator_names]
+
+
+def _get_result_key(start: Union[datetime, str], end: Optional[Union[datetime, str]] = None) -> str:
+    # identifies the result of a date or a pair of dates in the output manifest
+    if end is None:
+        return _format(start)
+    return '{}_{}'.format(_format(start), _format(end))
+
+
+def _get_run_parameters(post_processor: PostProcessor, roi: Union[str, Polygon], spatial_resolution: int,
+                        roi_grid: Optional[str], destination_grid: Optional[str], output_format: str,
+                        compression: Optional[str], overviews: bool,
+                        variable_names: Optional[List[str]] = None) -> dict:
+    """
+    :return: The parameters of a run that have an effect on its results. Parameters that only affect how the results
+    are derived, such as the number of workers or the tile size, are left out.
+    """
+    return {'indicators': post_processor.indicators, 'roi': roi if type(roi) is str else roi.wkt,
+            'spatial_resolution': spatial_resolution, 'roi_grid': roi_grid, 'destination_grid': destination_grid,
+            'output_format': output_format, 'compression': compression, 'overviews': overviews,
+            'variable_names': variable_names}
+
+
+def _get_write_counts(indicator_dict: dict) -> dict:
+    pixels = 0
+    bytes_written = 0
+    for indicator in indicator_dict.values():
+        pixels += np.size(indicator)
+        bytes_written += np.asarray(indicator).nbytes
+    return {'pixels': pixels, 'bytes_written': bytes_written}
+
+
+def _close_writers(writers: dict):
+    for writer in writers.values():
+        writer.close()
+    writers.clear()
+
+
+def _close_manifests(manifests: List[OutputManifest]):
+    for manifest in manifests:
+        manifest.close()
+
+
+def _write(indicators: List[np.array], file_names: List[str], grid: OutputGrid,
+           output_format: Optional[str] = 'GeoTiff', compression: Optional[str] = None, overviews: bool = False):
+    if output_format in SUPPORTED_OUTPUT_FORMATS:
+        writer = create_writer(output_format, file_names, grid.geo_transform, grid.projection, grid.width,
+                               grid.height, compression, overviews)
         writer.write(indicators)
         writer.close()
     else:
@@ -297,7 +1139,13 @@ if __name__ == '__main__':
     parser.add_argument("-i", "--input_path", help="The directory where the input data is located.", required=True)
     parser.add_argument("-o", "--output_path", help="The output directory to which the output file shall be "
                                                     "written.", required=True)
-    parser.add_argument("-f", "--format", help="The output format (default is GeoTiff).")
+    parser.add_argument("-f", "--format", help="The output format, either GeoTiff, COG or NetCDF (default is "
+                                               "GeoTiff).")
+    parser.add_argument("-c", "--compression", help="The compression of the output files, one of DEFLATE, ZSTD or "
+                                                    "LZW. If not given, output is not compressed.")
+    parser.add_argument("--overviews", action="store_true", help="Adds overviews to output files of format COG.")
+    parser.add_argument("--resume", action="store_true", help="Skips results that have been written by earlier runs "
+                                                              "already and whose input data has not changed since.")
     parser.add_argument("-roi", "--roi", help="The region of interest describing the area to be retrieved. Not "
                                               "required if 'state_mask' is given.")
     parser.add_argument("-res", "--spatial_resolution", help="The spatial resolution of the destination grid. "
@@ -317,4 +1165,5 @@ if __name__ == '__main__':
         output_format = args.format
     run_post_processor(name=args.name, data_path=args.input_path, output_path=args.output_path,
                        output_format=output_format, roi=args.roi, spatial_resolution=int(args.spatial_resolution),
-                       roi_grid=args.roi_grid, destination_grid=args.destination_grid)
+                       roi_grid=args.roi_grid, destination_grid=args.destination_grid,
+                       compression=args.compression, overviews=args.overviews, resume=args.resume)
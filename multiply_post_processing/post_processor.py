@@ -2,10 +2,11 @@ import logging
 
 from abc import abstractmethod, ABCMeta
 from enum import Enum
-from typing import List
+from typing import List, Optional
 
 from multiply_core.observations import ObservationsWrapper
 from multiply_core.variables import Variable
+from multiply_post_processing.version import __version__
 
 __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 
@@ -46,6 +47,13 @@ class PostProcessor(metaclass=ABCMeta):
         return self.indicators
 
 
+    @classmethod
+    def get_version(cls) -> str:
+        """
+        :return: The version of the post processor. Results derived by another version are derived again.
+        """
+        return __version__
+
     @classmethod
     @abstractmethod
     def get_type(cls) -> PostProcessorType:
@@ -119,11 +127,46 @@ class EODataPostProcessor(PostProcessor):
         expected to be passed in the order given by this list.+ get_names_
         """
 
+    @classmethod
+    def get_band_no_data_value(cls, data_type: str, band_name: str) -> Optional[float]:
+        """
+        :return: The no data value this post processor sets for a band before it reads the band. None, if the post
+        processor does not set a no data value. This is used to read the band on behalf of the post processor ahead of
+        time.
+        """
+        return None
+
+    def derive_statistics(self, observations: ObservationsWrapper) -> Optional[dict]:
+        """
+        Derives the statistics of a part of the scene which the post processing depends on, e.g., sums and counts
+        from which scene means are derived. When the post processing is executed block-wise on windows, the
+        statistics of all windows are derived first, merged and handed to process_observations, so that results do
+        not depend on the windows.
+        :param observations: A Wrapper around earth observation data of a part of the scene
+        :return: The statistics of the part of the scene. None, if the post processing does not depend on the scene.
+        """
+        return None
+
+    @classmethod
+    def merge_statistics(cls, statistics: List[dict]) -> dict:
+        """
+        Merges the statistics of parts of a scene into those of the whole scene. By default, values are summed up.
+        :param statistics: The statistics of the parts of the scene, as derived by derive_statistics
+        :return: The statistics of the whole scene
+        """
+        merged_statistics = {}
+        for statistics_of_part in statistics:
+            for name, value in statistics_of_part.items():
+                merged_statistics[name] = merged_statistics.get(name, 0) + value
+        return merged_statistics
+
     @abstractmethod
-    def process_observations(self, observations: ObservationsWrapper) -> dict:
+    def process_observations(self, observations: ObservationsWrapper, statistics: Optional[dict] = None) -> dict:
         """
         Performs the post processing
         :param observations: A Wrapper around earth observation data. Provides a convenience method to access EO Data.
+        :param statistics: The merged statistics of the whole scene, if the observations cover a window of it. If
+        None, scene-wide values are derived from the observations.
         :return: The result of the post processing
         """
 
@@ -151,6 +194,13 @@ class PostProcessorCreator(metaclass=ABCMeta):
         :return: A list with the descriptions of the indicators this post processor creates.
         """
 
+    @classmethod
+    def get_indicator_names(cls) -> List[str]:
+        """
+        :return: The short names of the indicators this post processor creates.
+        """
+        return [indicator_description.short_name for indicator_description in cls.get_indicator_descriptions()]
+
     @classmethod
     @abstractmethod
     def get_type(cls) -> PostProcessorType:
@@ -0,0 +1,141 @@
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+
+from threading import get_ident
+from typing import Optional
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+PROFILE_DIRECTORY_NAME = 'profile'
+_NUM_REPORTED_FUNCTIONS = 40
+_NUM_REPORTED_ALLOCATION_SITES = 25
+
+
+class StageProfiler(object):
+    """
+    Profiles the stages of a run with cProfile and records for each stage the code locations that allocated most
+    memory, as traced by tracemalloc. A stage is only profiled while it is the innermost stage, so that, e.g., reading
+    band data does not show up in the profile of the stage computing an indicator. Allocations of nested stages are
+    counted for the enclosing stages, too. Only stages of the thread in which the profiler is created are profiled.
+    """
+
+    def __init__(self):
+        self._thread_id = get_ident()
+        self._profiles = {}
+        self._merged_stats = {}
+        self._allocations = {}
+        self._open_stages = []
+        self._is_tracing = tracemalloc.is_tracing()
+        if not self._is_tracing:
+            tracemalloc.start()
+
+    def enter(self, stage: str):
+        if get_ident() != self._thread_id:
+            return
+        if len(self._open_stages) > 0:
+            self._profiles[self._open_stages[-1][0]].disable()
+        self._open_stages.append((stage, _take_snapshot()))
+        if stage not in self._profiles:
+            self._profiles[stage] = cProfile.Profile()
+        self._profiles[stage].enable()
+
+    def exit(self, stage: str):
+        if get_ident() != self._thread_id or len(self._open_stages) == 0 or self._open_stages[-1][0] != stage:
+            return
+        self._profiles[stage].disable()
+        _, snapshot = self._open_stages.pop()
+        allocations = self._allocations.setdefault(stage, {})
+        for statistic in _take_snapshot().compare_to(snapshot, 'lineno'):
+            if statistic.size_diff <= 0:
+                continue
+            frame = statistic.traceback[0]
+            site = '{}:{}'.format(frame.filename, frame.lineno)
+            size, count = allocations.get(site, (0, 0))
+            allocations[site] = (size + statistic.size_diff, count + statistic.count_diff)
+        if len(self._open_stages) > 0:
+            self._profiles[self._open_stages[-1][0]].enable()
+
+    def get_data(self) -> dict:
+        """
+        :return: The profiles and allocations recorded so far, e.g., to be merged into the profiler of another process.
+        Must not be called while a stage is open.
+        """
+        profiles = {}
+        for stage in self._profiles:
+            self._profiles[stage].create_stats()
+            profiles[stage] = self._profiles[stage].stats
+        return {'profiles': profiles, 'allocations': self._allocations}
+
+    def merge(self, data: dict):
+        """
+        Adds the profiles and allocations recorded by the profiler of another process, see get_data.
+        """
+        for stage in data['profiles']:
+            self._merged_stats.setdefault(stage, []).append(data['profiles'][stage])
+        for stage in data['allocations']:
+            allocations = self._allocations.setdefault(stage, {})
+            for site, (size, count) in data['allocations'][stage].items():
+                merged_size, merged_count = allocations.get(site, (0, 0))
+                allocations[site] = (merged_size + size, merged_count + count)
+
+    def write(self, profile_path: str):
+        """
+        Writes for each stage a profile dump '<stage>.prof', which can be read with pstats, a summary of the functions
+        that took most time '<stage>.txt' and a report of the code locations that allocated most memory
+        '<stage>.allocations.txt'. Must not be called while a stage is open.
+        """
+        if not os.path.exists(profile_path):
+            os.makedirs(profile_path)
+        data = self.get_data()
+        for stage in sorted(set(data['profiles']) | set(self._merged_stats)):
+            stats = None
+            for stage_stats in [data['profiles'].get(stage)] + self._merged_stats.get(stage, []):
+                if stage_stats is None:
+                    continue
+                if stats is None:
+                    stats = pstats.Stats(_Stats(stage_stats))
+                else:
+                    stats.add(_Stats(stage_stats))
+            stats.dump_stats(os.path.join(profile_path, '{}.prof'.format(stage)))
+            stream = io.StringIO()
+            stats.stream = stream
+            stats.sort_stats('tottime').print_stats(_NUM_REPORTED_FUNCTIONS)
+            with open(os.path.join(profile_path, '{}.txt'.format(stage)), 'w') as summary_file:
+                summary_file.write(stream.getvalue())
+        for stage in sorted(self._allocations):
+            sites = sorted(self._allocations[stage].items(), key=lambda item: item[1][0], reverse=True)
+            with open(os.path.join(profile_path, '{}.allocations.txt'.format(stage)), 'w') as report_file:
+                report_file.write('Memory allocated in stage {}, including nested stages\n'.format(stage))
+                for site, (size, count) in sites[:_NUM_REPORTED_ALLOCATION_SITES]:
+                    report_file.write('{:>12.1f} KiB {:>10d} blocks  {}\n'.format(size / 1024, count, site))
+
+    def close(self):
+        if not self._is_tracing:
+            tracemalloc.stop()
+
+
+class _Stats(object):
+    # Hands profile statistics that have been collected elsewhere to pstats
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                                      tracemalloc.Filter(False, __file__)])
+
+
+def get_profile_path(output_path: str, profile: bool) -> Optional[str]:
+    """
+    :return: The directory next to the outputs to which profiles are written, or None if the run is not profiled
+    """
+    if not profile:
+        return None
+    return os.path.join(output_path, PROFILE_DIRECTORY_NAME)
@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import uuid
+
+from typing import List, Optional
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+ENTRY_POINT_GROUP = 'post_processor_creators'
+# the file in which the metadata of the post processor creators registered as entry points is cached
+MANIFEST_PATH_VARIABLE = 'MULTIPLY_POST_PROCESSOR_MANIFEST'
+DEFAULT_MANIFEST_PATH = os.path.join(os.path.expanduser('~'), '.multiply', 'post_processor_manifest.json')
+
+# This module must not import any of the post processors, nor anything that imports GDAL, SciPy or scikit-learn, so
+# that post processors can be listed and described without loading them.
+
+
+class LazyPostProcessorCreator(object):
+    """
+    Stands in for a post processor creator that is registered as an entry point. Its name, description and indicator
+    names are served from metadata, everything else from the creator itself, which is loaded only then.
+    """
+
+    def __init__(self, entry_point, metadata: Optional[dict] = None):
+        """
+        :param entry_point: The entry point under which the creator is registered
+        :param metadata: The name, description and indicator names of the creator. If None, they are taken from the
+        creator.
+        """
+        self._entry_point = entry_point
+        self._metadata = metadata
+        self._creator = None
+
+    def get_name(self) -> str:
+        return self.get_metadata()['name']
+
+    def get_description(self) -> str:
+        return self.get_metadata()['description']
+
+    def get_indicator_names(self) -> List[str]:
+        return self.get_metadata()['indicator_names']
+
+    def get_indicator_descriptions(self) -> list:
+        return self.load().get_indicator_descriptions()
+
+    def get_type(self):
+        return self.load().get_type()
+
+    def get_required_input_data_types(self) -> List[str]:
+        return self.load().get_required_input_data_types()
+
+    def create_post_processor(self, indicator_names: List[str]):
+        return self.load().create_post_processor(indicator_names)
+
+    def get_metadata(self) -> dict:
+        if self._metadata is None:
+            creator = self.load()
+            self._metadata = {'name': creator.get_name(), 'description': creator.get_description(),
+                              'indicator_names': creator.get_indicator_names()}
+        return self._metadata
+
+    def load(self):
+        """
+        :return: The creator, which is imported on first access
+        """
+        if self._creator is None:
+            self._creator = self._entry_point.load()
+        return self._creator
+
+
+POST_PROCESSOR_CREATOR_REGISTRY = []
+
+
+def add_post_processor_creator(post_processor_creator):
+    POST_PROCESSOR_CREATOR_REGISTRY.append(post_processor_creator)
+
+
+def get_post_processor_creators() -> list:
+    return POST_PROCESSOR_CREATOR_REGISTRY
+
+
+def get_post_processors(requested_indicator_names: List[str]) -> list:
+    """
+    :param requested_indicator_names: Names of the indicators that shall be derived.
+    :return: The post processors that can be used to derive the designated indicators.
+    """
+    post_processors = []
+    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
+        indicator_names = []
+        for indicator_name in post_processor_creator.get_indicator_names():
+            if indicator_name in requested_indicator_names:
+                indicator_names.append(indicator_name)
+        if len(indicator_names) > 0:
+            post_processors.append(post_processor_creator.create_post_processor(indicator_names))
+    return post_processors
+
+
+def get_post_processor_names() -> List[str]:
+    """
+    :return: the names of all post processors registered in the post processing component
+    """
+    post_processor_names = []
+    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
+        post_processor_names.append(post_processor_creator.get_name())
+    return post_processor_names
+
+
+def get_post_processor_description(name: str) -> str:
+    """
+    :param A name of a post-processor
+    :return: the description of the post processor of the requested name
+    """
+    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
+        if name == post_processor_creator.get_name():
+            return post_processor_creator.get_description()
+    raise ValueError('No post processor with name {} found.'.format(name))
+
+
+def get_post_processor(name: str, indicator_names: List[str]):
+    """
+    :param A name of a post-processor
+    :return: the post processor of the requested name
+    """
+    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
+        if name == post_processor_creator.get_name():
+            return post_processor_creator.create_post_processor(indicator_names)
+    raise ValueError('No post processor with name {} found.'.format(name))
+
+
+def get_available_indicators() -> list:
+    """
+    :return: the names of the indicators that can be derived using one of the registered post processors.
+    """
+    indicator_descriptions = []
+    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
+        post_processor_indicator_descriptions = post_processor_creator.get_indicator_descriptions()
+        for indicator_description in post_processor_indicator_descriptions:
+            if indicator_description not in indicator_descriptions:
+                indicator_descriptions.append(indicator_description)
+    return indicator_descriptions
+
+
+def get_available_indicator_names() -> List[str]:
+    """
+    :return: the names of the indicators that can be derived using one of the registered post processors. Unlike
+    get_available_indicators, this does not load creators that are registered as entry points.
+    """
+    indicator_names = []
+    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
+        for indicator_name in post_processor_creator.get_indicator_names():
+            if indicator_name not in indicator_names:
+                indicator_names.append(indicator_name)
+    return indicator_names
+
+
+def get_entry_point_creators(manifest_path: Optional[str] = None) -> List[LazyPostProcessorCreator]:
+    """
+    Finds the post processor creators that are registered as entry points. Their metadata is taken from a manifest,
+    so that they need not be loaded. Creators that are not recorded in the manifest yet are loaded once to record them.
+    :param manifest_path: The file the manifest is kept in. If None, it is taken from the environment variable
+    MULTIPLY_POST_PROCESSOR_MANIFEST or, if that is not set, from the user's home directory.
+    :return: Stand-ins for the creators
+    """
+    if manifest_path is None:
+        manifest_path = os.environ.get(MANIFEST_PATH_VARIABLE, DEFAULT_MANIFEST_PATH)
+    manifest = _read_manifest(manifest_path)
+    creators = []
+    updated_manifest = {}
+    for entry_point in _get_entry_points():
+        key = _get_entry_point_key(entry_point)
+        creator = LazyPostProcessorCreator(entry_point, manifest.get(key))
+        try:
+            updated_manifest[key] = creator.get_metadata()
+        except Exception as e:
+            logging.warning(f'Could not load post processor creator {entry_point.name}: {e}')
+            continue
+        creators.append(creator)
+    if updated_manifest != manifest:
+        _write_manifest(manifest_path, updated_manifest)
+    return creators
+
+
+def _get_entry_points() -> list:
+    try:
+        from importlib import metadata
+    except ImportError:
+        import pkg_resources
+        return list(pkg_resources.iter_entry_points(ENTRY_POINT_GROUP))
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return list(entry_points.select(group=ENTRY_POINT_GROUP))
+    return list(entry_points.get(ENTRY_POINT_GROUP, []))
+
+
+def _get_entry_point_key(entry_point) -> str:
+    # the version of the distribution is part of the key, so that metadata is renewed when a plugin is updated
+    distribution = getattr(entry_point, 'dist', None)
+    version = getattr(distribution, 'version', None)
+    value = getattr(entry_point, 'value', None)
+    if value is None:
+        # entry points of pkg_resources
+        value = str(entry_point).split('=', 1)[-1].strip()
+    return '{}={}@{}'.format(entry_point.name, value, version)
+
+
+def _read_manifest(manifest_path: str) -> dict:
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r') as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(manifest_path: str, manifest: dict):
+    # the manifest only saves loading the creators, so failing to write it is not an error
+    temp_file_name = '{}.{}.tmp'.format(manifest_path, uuid.uuid4().hex)
+    try:
+        directory = os.path.dirname(manifest_path)
+        if directory != '' and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with open(temp_file_name, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.replace(temp_file_name, manifest_path)
+    except OSError as e:
+        logging.getLogger().info(f'Could not write post processor manifest: {e}')
+        if os.path.exists(temp_file_name):
+            os.remove(temp_file_name)
+
+
+for entry_point_creator in get_entry_point_creators():
+    add_post_processor_creator(entry_point_creator)
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import numpy as np
+import os
+import uuid
+
+from threading import Lock
+from typing import Optional
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+_RESULT_FILE_EXTENSION = '.npz'
+# the cache is scanned again once a process has written this fraction of the size limit since the last scan
+_RESCAN_FRACTION = 1 / 16
+# when results are evicted, they are evicted until the cache is within this fraction of the size limit
+_EVICTION_FRACTION = 0.9
+
+# The size of each cache directory as it is known to this process. Caches are handed to worker processes with
+# every task, so the sizes are kept here rather than in the caches.
+_SIZES = {}
+_SIZES_LOCK = Lock()
+
+
+class _CacheSize(object):
+
+    def __init__(self, size: int):
+        self.size = size
+        self.written_since_scan = 0
+
+
+class ResultCache(object):
+    """
+    An on-disk cache for the indicators a post processor has derived for a date, a pair of dates or a window thereof.
+    Results are addressed by a key that is derived from everything the results depend on, see get_cache_key. As this
+    includes the grid and window, results are only shared by runs on the same output grid that are split into the
+    same windows. Runs on regions of interest that merely overlap do not share results.
+    When the results held by the cache exceed a size limit, the least recently used ones are evicted. The size of the
+    cache is tracked in memory and only determined from the cache directory once in a while, so the cache may
+    temporarily exceed its limit by what other processes sharing it have written since.
+    """
+
+    def __init__(self, cache_path: str, max_size: int):
+        """
+        :param cache_path: The directory in which results are cached
+        :param max_size: The size limit of the cache in bytes
+        """
+        self._cache_path = cache_path
+        self._max_size = max_size
+        if not os.path.exists(cache_path):
+            os.makedirs(cache_path, exist_ok=True)
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._get_file_name(key))
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        :param key: The key of the results
+        :return: A dictionary of indicator names and arrays or None, if the results are not cached.
+        """
+        file_name = self._get_file_name(key)
+        try:
+            with np.load(file_name) as results:
+                indicator_dict = {indicator_name: results[indicator_name] for indicator_name in results.files}
+            # the modification time marks when results have been used last
+            os.utime(file_name)
+            return indicator_dict
+        except (OSError, ValueError):
+            # results might have been evicted by another process in the meantime
+            return None
+
+    def put(self, key: str, indicator_dict: dict):
+        """
+        Caches results. If the cache exceeds its size limit afterwards, the least recently used results are evicted.
+        :param key: The key of the results
+        :param indicator_dict: A dictionary of indicator names and arrays
+        """
+        file_name = self._get_file_name(key)
+        # results are written to a temporary file first, so that other processes never read incomplete results
+        temp_file_name = '{}.{}.tmp'.format(file_name, uuid.uuid4().hex)
+        try:
+            with open(temp_file_name, 'wb') as temp_file:
+                np.savez(temp_file, **indicator_dict)
+            size = os.path.getsize(temp_file_name)
+            os.replace(temp_file_name, file_name)
+        except OSError as e:
+            logging.warning(f'Could not cache results: {e}')
+            if os.path.exists(temp_file_name):
+                os.remove(temp_file_name)
+            return
+        with _SIZES_LOCK:
+            cache_size = _SIZES.get(self._cache_path)
+            if cache_size is not None:
+                # results that replace cached ones are counted twice, which the next scan corrects
+                cache_size.size += size
+                cache_size.written_since_scan += size
+                if cache_size.size <= self._max_size and \
+                        cache_size.written_since_scan <= self._max_size * _RESCAN_FRACTION:
+                    return
+            _SIZES[self._cache_path] = _CacheSize(self._evict())
+
+    def _evict(self) -> int:
+        # results are evicted down to below the size limit, so that not every further result requires a scan
+        entries = []
+        size = 0
+        with os.scandir(self._cache_path) as directory_entries:
+            for entry in directory_entries:
+                if not entry.name.endswith(_RESULT_FILE_EXTENSION):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                size += stat.st_size
+        if size <= self._max_size:
+            return size
+        entries.sort()
+        for modification_time, file_size, file_name in entries:
+            if size <= self._max_size * _EVICTION_FRACTION:
+                break
+            try:
+                os.remove(file_name)
+            except OSError:
+                # already evicted by another process
+                pass
+            size -= file_size
+        return size
+
+    def _get_file_name(self, key: str) -> str:
+        return os.path.join(self._cache_path, key + _RESULT_FILE_EXTENSION)
+
+
+def get_cache_key(post_processor_name: str, version: str, indicator_names: list, grid_key: tuple,
+                  input_states: dict, *components) -> str:
+    """
+    :param post_processor_name: The name of the post processor that derives the results
+    :param version: The version of the post processor
+    :param indicator_names: The indicators that are derived
+    :param grid_key: Identifies the grid or window the results are given on. Results are only found again for the
+    very same grid or window.
+    :param input_states: The identities of the input files, see manifest.get_input_states
+    :param components: Anything else the results depend on, e.g., the dates they refer to
+    :return: A key that addresses the results
+    """
+    key_components = [post_processor_name, version, indicator_names, grid_key, input_states,
+                      [str(component) for component in components]]
+    return hashlib.sha256(json.dumps(key_components, sort_keys=True, default=str).encode('utf-8')).hexdigest()
@@ -0,0 +1,421 @@
+import bisect
+import gdal
+import logging
+import math
+import numpy as np
+import os
+
+from datetime import datetime
+from queue import Queue
+from threading import Lock, Thread
+from typing import Callable, Hashable, List, Optional
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+SUPPORTED_OUTPUT_FORMATS = ['GeoTiff', 'COG', 'NetCDF']
+DATA_CUBE_OUTPUT_FORMATS = ['NetCDF']
+SUPPORTED_COMPRESSIONS = ['DEFLATE', 'ZSTD', 'LZW']
+DATA_CUBE_COMPRESSIONS = ['DEFLATE', 'ZSTD']
+_BLOCK_SIZE = 512
+_TIME_UNITS = 'days since 1970-01-01 00:00:00'
+
+
+class GeoTiffWindowWriter(object):
+    """
+    Writes indicators to GeoTiff files. In contrast to the GeoTiffWriter from multiply_core, the arrays to be written
+    may cover only a window of the output grid, so that an output file can be assembled block by block.
+    """
+
+    def __init__(self, file_names: List[str], geo_transform: tuple, projection: str, width: int, height: int,
+                 data_types: Optional[List[int]] = None, options: Optional[List[str]] = None):
+        """
+        :param options: Creation options handed to the GeoTiff driver of GDAL
+        """
+        if data_types is None:
+            data_types = [gdal.GDT_Float32] * len(file_names)
+        if options is None:
+            options = []
+        driver = gdal.GetDriverByName('GTiff')
+        self._data_sets = []
+        for i, file_name in enumerate(file_names):
+            _make_directory(file_name)
+            data_set = driver.Create(file_name, width, height, 1, data_types[i], options)
+            data_set.SetGeoTransform(geo_transform)
+            data_set.SetProjection(projection)
+            self._data_sets.append(data_set)
+
+    def write(self, data: List[np.array], x_offset: int = 0, y_offset: int = 0):
+        """
+        Writes the arrays to the files. The first array is written to the first file and so on.
+        :param data: The arrays to be written
+        :param x_offset: The column of the output grid at which the arrays start
+        :param y_offset: The row of the output grid at which the arrays start
+        """
+        for i, array in enumerate(data):
+            self._data_sets[i].GetRasterBand(1).WriteArray(array, x_offset, y_offset)
+
+    def close(self):
+        for data_set in self._data_sets:
+            data_set.FlushCache()
+        self._data_sets = []
+
+
+class CloudOptimizedGeoTiffWindowWriter(GeoTiffWindowWriter):
+    """
+    Writes indicators to Cloud Optimized GeoTiff files. As the layout of such a file can only be created once all
+    data is known, the data is first written to temporary tiled GeoTiff files which are converted on close.
+    """
+
+    def __init__(self, file_names: List[str], geo_transform: tuple, projection: str, width: int, height: int,
+                 data_types: Optional[List[int]] = None, compression: Optional[str] = None, overviews: bool = False):
+        self._file_names = file_names
+        self._temp_file_names = ['{}.tmp.tif'.format(file_name) for file_name in file_names]
+        self._compression = compression
+        self._overviews = overviews
+        super().__init__(self._temp_file_names, geo_transform, projection, width, height, data_types,
+                         get_creation_options('GeoTiff', compression))
+
+    def close(self):
+        data_sets = self._data_sets
+        super().close()
+        use_cog_driver = gdal.GetDriverByName('COG') is not None
+        for i, data_set in enumerate(data_sets):
+            file_name = self._file_names[i]
+            if use_cog_driver:
+                options = ['BLOCKSIZE={}'.format(_BLOCK_SIZE), 'OVERVIEWS={}'.format('AUTO' if self._overviews
+                                                                                    else 'NONE')]
+                if self._compression is not None:
+                    options += ['COMPRESS={}'.format(self._compression), 'PREDICTOR=YES']
+                gdal.GetDriverByName('COG').CreateCopy(file_name, data_set, options=options)
+            else:
+                # GDAL versions before 3.1 have no COG driver, the layout is then created by copying the overviews
+                if self._overviews:
+                    data_set.BuildOverviews('NEAREST', _get_overview_levels(data_set.RasterXSize,
+                                                                            data_set.RasterYSize))
+                options = get_creation_options('COG', self._compression) + ['COPY_SRC_OVERVIEWS=YES']
+                gdal.GetDriverByName('GTiff').CreateCopy(file_name, data_set, options=options)
+            # the temporary file must be closed before it can be removed
+            data_set = None
+            data_sets[i] = None
+            os.remove(self._temp_file_names[i])
+
+
+class NetCDFDataCubeWriter(object):
+    """
+    Writes indicators to NetCDF files with a time dimension, one file per indicator. Time steps are added to the time
+    steps already contained in a file, which are never rewritten unless data for the very same time step is written
+    again. Time steps are kept in ascending order, a time step that is earlier than the last one is inserted. The data
+    of a time step may be written window by window.
+    """
+
+    def __init__(self, file_names: List[str], variable_names: List[str], geo_transform: tuple, projection: str,
+                 width: int, height: int, chunk_size: Optional[int] = None, compression: Optional[str] = 'DEFLATE'):
+        """
+        :param variable_names: The names of the variables in the files. The first variable is written to the first
+        file and so on.
+        :param chunk_size: The spatial edge length of a chunk in pixels. Should be aligned with the windows the data
+        is written in. A chunk always covers a single time step.
+        :param compression: Either 'DEFLATE', 'ZSTD' or None for uncompressed output
+        """
+        if netCDF4 is None:
+            raise ValueError('Writing of NetCDF requires the netCDF4 package.')
+        check_compression('NetCDF', compression)
+        if chunk_size is None:
+            chunk_size = _BLOCK_SIZE
+        chunk_sizes = (1, min(chunk_size, height), min(chunk_size, width))
+        self._variable_names = variable_names
+        self._data_sets = []
+        # the time bounds of the time steps in each file, in ascending order
+        self._time_bounds = []
+        for file_name, variable_name in zip(file_names, variable_names):
+            if os.path.exists(file_name):
+                data_set = netCDF4.Dataset(file_name, 'a')
+                self._time_bounds.append([tuple(bounds) for bounds in data_set.variables['time_bnds'][:].tolist()])
+            else:
+                data_set = _create_data_cube(file_name, variable_name, geo_transform, projection, width, height,
+                                             chunk_sizes, compression)
+                self._time_bounds.append([])
+            self._data_sets.append(data_set)
+
+    def write(self, data: List[np.array], start: datetime, end: Optional[datetime] = None, x_offset: int = 0,
+              y_offset: int = 0):
+        """
+        Writes the arrays to the time step given by start and end. The first array is written to the first file and
+        so on.
+        :param start: The start of the time step
+        :param end: The end of the time step. If None, the time step refers to start only.
+        :param x_offset: The column of the output grid at which the arrays start
+        :param y_offset: The row of the output grid at which the arrays start
+        """
+        time_bounds = get_time_step(start, end)
+        for i, array in enumerate(data):
+            time_index = bisect.bisect_left(self._time_bounds[i], time_bounds)
+            if time_index == len(self._time_bounds[i]) or self._time_bounds[i][time_index] != time_bounds:
+                self._insert_time_step(i, time_index, time_bounds)
+            height, width = array.shape
+            self._data_sets[i].variables[self._variable_names[i]][time_index, y_offset:y_offset + height,
+                                                                  x_offset:x_offset + width] = array
+
+    def _insert_time_step(self, i: int, time_index: int, time_bounds: tuple):
+        data_set = self._data_sets[i]
+        variable = data_set.variables[self._variable_names[i]]
+        # the time dimension can only grow at its end, so later time steps are moved back by one, starting with the
+        # last one. This is expensive, but only required when a time step is added before existing ones.
+        for j in range(len(self._time_bounds[i]), time_index, -1):
+            variable[j] = variable[j - 1]
+            data_set.variables['time'][j] = data_set.variables['time'][j - 1]
+            data_set.variables['time_bnds'][j] = data_set.variables['time_bnds'][j - 1]
+        if time_index < len(self._time_bounds[i]):
+            variable[time_index] = np.full(variable.shape[1:], np.nan, dtype=variable.dtype)
+        data_set.variables['time'][time_index] = time_bounds[0]
+        data_set.variables['time_bnds'][time_index] = time_bounds
+        self._time_bounds[i].insert(time_index, time_bounds)
+
+    def flush(self):
+        """
+        Makes sure all data written so far is in the files.
+        """
+        for data_set in self._data_sets:
+            data_set.sync()
+
+    def close(self):
+        for data_set in self._data_sets:
+            data_set.close()
+        self._data_sets = []
+
+
+def get_time_step(start: datetime, end: Optional[datetime] = None) -> tuple:
+    """
+    :param start: The start of the time step
+    :param end: The end of the time step. If None, the time step refers to start only.
+    :return: The bounds of the time step as they are recorded in data cubes
+    """
+    if netCDF4 is None:
+        raise ValueError('Data cubes require the netCDF4 package.')
+    if end is None:
+        end = start
+    return float(netCDF4.date2num(start, _TIME_UNITS)), float(netCDF4.date2num(end, _TIME_UNITS))
+
+
+def get_time_steps(file_name: str) -> List[tuple]:
+    """
+    :return: The bounds of the time steps contained in a data cube, see get_time_step. Empty, if the data cube does
+    not exist or cannot be read.
+    """
+    if netCDF4 is None or not os.path.exists(file_name):
+        return []
+    try:
+        with netCDF4.Dataset(file_name, 'r') as data_set:
+            return [tuple(bounds) for bounds in data_set.variables['time_bnds'][:].tolist()]
+    except (OSError, KeyError):
+        return []
+
+
+def _create_data_cube(file_name: str, variable_name: str, geo_transform: tuple, projection: str, width: int,
+                      height: int, chunk_sizes: tuple, compression: Optional[str]):
+    _make_directory(file_name)
+    data_set = netCDF4.Dataset(file_name, 'w', format='NETCDF4')
+    data_set.createDimension('time', None)
+    data_set.createDimension('bnds', 2)
+    data_set.createDimension('y', height)
+    data_set.createDimension('x', width)
+    time = data_set.createVariable('time', 'f8', ('time',))
+    time.units = _TIME_UNITS
+    time.standard_name = 'time'
+    time.bounds = 'time_bnds'
+    data_set.createVariable('time_bnds', 'f8', ('time', 'bnds'))
+    x = data_set.createVariable('x', 'f8', ('x',))
+    x[:] = geo_transform[0] + (np.arange(width) + 0.5) * geo_transform[1]
+    y = data_set.createVariable('y', 'f8', ('y',))
+    y[:] = geo_transform[3] + (np.arange(height) + 0.5) * geo_transform[5]
+    crs = data_set.createVariable('crs', 'i4')
+    crs.spatial_ref = projection
+    crs.GeoTransform = ' '.join([str(value) for value in geo_transform])
+    compression_args = {}
+    if compression == 'DEFLATE':
+        compression_args = {'zlib': True, 'complevel': 4}
+    elif compression == 'ZSTD':
+        compression_args = {'compression': 'zstd'}
+    variable = data_set.createVariable(variable_name, 'f4', ('time', 'y', 'x'), chunksizes=chunk_sizes,
+                                       fill_value=np.nan, **compression_args)
+    variable.grid_mapping = 'crs'
+    return data_set
+
+
+def create_data_cube_writer(output_format: str, file_names: List[str], variable_names: List[str],
+                            geo_transform: tuple, projection: str, width: int, height: int,
+                            chunk_size: Optional[int] = None, compression: Optional[str] = None) \
+        -> NetCDFDataCubeWriter:
+    """
+    :param output_format: One of DATA_CUBE_OUTPUT_FORMATS
+    :param chunk_size: The spatial edge length of a chunk in pixels
+    :param compression: If None, data cubes are compressed with DEFLATE.
+    :return: A writer for the output format
+    """
+    if output_format == 'NetCDF':
+        if compression is None:
+            compression = 'DEFLATE'
+        return NetCDFDataCubeWriter(file_names, variable_names, geo_transform, projection, width, height,
+                                    chunk_size, compression)
+    raise ValueError('Output format {} is not a data cube format. Data cube formats are {}.'.
+                     format(output_format, DATA_CUBE_OUTPUT_FORMATS))
+
+
+def create_writer(output_format: str, file_names: List[str], geo_transform: tuple, projection: str, width: int,
+                  height: int, compression: Optional[str] = None, overviews: bool = False) -> GeoTiffWindowWriter:
+    """
+    :param output_format: One of SUPPORTED_OUTPUT_FORMATS
+    :param compression: One of SUPPORTED_COMPRESSIONS or None for uncompressed output
+    :param overviews: Whether overviews shall be created. Only considered for output format 'COG'.
+    :return: A writer for the output format
+    """
+    if output_format == 'GeoTiff':
+        if overviews:
+            logging.warning('Overviews are only created for output format COG.')
+        return GeoTiffWindowWriter(file_names, geo_transform, projection, width, height,
+                                   options=get_creation_options(output_format, compression))
+    elif output_format == 'COG':
+        return CloudOptimizedGeoTiffWindowWriter(file_names, geo_transform, projection, width, height,
+                                                 compression=compression, overviews=overviews)
+    elif output_format in DATA_CUBE_OUTPUT_FORMATS:
+        raise ValueError('Output format {} is a data cube format, use create_data_cube_writer.'.format(output_format))
+    raise ValueError('Output format {} not supported. Supported formats are {}.'.
+                     format(output_format, SUPPORTED_OUTPUT_FORMATS))
+
+
+def check_compression(output_format: str, compression: Optional[str]):
+    """
+    Checks whether output files of a format can be written with a compression, so that runs can be rejected before
+    any data is processed.
+    :raises ValueError: If the compression is not supported for the output format
+    """
+    if compression is None:
+        return
+    supported_compressions = SUPPORTED_COMPRESSIONS
+    if output_format in DATA_CUBE_OUTPUT_FORMATS:
+        supported_compressions = DATA_CUBE_COMPRESSIONS
+    if compression not in supported_compressions:
+        raise ValueError('Compression {} not supported for {}. Supported compressions are {}.'.
+                         format(compression, output_format, supported_compressions))
+
+
+def get_creation_options(output_format: str, compression: Optional[str] = None) -> List[str]:
+    """
+    :return: The creation options for the GeoTiff driver of GDAL. Output is tiled when it is compressed or
+    cloud optimized.
+    """
+    if compression is not None and compression not in SUPPORTED_COMPRESSIONS:
+        raise ValueError('Compression {} not supported. Supported compressions are {}.'.
+                         format(compression, SUPPORTED_COMPRESSIONS))
+    options = []
+    if compression is not None or output_format == 'COG':
+        options += ['TILED=YES', 'BLOCKXSIZE={}'.format(_BLOCK_SIZE), 'BLOCKYSIZE={}'.format(_BLOCK_SIZE),
+                    'BIGTIFF=IF_SAFER']
+    if compression is not None:
+        # output is written as floating point data
+        options += ['COMPRESS={}'.format(compression), 'PREDICTOR=3']
+    return options
+
+
+def _make_directory(file_name: str):
+    directory = os.path.dirname(file_name)
+    if directory != '' and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+
+def _get_overview_levels(width: int, height: int) -> List[int]:
+    levels = []
+    level = 2
+    while math.ceil(max(width, height) / level) >= _BLOCK_SIZE / 2:
+        levels.append(level)
+        level *= 2
+    return levels
+
+
+class WriteQueue(object):
+    """
+    Executes write operations in a pool of background threads, so that writing does not block the computation of
+    further results. Operations submitted with the same key are executed one after another by the same thread, so
+    that a file is only ever written by one thread. At most queue_depth operations wait per thread, submitting further
+    operations blocks until one is done. Once a write operation has failed, further operations are dropped and the
+    error is raised by the next submit, flush or close.
+    """
+
+    def __init__(self, queue_depth: int = 2, num_threads: int = 1):
+        """
+        :param queue_depth: The number of operations that may wait per thread
+        :param num_threads: The number of write threads. If 0, operations are executed right when they are submitted.
+        """
+        self._queues = []
+        self._threads = []
+        self._errors = []
+        self._lock = Lock()
+        for i in range(max(0, num_threads)):
+            queue = Queue(maxsize=max(1, queue_depth))
+            thread = Thread(target=self._run, args=(queue,), daemon=True)
+            thread.start()
+            self._queues.append(queue)
+            self._threads.append(thread)
+
+    def _run(self, queue: Queue):
+        while True:
+            operation = queue.get()
+            try:
+                if operation is None:
+                    return
+                self._execute(*operation)
+            finally:
+                queue.task_done()
+
+    def _execute(self, function: Callable, args: tuple):
+        try:
+            if len(self._errors) == 0:
+                function(*args)
+        except Exception as e:
+            with self._lock:
+                self._errors.append(e)
+
+    def submit(self, key: Hashable, function: Callable, *args):
+        """
+        Submits a write operation.
+        :param key: Operations with the same key are executed in the order they are submitted.
+        :param function: The write operation
+        :param args: The arguments to the write operation
+        :raises IOError: If a write operation submitted before has failed
+        """
+        # results that can not be written any more need not be computed either
+        self._raise_error()
+        if len(self._queues) == 0:
+            self._execute(function, args)
+            return
+        self._queues[hash(key) % len(self._queues)].put((function, args))
+
+    def flush(self):
+        """
+        Waits until all submitted write operations are done. Raises an error if a write operation failed.
+        """
+        for queue in self._queues:
+            queue.join()
+        self._raise_error()
+
+    def close(self, raise_error: bool = True):
+        """
+        Waits until all submitted write operations are done and stops the threads.
+        :param raise_error: Whether to raise an error a write operation might have raised
+        """
+        for queue in self._queues:
+            queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if raise_error:
+            self._raise_error()
+
+    def _raise_error(self):
+        if len(self._errors) > 0:
+            raise IOError('Could not write post processing results: {}'.format(self._errors[0])) \
+                from self._errors[0]
@@ -1,4 +1,7 @@
-from multiply_post_processing.indicators import get_indicator, get_indicators
+import os
+
+import multiply_post_processing.indicators.indicators
+from multiply_post_processing.indicators import add_indicator_library, get_indicator, get_indicators
 
 __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 
@@ -34,3 +37,29 @@ def test_get_indicator_mnnd():
     assert 'Depends on number of considered traits' == mmd_variable.range
     assert 1 == len(mmd_variable.applications)
     assert 'functional diversity' == mmd_variable.applications[0]
+
+
+def test_get_indicator_returns_indexed_indicator():
+    assert get_indicator('GeoCBI') is get_indicator('GeoCBI')
+    assert get_indicator('unknown') is None
+
+
+def test_add_indicator_library(tmpdir, monkeypatch):
+    indicators_module = multiply_post_processing.indicators.indicators
+    monkeypatch.setattr(indicators_module, '_LIBRARIES', [])
+    monkeypatch.setattr(indicators_module, '_INDICATORS', [])
+    monkeypatch.setattr(indicators_module, '_INDICATOR_INDEX', {})
+    monkeypatch.setenv(indicators_module.CACHE_PATH_VARIABLE, os.path.join(str(tmpdir), 'cache'))
+    library_file = os.path.join(str(tmpdir), 'library.yaml')
+    with open(library_file, 'w') as library:
+        library.write("- Variable:\n    short_name: extra\n    display_name: 'Extra Indicator'\n"
+                      "- Variable:\n    short_name: GeoCBI\n    display_name: 'Another GeoCBI'\n")
+
+    add_indicator_library(library_file)
+    add_indicator_library(library_file)
+
+    assert 6 == len(get_indicators())
+    assert 'Extra Indicator' == get_indicator('extra').display_name
+    assert 'Geometrically Structured Composite Burned Index' == get_indicator('GeoCBI').display_name
+    # both libraries have been cached
+    assert 2 == len(os.listdir(os.path.join(str(tmpdir), 'cache')))
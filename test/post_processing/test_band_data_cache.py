@@ -0,0 +1,147 @@
+import numpy as np
+import pytest
+
+from collections import namedtuple
+from threading import Condition
+
+from multiply_post_processing.band_data_cache import BandDataCache, BandDataPrefetcher, CachingObservationsWrapper
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+BandData = namedtuple('BandData', 'observations uncertainty mask metadata emulator')
+
+
+def _create_band_data(value: float) -> BandData:
+    # 100 float64 values make up 800 bytes
+    return BandData(np.full((10, 10), value), None, None, {}, None)
+
+
+def test_get_loads_only_once():
+    cache = BandDataCache(10000)
+    loaded = []
+
+    def load():
+        loaded.append(1)
+        return _create_band_data(1.)
+
+    first_band_data = cache.get('a', load)
+    second_band_data = cache.get('a', load)
+
+    assert 1 == len(loaded)
+    assert first_band_data is second_band_data
+    assert 800 == cache.get_size()
+
+
+def test_get_makes_band_data_read_only():
+    cache = BandDataCache(10000)
+
+    band_data = cache.get('a', lambda: _create_band_data(1.))
+
+    with pytest.raises(ValueError):
+        band_data.observations[0, 0] = 2.
+
+
+def test_evicts_least_recently_used():
+    cache = BandDataCache(2000)
+    cache.get('a', lambda: _create_band_data(1.))
+    cache.get('b', lambda: _create_band_data(2.))
+    cache.get('a', lambda: _create_band_data(1.))
+    cache.get('c', lambda: _create_band_data(3.))
+
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+    assert 1600 == cache.get_size()
+
+
+def test_does_not_cache_band_data_exceeding_budget():
+    cache = BandDataCache(500)
+
+    cache.get('a', lambda: _create_band_data(1.))
+
+    assert 'a' not in cache
+    assert 0 == cache.get_size()
+
+
+class DummyObservations(object):
+
+    def __init__(self):
+        self.dates = ['2017-06-05', '2017-06-15']
+        self.num_reads = 0
+        self.no_data_values = {}
+        self._reads_changed = Condition()
+
+    def set_no_data_value(self, date, band_name, no_data_value):
+        self.no_data_values[(date, band_name)] = no_data_value
+
+    def get_band_data_by_name(self, date, band_name, retrieve_uncertainty=True):
+        with self._reads_changed:
+            self.num_reads += 1
+            self._reads_changed.notify_all()
+        return _create_band_data(self.no_data_values.get((date, band_name), 0.))
+
+    def wait_for_reads(self, num_reads):
+        with self._reads_changed:
+            assert self._reads_changed.wait_for(lambda: self.num_reads >= num_reads, timeout=10)
+
+
+def test_caching_observations_wrapper():
+    observations = DummyObservations()
+    cache = BandDataCache(10000)
+    wrapper = CachingObservationsWrapper(observations, cache, 'grid')
+    other_wrapper = CachingObservationsWrapper(observations, cache, 'grid')
+
+    assert ['2017-06-05', '2017-06-15'] == wrapper.dates
+    wrapper.get_band_data_by_name('2017-06-15', 'B11', False)
+    other_wrapper.get_band_data_by_name('2017-06-15', 'B11', False)
+    assert 1 == observations.num_reads
+
+    other_wrapper.set_no_data_value('2017-06-15', 'B11', -1.)
+    band_data = other_wrapper.get_band_data_by_name('2017-06-15', 'B11', False)
+    assert 2 == observations.num_reads
+    assert -1. == band_data.observations[0, 0]
+
+
+def test_prefetcher_reads_ahead():
+    observations = DummyObservations()
+    cache = BandDataCache(10000)
+    steps = [[('2017-06-05', 'B11', -1.)], [('2017-06-15', 'B11', -1.)], [('2017-06-25', 'B11', -1.)]]
+
+    prefetcher = BandDataPrefetcher(observations, cache, 'grid', steps, depth=1, num_steps_in_use=2)
+    observations.wait_for_reads(3)
+    wrapper = CachingObservationsWrapper(observations, cache, 'grid')
+    for date in ['2017-06-05', '2017-06-15', '2017-06-25']:
+        wrapper.set_no_data_value(date, 'B11', -1.)
+        band_data = wrapper.get_band_data_by_name(date, 'B11', False)
+        assert -1. == band_data.observations[0, 0]
+    prefetcher.close()
+
+    assert 3 == observations.num_reads
+
+
+def test_prefetcher_stays_within_depth():
+    observations = DummyObservations()
+    cache = BandDataCache(10000)
+    steps = [[('2017-06-05', 'B11', None)], [('2017-06-15', 'B11', None)], [('2017-06-25', 'B11', None)]]
+
+    prefetcher = BandDataPrefetcher(observations, cache, 'grid', steps, depth=0, num_steps_in_use=2)
+    observations.wait_for_reads(2)
+    assert 2 == observations.num_reads
+    prefetcher.advance()
+    observations.wait_for_reads(3)
+    prefetcher.close()
+
+    assert 3 == observations.num_reads
+
+
+def test_prefetcher_stops_on_close():
+    observations = DummyObservations()
+    cache = BandDataCache(10000)
+    steps = [[('2017-06-05', 'B11', None)], [('2017-06-15', 'B11', None)], [('2017-06-25', 'B11', None)]]
+
+    prefetcher = BandDataPrefetcher(observations, cache, 'grid', steps, depth=0, num_steps_in_use=2)
+    observations.wait_for_reads(2)
+    prefetcher.close()
+
+    # without an advance, the third step must not be read, not even once the prefetcher has been closed
+    assert 2 == observations.num_reads
@@ -1,8 +1,141 @@
-from multiply_post_processing.burned_severity_post_processor import BurnedSeverityPostProcessor
+import numpy as np
+
+from multiply_post_processing.burned_severity_post_processor import BurnedSeverityPostProcessor, calc_geo_cbi, \
+    calc_geo_cbi_statistics, calc_mirbi, calc_nbr, calc_nbr2, mask_values
+from multiply_post_processing.version import __version__
 
 
 __author__ = "Tonio Fincke (Brockmann Consult GmbH)"
 
+_NO_DATA = -9999
+_SCALE_FACTOR = 0.0001
+
+
+def _create_band(random_state, shape, low, high):
+    band = (random_state.uniform(low, high, shape) / _SCALE_FACTOR).astype(np.int16)
+    band[random_state.uniform(size=shape) < 0.05] = _NO_DATA
+    return band
+
+
+def _create_bands(shape):
+    random_state = np.random.RandomState(42)
+    smir_0 = _create_band(random_state, shape, 0.1, 0.3)
+    swir_0 = _create_band(random_state, shape, 0.05, 0.2)
+    nir_0 = _create_band(random_state, shape, 0.2, 0.4)
+    smir_1 = _create_band(random_state, shape, 0.1, 0.4)
+    swir_1 = _create_band(random_state, shape, 0.05, 0.35)
+    nir_1 = _create_band(random_state, shape, 0.05, 0.35)
+    # pixels where the index denominators vanish
+    smir_0[:2, :2] = 0
+    swir_0[:2, :2] = 0
+    return [smir_0, swir_0, nir_0, smir_1, swir_1, nir_1]
+
+
+def _derive_geo_cbi_for_whole_scene(smir_0, swir_0, nir_0, smir_1, swir_1, nir_1):
+    # the derivation as it has been done on whole scenes of reflectances
+    smir_0, swir_0, nir_0, smir_1, swir_1, nir_1 = [band.astype(np.int64)
+                                                    for band in [smir_0, swir_0, nir_0, smir_1, swir_1, nir_1]]
+    s_mask = (swir_1 != _NO_DATA) * (swir_0 != _NO_DATA) * ((smir_1 != _NO_DATA) * (smir_0 != _NO_DATA))
+    mirbi_1 = calc_mirbi(smir_1, swir_1, s_mask, _NO_DATA, _SCALE_FACTOR)
+    mean_mirbi_1 = mask_values(mirbi_1, _NO_DATA)
+    mirbi_0 = calc_mirbi(smir_0, swir_0, s_mask, _NO_DATA, _SCALE_FACTOR)
+    diff_mirbi = mirbi_1 - mirbi_0
+    diff_mirbi *= s_mask + _NO_DATA * np.invert(s_mask)
+    nbr2_1 = calc_nbr2(smir_1, swir_1, s_mask, _NO_DATA, _SCALE_FACTOR)
+    mean_nbr2_1 = mask_values(nbr2_1, _NO_DATA)
+    nbr2_0 = calc_nbr2(smir_0, swir_0, s_mask, _NO_DATA, _SCALE_FACTOR)
+    diff_nbr2 = (nbr2_1 - nbr2_0) * s_mask + _NO_DATA * np.invert(s_mask)
+    nir_mask = (nir_1 != _NO_DATA) * (nir_0 != _NO_DATA)
+    mean_nir_1 = mask_values(nir_1, _NO_DATA)
+    diff_nir = (nir_1 - nir_0) * nir_mask + _NO_DATA * np.invert(nir_mask)
+    burned_mask = s_mask * nir_mask * (mirbi_1 > mean_mirbi_1) * (diff_mirbi > 0.25) * (nbr2_1 < mean_nbr2_1) * \
+        (diff_nbr2 < -0.05) * (nir_1 < mean_nir_1) * (diff_nir < -0.01)
+    nbr_1 = calc_nbr(swir_1, nir_1, burned_mask, _NO_DATA, _SCALE_FACTOR)
+    nbr_0 = calc_nbr(swir_0, nir_0, burned_mask, _NO_DATA, _SCALE_FACTOR)
+    diff_nbr = (nbr_0 - nbr_1) * burned_mask + _NO_DATA * np.invert(burned_mask)
+    rbr = diff_nbr / (nbr_0 + 1.001)
+    geo_cbi = rbr * burned_mask + _NO_DATA * np.invert(burned_mask)
+    geo_cbi[geo_cbi != _NO_DATA] *= 2.80278
+    geo_cbi[geo_cbi != _NO_DATA] += 1.07541
+    geo_cbi[geo_cbi > 3.0] = 3.0
+    return geo_cbi
+
 
 def test_get_num_time_steps():
     assert 2 == BurnedSeverityPostProcessor.get_num_time_steps()
+
+
+def test_get_version():
+    assert BurnedSeverityPostProcessor.get_version().startswith(__version__ + '+r')
+
+
+def test_calc_geo_cbi():
+    shape = (61, 53)
+    bands = _create_bands(shape)
+    expected = _derive_geo_cbi_for_whole_scene(*bands)
+
+    for block_size in [1000, shape[0] * shape[1], 1 << 18]:
+        geo_cbi = calc_geo_cbi(*bands, _NO_DATA, _SCALE_FACTOR, block_size)
+        assert shape == geo_cbi.shape
+        assert np.float64 == geo_cbi.dtype
+        assert np.array_equal(expected == _NO_DATA, geo_cbi == _NO_DATA)
+        assert np.allclose(expected, geo_cbi, rtol=0.0, atol=1e-6)
+    assert np.any(expected != _NO_DATA)
+    assert np.any(expected == _NO_DATA)
+
+
+def test_calc_geo_cbi_from_reflectances():
+    bands = _create_bands((61, 53))
+    reflectances = [(band * _SCALE_FACTOR).astype(np.float32) for band in bands]
+
+    expected = calc_geo_cbi(*bands, _NO_DATA, _SCALE_FACTOR, 1000)
+    geo_cbi = calc_geo_cbi(*reflectances, _NO_DATA, _SCALE_FACTOR, 1000)
+
+    # reflectances are used as they are, which is only as precise as their data type
+    assert np.array_equal(expected == _NO_DATA, geo_cbi == _NO_DATA)
+    assert np.allclose(expected, geo_cbi, rtol=0.0, atol=1e-5)
+
+
+def test_calc_geo_cbi_from_mixed_bands():
+    bands = _create_bands((61, 53))
+    mixed_bands = [(band * _SCALE_FACTOR).astype(np.float32) if i % 2 == 0 else band for i, band in enumerate(bands)]
+
+    expected = calc_geo_cbi(*bands, _NO_DATA, _SCALE_FACTOR, 1000)
+    geo_cbi = calc_geo_cbi(*mixed_bands, _NO_DATA, _SCALE_FACTOR, 1000)
+
+    assert np.array_equal(expected == _NO_DATA, geo_cbi == _NO_DATA)
+    assert np.allclose(expected, geo_cbi, rtol=0.0, atol=1e-5)
+
+
+def test_calc_geo_cbi_on_parts_of_scene():
+    bands = _create_bands((61, 53))
+    expected = calc_geo_cbi(*bands, _NO_DATA, _SCALE_FACTOR, 1000)
+    parts = [[band[:20] for band in bands], [band[20:] for band in bands]]
+
+    statistics = BurnedSeverityPostProcessor.merge_statistics(
+        [calc_geo_cbi_statistics(*(part[:2] + part[3:]), _NO_DATA, _SCALE_FACTOR, 1000) for part in parts])
+    geo_cbi = np.concatenate([calc_geo_cbi(*part, _NO_DATA, _SCALE_FACTOR, 1000, statistics) for part in parts])
+
+    assert np.array_equal(expected, geo_cbi)
+    # thresholds derived per part differ from those of the scene
+    geo_cbi_of_parts = np.concatenate([calc_geo_cbi(*part, _NO_DATA, _SCALE_FACTOR, 1000) for part in parts])
+    assert not np.array_equal(expected, geo_cbi_of_parts)
+
+
+def test_calc_geo_cbi_statistics():
+    bands = _create_bands((61, 53))
+
+    statistics = calc_geo_cbi_statistics(*(bands[:2] + bands[3:]), _NO_DATA, _SCALE_FACTOR, 1000)
+
+    nir_1 = bands[5]
+    assert np.sum(nir_1 != _NO_DATA) == statistics['count_nir_1']
+    assert np.isclose(np.sum(nir_1[nir_1 != _NO_DATA], dtype=np.float64), statistics['sum_nir_1'])
+    assert statistics['count_mirbi_1'] >= statistics['count_nbr2_1'] > 0
+
+
+def test_calc_geo_cbi_without_valid_pixels():
+    bands = [np.full((20, 30), _NO_DATA, dtype=np.int16) for i in range(6)]
+
+    geo_cbi = calc_geo_cbi(*bands, _NO_DATA, _SCALE_FACTOR, 64)
+
+    assert np.all(geo_cbi == _NO_DATA)
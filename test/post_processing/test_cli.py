@@ -0,0 +1,21 @@
+from click.testing import CliRunner
+
+from multiply_post_processing.cli.cli import process_indicators, run_processor
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+
+def test_run_processor_rejects_compression_of_format():
+    result = CliRunner().invoke(run_processor, ['BurnedSeverity', './test/test_data/', '-sr', '10', '-f', 'NetCDF',
+                                                '-c', 'LZW'])
+
+    assert 2 == result.exit_code
+    assert 'Compression LZW not supported for NetCDF' in result.output
+
+
+def test_process_indicators_rejects_compression_of_format():
+    result = CliRunner().invoke(process_indicators, ['GeoCBI', './test/test_data/', '-sr', '10', '-f', 'NetCDF',
+                                                     '-c', 'LZW'])
+
+    assert 2 == result.exit_code
+    assert 'Compression LZW not supported for NetCDF' in result.output
@@ -0,0 +1,13 @@
+from multiply_post_processing.footprint import intersects
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+
+def test_intersects():
+    bounds = [-2.2, 39.0, -2.0, 39.1]
+
+    assert intersects(bounds, [-2.1, 39.05, -2.05, 39.06])
+    assert intersects(bounds, [-3.0, 38.0, -2.1, 39.05])
+    assert intersects(bounds, [-2.0, 39.1, -1.0, 40.0])
+    assert not intersects(bounds, [-1.9, 39.0, -1.0, 39.1])
+    assert not intersects(bounds, [-2.2, 39.2, -2.0, 39.3])
@@ -49,6 +49,16 @@ def test_pre_process():
     assert approx(sqrt_1_5) == a_cw[3]
 
 
+def test_pre_process_trait_keeps_trait():
+    trait = np.array([0.0, 1.0, 2.0, 3.0])
+    trait.setflags(write=False)
+
+    pre_processed_trait = _pre_process_trait(trait)
+
+    assert np.isnan(pre_processed_trait[0])
+    assert np.array_equal(np.array([0.0, 1.0, 2.0, 3.0]), trait)
+
+
 def test_scale_1d():
     trait_1d = np.array([0.0, 1.0, 2.0, 3.0])
 
@@ -0,0 +1,87 @@
+import gdal
+import pickle
+
+from multiply_post_processing.grid import get_source_subset, OutputGrid
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+GEO_TRANSFORM = (570000.0, 10.0, 0.0, 4330000.0, 0.0, -10.0)
+PROJECTION = 'EPSG:32630'
+
+
+def test_get_windows():
+    windows = OutputGrid(GEO_TRANSFORM, PROJECTION, 250, 120).get_windows(100)
+
+    assert 6 == len(windows)
+    assert (0, 0, 100, 100) == windows[0]
+    assert (100, 0, 100, 100) == windows[1]
+    assert (200, 0, 50, 100) == windows[2]
+    assert (0, 100, 100, 20) == windows[3]
+    assert (200, 100, 50, 20) == windows[5]
+
+
+def test_get_windows_without_tile_size():
+    windows = OutputGrid(GEO_TRANSFORM, PROJECTION, 250, 120).get_windows()
+
+    assert 1 == len(windows)
+    assert (0, 0, 250, 120) == windows[0]
+
+
+def test_get_bounds():
+    grid = OutputGrid(GEO_TRANSFORM, PROJECTION, 250, 120)
+
+    assert [570000.0, 4328800.0, 572500.0, 4330000.0] == grid.get_bounds()
+    assert [571000.0, 4328800.0, 571500.0, 4329000.0] == grid.get_bounds((100, 100, 50, 20))
+
+
+def test_get_window_grid():
+    window_grid = OutputGrid(GEO_TRANSFORM, PROJECTION, 250, 120).get_window_grid((100, 100, 50, 20))
+
+    assert (571000.0, 10.0, 0.0, 4329000.0, 0.0, -10.0) == window_grid.geo_transform
+    assert PROJECTION == window_grid.projection
+    assert 50 == window_grid.width
+    assert 20 == window_grid.height
+
+
+def test_get_geographic_bounds():
+    bounds = OutputGrid(GEO_TRANSFORM, 'EPSG:32630', 250, 120).get_geographic_bounds()
+
+    assert 4 == len(bounds)
+    assert abs(-2.1904 - bounds[0]) < 1e-3
+    assert abs(39.1053 - bounds[1]) < 1e-3
+    assert abs(-2.1614 - bounds[2]) < 1e-3
+    assert abs(39.1163 - bounds[3]) < 1e-3
+
+
+def _create_source_data_set(width: int, height: int):
+    dataset = gdal.GetDriverByName('MEM').Create('', width, height, 1, gdal.GDT_Float32)
+    dataset.SetGeoTransform(GEO_TRANSFORM)
+    dataset.SetProjection(OutputGrid(GEO_TRANSFORM, PROJECTION, width, height).get_srs().ExportToWkt())
+    return dataset
+
+
+def test_get_source_subset():
+    dataset = _create_source_data_set(1000, 1000)
+    window_grid = OutputGrid(GEO_TRANSFORM, PROJECTION, 1000, 1000).get_window_grid((100, 200, 50, 20))
+
+    subset = get_source_subset(dataset, window_grid)
+
+    assert 58 == subset.RasterXSize
+    assert 28 == subset.RasterYSize
+    assert (570960.0, 10.0, 0.0, 4328040.0, 0.0, -10.0) == subset.GetGeoTransform()
+
+
+def test_get_source_subset_of_covered_data_set():
+    dataset = _create_source_data_set(250, 120)
+
+    assert dataset is get_source_subset(dataset, OutputGrid(GEO_TRANSFORM, PROJECTION, 250, 120))
+
+
+def test_pickle():
+    grid = OutputGrid(GEO_TRANSFORM, PROJECTION, 250, 120)
+    grid.get_srs()
+
+    unpickled_grid = pickle.loads(pickle.dumps(grid))
+
+    assert grid == unpickled_grid
+    assert hash(grid) == hash(unpickled_grid)
@@ -0,0 +1,167 @@
+import os
+import time
+
+from multiply_core.util import FileRef
+
+import multiply_post_processing.input_index
+from multiply_post_processing.input_index import InputFileIndex
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+
+def _create_file(file_name: str, content: str = 'content'):
+    with open(file_name, 'w') as file:
+        file.write(content)
+
+
+def _mock_get_valid_files(monkeypatch, searched_file_names: list = None) -> list:
+    # files are valid for a data type when they are named after it, e.g., 'cdm_2017-06-05.tif'
+    searches = []
+
+    def is_valid(path, data_type):
+        return os.path.basename(path).startswith(data_type + '_') and path.endswith('.tif')
+
+    def get_valid_files(data_path, data_types):
+        searches.append(data_types)
+        file_refs = []
+        for root, directory_names, file_names in os.walk(data_path, followlinks=True):
+            directory_names.sort()
+            for file_name in sorted(file_names):
+                path = os.path.join(root, file_name)
+                if searched_file_names is not None:
+                    searched_file_names.append(file_name)
+                for data_type in data_types:
+                    if is_valid(path, data_type):
+                        date = os.path.splitext(file_name)[0].split('_')[1]
+                        file_refs.append(FileRef(path, date, date, 'image/tiff'))
+        return file_refs
+
+    monkeypatch.setattr(multiply_post_processing.input_index, 'is_valid', is_valid)
+    monkeypatch.setattr(multiply_post_processing.input_index, 'get_valid_files', get_valid_files)
+    return searches
+
+
+def _age(path: str):
+    # modification times of directories are only trusted once they are older than their resolution
+    past = time.time() - 10
+    os.utime(path, (past, past))
+
+
+def test_get_valid_files(tmpdir, monkeypatch):
+    searches = _mock_get_valid_files(monkeypatch)
+    data_path = str(tmpdir.mkdir('data'))
+    _create_file(os.path.join(data_path, 'cdm_2017-06-05.tif'))
+    _create_file(os.path.join(data_path, 'psoil_2017-06-05.tif'))
+    input_index = InputFileIndex(os.path.join(str(tmpdir), 'index.sqlite'))
+
+    file_refs = input_index.get_valid_files(data_path, ['cdm'])
+    assert 1 == len(file_refs)
+    assert os.path.join(data_path, 'cdm_2017-06-05.tif') == file_refs[0].url
+    assert '2017-06-05' == file_refs[0].start_time
+    assert [['cdm']] == searches
+
+    file_refs = InputFileIndex(os.path.join(str(tmpdir), 'index.sqlite')).get_valid_files(data_path, ['cdm'])
+    assert 1 == len(file_refs)
+    assert [['cdm']] == searches
+
+    _create_file(os.path.join(data_path, 'cdm_2017-06-15.tif'))
+    file_refs = input_index.get_valid_files(data_path, ['cdm'])
+    assert ['2017-06-05', '2017-06-15'] == [file_ref.start_time for file_ref in file_refs]
+    assert [['cdm'], ['cdm']] == searches
+
+
+def test_get_valid_files_revalidates_only_changes(tmpdir, monkeypatch):
+    searches = _mock_get_valid_files(monkeypatch)
+    data_path = str(tmpdir.mkdir('data'))
+    sub_path = os.path.join(data_path, 'sub')
+    os.mkdir(sub_path)
+    _create_file(os.path.join(data_path, 'cdm_2017-06-05.tif'))
+    _create_file(os.path.join(sub_path, 'cdm_2017-06-15.tif'))
+    _age(sub_path)
+    _age(data_path)
+    input_index = InputFileIndex(os.path.join(str(tmpdir), 'index.sqlite'))
+    assert 2 == len(input_index.get_valid_files(data_path, ['cdm']))
+    assert [['cdm']] == searches
+
+    # neither removed files nor added files that are not valid require a search
+    os.remove(os.path.join(data_path, 'cdm_2017-06-05.tif'))
+    _create_file(os.path.join(sub_path, 'notes.txt'))
+    file_refs = input_index.get_valid_files(data_path, ['cdm'])
+    assert [os.path.join(sub_path, 'cdm_2017-06-15.tif')] == [file_ref.url for file_ref in file_refs]
+    assert [['cdm']] == searches
+
+    # an added directory is recorded with its content
+    new_path = os.path.join(data_path, 'new')
+    os.mkdir(new_path)
+    _create_file(os.path.join(new_path, 'cdm_2017-06-25.tif'))
+    file_refs = input_index.get_valid_files(data_path, ['cdm'])
+    assert ['2017-06-15', '2017-06-25'] == sorted([file_ref.start_time for file_ref in file_refs])
+    assert [['cdm'], ['cdm']] == searches
+
+    os.remove(os.path.join(new_path, 'cdm_2017-06-25.tif'))
+    os.rmdir(new_path)
+    file_refs = input_index.get_valid_files(data_path, ['cdm'])
+    assert ['2017-06-15'] == [file_ref.start_time for file_ref in file_refs]
+    assert [['cdm'], ['cdm']] == searches
+
+
+def test_get_data_files_by_date(tmpdir, monkeypatch):
+    _mock_get_valid_files(monkeypatch)
+    data_path = str(tmpdir)
+    _create_file(os.path.join(data_path, 'cdm_2017-06-05.tif'))
+    _create_file(os.path.join(data_path, 'psoil_2017-06-05.tif'))
+    _create_file(os.path.join(data_path, 'cdm_2017-06-15.tif'))
+    # the index is kept in the data path itself, which must not make the data path appear changed
+    input_index = InputFileIndex(os.path.join(data_path, 'index.sqlite'))
+
+    data_files_by_date = input_index.get_data_files_by_date(data_path, ['cdm', 'psoil'])
+
+    assert ['2017-06-05', '2017-06-15'] == sorted(data_files_by_date.keys())
+    assert {'cdm': os.path.join(data_path, 'cdm_2017-06-05.tif'),
+            'psoil': os.path.join(data_path, 'psoil_2017-06-05.tif')} == data_files_by_date['2017-06-05']
+    assert {'cdm': os.path.join(data_path, 'cdm_2017-06-15.tif')} == data_files_by_date['2017-06-15']
+
+
+def test_get_intersecting_urls(tmpdir, monkeypatch):
+    footprints = {'inside.tif': [-2.2, 39.0, -2.0, 39.1], 'outside.tif': [10.0, 50.0, 11.0, 51.0],
+                  'unknown.tif': None}
+    urls = []
+    for file_name in footprints:
+        urls.append(os.path.join(str(tmpdir), file_name))
+        _create_file(urls[-1])
+    reads = []
+
+    def get_footprint(url):
+        reads.append(url)
+        return footprints[os.path.basename(url)]
+
+    monkeypatch.setattr(multiply_post_processing.input_index, 'get_footprint', get_footprint)
+    input_index = InputFileIndex(os.path.join(str(tmpdir), 'index.sqlite'))
+
+    assert [urls[0], urls[2]] == input_index.get_intersecting_urls(urls, [-2.12, 39.05, -2.09, 39.07])
+    assert [urls[1], urls[2]] == input_index.get_intersecting_urls(urls, [10.5, 50.5, 12.0, 52.0])
+    assert 3 == len(reads)
+
+
+def test_get_valid_files_searches_only_added_entries(tmpdir, monkeypatch):
+    searched_file_names = []
+    searches = _mock_get_valid_files(monkeypatch, searched_file_names)
+    data_path = str(tmpdir.mkdir('data'))
+    _create_file(os.path.join(data_path, 'cdm_2017-06-05.tif'))
+    _create_file(os.path.join(data_path, 'cdm_2017-06-15.tif'))
+    _age(data_path)
+    input_index = InputFileIndex(os.path.join(str(tmpdir), 'index.sqlite'))
+    assert 2 == len(input_index.get_valid_files(data_path, ['cdm']))
+    del searched_file_names[:]
+
+    _create_file(os.path.join(data_path, 'cdm_2017-06-25.tif'))
+    new_path = os.path.join(data_path, 'new')
+    os.mkdir(new_path)
+    _create_file(os.path.join(new_path, 'cdm_2017-07-05.tif'))
+    file_refs = input_index.get_valid_files(data_path, ['cdm'])
+
+    assert [['cdm'], ['cdm']] == searches
+    assert ['cdm_2017-06-25.tif', 'cdm_2017-07-05.tif'] == sorted(searched_file_names)
+    assert [os.path.join(data_path, 'cdm_2017-06-05.tif'), os.path.join(data_path, 'cdm_2017-06-15.tif'),
+            os.path.join(data_path, 'cdm_2017-06-25.tif'), os.path.join(new_path, 'cdm_2017-07-05.tif')] == \
+        sorted([file_ref.url for file_ref in file_refs])
@@ -0,0 +1,101 @@
+import json
+import os
+
+from multiply_post_processing.instrumentation import get_instrumentation, instrument, Instrumentation, stage
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+
+def test_stage():
+    instrumentation = Instrumentation()
+
+    with instrumentation.stage('read', pixels=100) as counts:
+        counts['bytes_read'] = 400
+    with instrumentation.stage('read', pixels=50, bytes_read=200):
+        pass
+
+    stages = instrumentation.get_snapshot()['stages']
+    assert ['read'] == list(stages)
+    assert 2 == stages['read']['calls']
+    assert 150 == stages['read']['pixels']
+    assert 600 == stages['read']['bytes_read']
+    assert 0 == stages['read']['bytes_written']
+    assert stages['read']['wall_time'] >= 0
+
+
+def test_nested_stages_are_not_counted_for_enclosing_stage():
+    instrumentation = Instrumentation()
+
+    with instrumentation.stage('compute.dummy'):
+        with instrumentation.stage('read'):
+            pass
+        instrumentation.add('compute.indicator', nested=True, calls=1, wall_time=100.0)
+
+    stages = instrumentation.get_snapshot()['stages']
+    assert stages['compute.dummy']['wall_time'] < 0
+    assert 100.0 == stages['compute.indicator']['wall_time']
+
+
+def test_merge():
+    instrumentation = Instrumentation()
+    instrumentation.add('write', calls=1, wall_time=2.0, bytes_written=100, pixels=25)
+
+    instrumentation.merge({'stages': {'write': {'calls': 2, 'wall_time': 3.0, 'bytes_read': 0, 'bytes_written': 300,
+                                                'pixels': 75}},
+                           'peak_rss': 1024})
+
+    record = instrumentation.get_record(1, 4)
+    assert 3 == record['stages']['write']['calls']
+    assert 400 == record['stages']['write']['bytes_written']
+    assert 20.0 == record['stages']['write']['pixels_per_second']
+    assert 1024 == record['peak_worker_rss']
+    assert 1 == record['done']
+    assert 4 == record['total']
+    assert record['eta'] >= 0
+
+
+def test_report_json_lines(tmpdir):
+    metrics_path = os.path.join(str(tmpdir), 'metrics.jsonl')
+
+    with instrument(metrics_path) as instrumentation:
+        assert instrumentation is get_instrumentation()
+        with stage('discovery'):
+            pass
+        instrumentation.report(0, 2)
+        # reports are skipped when the last one is too recent, unless forced
+        instrumentation.report(1, 2)
+        instrumentation.report(2, 2, force=True)
+    assert get_instrumentation() is None
+
+    with open(metrics_path, 'r') as metrics_file:
+        records = [json.loads(line) for line in metrics_file]
+    assert 2 == len(records)
+    assert 0 == records[0]['done']
+    assert records[0]['eta'] is None
+    assert 2 == records[1]['done']
+    assert 0 == records[1]['eta']
+    assert 1 == records[1]['stages']['discovery']['calls']
+
+
+def test_report_prometheus_textfile(tmpdir):
+    metrics_path = os.path.join(str(tmpdir), 'metrics.prom')
+    instrumentation = Instrumentation(metrics_path)
+    instrumentation.add('read', calls=1, wall_time=0.5, bytes_read=2048, pixels=512)
+
+    instrumentation.report(1, 2)
+
+    with open(metrics_path, 'r') as metrics_file:
+        lines = metrics_file.read().splitlines()
+    assert 'multiply_post_processing_stage_bytes_read_total{stage="read"} 2048' in lines
+    assert 'multiply_post_processing_stage_pixels_total{stage="read"} 512' in lines
+    assert 'multiply_post_processing_done 1' in lines
+    assert 'multiply_post_processing_total 2' in lines
+    assert '# TYPE multiply_post_processing_eta gauge' in lines
+    assert not os.path.exists(metrics_path + '.tmp')
+
+
+def test_stage_without_instrumentation():
+    assert get_instrumentation() is None
+
+    with stage('read', pixels=10) as counts:
+        counts['bytes_read'] = 40
@@ -0,0 +1,138 @@
+import numpy as np
+import os
+
+from datetime import datetime
+from multiply_post_processing.manifest import JOURNAL_FILE_NAME, MANIFEST_FILE_NAME, OutputManifest
+from multiply_post_processing.writers import get_time_step, NetCDFDataCubeWriter
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+PARAMETERS = {'indicators': ['indicator_1'], 'spatial_resolution': 10, 'roi_grid': 'EPSG:4326'}
+
+
+def _create_file(file_name: str, content: str = 'content'):
+    with open(file_name, 'w') as file:
+        file.write(content)
+
+
+def test_manifest(tmpdir):
+    output_path = str(tmpdir)
+    input_file = os.path.join(output_path, 'input.tif')
+    output_file = os.path.join(output_path, 'indicator_1_20170605.tif')
+    _create_file(input_file)
+    _create_file(output_file)
+    manifest = OutputManifest(output_path, 'dummy', '0.1', PARAMETERS)
+
+    assert not manifest.is_done('20170605', [input_file])
+    manifest.mark_done('20170605', [input_file], [output_file])
+    assert manifest.is_done('20170605', [input_file])
+
+    manifest = OutputManifest(output_path, 'dummy', '0.1', PARAMETERS)
+    assert manifest.is_done('20170605', [input_file])
+    assert not manifest.is_done('20170615', [input_file])
+    assert not OutputManifest(output_path, 'other', '0.1', PARAMETERS).is_done('20170605', [input_file])
+
+
+def test_manifest_discards_results_when_parameters_or_version_change(tmpdir):
+    output_path = str(tmpdir)
+    input_file = os.path.join(output_path, 'input.tif')
+    _create_file(input_file)
+    OutputManifest(output_path, 'dummy', '0.1', PARAMETERS).mark_done('20170605', [input_file], [])
+
+    assert not OutputManifest(output_path, 'dummy', '0.2', PARAMETERS).is_done('20170605', [input_file])
+    changed_parameters = dict(PARAMETERS, spatial_resolution=20)
+    assert not OutputManifest(output_path, 'dummy', '0.1', changed_parameters).is_done('20170605', [input_file])
+
+
+def test_manifest_detects_changed_inputs_and_missing_outputs(tmpdir):
+    output_path = str(tmpdir)
+    input_file = os.path.join(output_path, 'input.tif')
+    output_file = os.path.join(output_path, 'indicator_1_20170605.tif')
+    _create_file(input_file)
+    _create_file(output_file)
+    manifest = OutputManifest(output_path, 'dummy', '0.1', PARAMETERS)
+    manifest.mark_done('20170605', [input_file], [output_file])
+
+    _create_file(input_file, 'changed content')
+    assert not manifest.is_done('20170605', [input_file])
+
+    manifest.mark_done('20170605', [input_file], [output_file])
+    os.remove(output_file)
+    assert not manifest.is_done('20170605', [input_file])
+
+
+def test_manifest_detects_changed_files_in_input_directories(tmpdir):
+    output_path = str(tmpdir)
+    input_directory = os.path.join(output_path, 'S2A_MSIL2A_20170605.SAFE')
+    os.makedirs(os.path.join(input_directory, 'GRANULE'))
+    band_file = os.path.join(input_directory, 'GRANULE', 'B8A_sur.tif')
+    _create_file(band_file)
+    manifest = OutputManifest(output_path, 'dummy', '0.1', PARAMETERS)
+    manifest.mark_done('20170605', [input_directory], [])
+    assert manifest.is_done('20170605', [input_directory])
+
+    _create_file(band_file, 'changed content')
+    assert not manifest.is_done('20170605', [input_directory])
+
+
+def test_manifest_checks_time_steps_of_data_cubes(tmpdir):
+    output_path = str(tmpdir)
+    input_file = os.path.join(output_path, 'input.tif')
+    output_file = os.path.join(output_path, 'indicator_1.nc')
+    _create_file(input_file)
+    writer = NetCDFDataCubeWriter([output_file], ['indicator_1'], (570050.0, 10.0, 0.0, 4329950.0, 0.0, -10.0),
+                                  'EPSG:32630', 4, 3)
+    writer.write([np.ones((3, 4))], datetime(2017, 6, 5))
+    writer.close()
+    manifest = OutputManifest(output_path, 'dummy', '0.1', PARAMETERS)
+    manifest.mark_done('20170605', [input_file], [output_file], get_time_step(datetime(2017, 6, 5)))
+    # e.g., a run that has been interrupted before the time step has been added
+    manifest.mark_done('20170615', [input_file], [output_file], get_time_step(datetime(2017, 6, 15)))
+
+    manifest = OutputManifest(output_path, 'dummy', '0.1', PARAMETERS)
+    assert manifest.is_done('20170605', [input_file])
+    assert not manifest.is_done('20170615', [input_file])
+
+
+def test_manifests_of_several_post_processors_share_file(tmpdir):
+    output_path = str(tmpdir)
+    input_file = os.path.join(output_path, 'input.tif')
+    _create_file(input_file)
+    manifest = OutputManifest(output_path, 'dummy', '0.1', PARAMETERS)
+    other_manifest = OutputManifest(output_path, 'other', '0.1', PARAMETERS)
+
+    manifest.mark_done('20170605', [input_file], [])
+    other_manifest.mark_done('20170615', [input_file], [])
+
+    assert OutputManifest(output_path, 'dummy', '0.1', PARAMETERS).is_done('20170605', [input_file])
+    assert OutputManifest(output_path, 'other', '0.1', PARAMETERS).is_done('20170615', [input_file])
+
+
+def test_manifest_merges_journal_on_close(tmpdir):
+    output_path = str(tmpdir)
+    input_file = os.path.join(output_path, 'input.tif')
+    _create_file(input_file)
+    manifest = OutputManifest(output_path, 'dummy', '0.1', PARAMETERS)
+    manifest.mark_done('20170605', [input_file], [])
+    manifest.mark_done('20170615', [input_file], [])
+
+    assert os.path.exists(os.path.join(output_path, JOURNAL_FILE_NAME))
+    manifest.close()
+    assert not os.path.exists(os.path.join(output_path, JOURNAL_FILE_NAME))
+    assert os.path.exists(os.path.join(output_path, MANIFEST_FILE_NAME))
+    manifest = OutputManifest(output_path, 'dummy', '0.1', PARAMETERS)
+    assert manifest.is_done('20170605', [input_file])
+    assert manifest.is_done('20170615', [input_file])
+
+
+def test_manifest_skips_incomplete_journal_record(tmpdir):
+    output_path = str(tmpdir)
+    input_file = os.path.join(output_path, 'input.tif')
+    _create_file(input_file)
+    OutputManifest(output_path, 'dummy', '0.1', PARAMETERS).mark_done('20170605', [input_file], [])
+    with open(os.path.join(output_path, JOURNAL_FILE_NAME), 'a') as journal_file:
+        journal_file.write('{"name": "dummy", "vers')
+
+    manifest = OutputManifest(output_path, 'dummy', '0.1', PARAMETERS)
+    assert manifest.is_done('20170605', [input_file])
+    assert not os.path.exists(os.path.join(output_path, JOURNAL_FILE_NAME))
@@ -1,15 +1,27 @@
 from typing import List, Optional
 
+import gdal
 import numpy as np
 import os
+import osr
+import pytest
 import shutil
 
-from multiply_core.observations import get_valid_files
+from multiply_core.observations import DataTypeConstants, get_valid_files
 from multiply_core.util import FileRef
 from multiply_core.variables import Variable
 import multiply_post_processing
-from multiply_post_processing import PostProcessorCreator, VariablePostProcessor, PostProcessorType
-from multiply_post_processing.post_processing import _group_file_refs_by_date, run_post_processing
+import multiply_post_processing.footprint
+from multiply_post_processing import EODataPostProcessor, PostProcessorCreator, VariablePostProcessor, \
+    PostProcessorType
+import multiply_post_processing.post_processing
+from multiply_post_processing.burned_severity_post_processor import BurnedSeverityPostProcessor
+from multiply_post_processing.post_processing import _get_band_data_cache, _get_file_refs_in_time_range, \
+    _get_intersecting_urls, _get_observations_window_tasks, _get_scene_statistics, _group_file_refs_by_date, \
+    _iterate_observations_window, _map_tasks, _plan_post_processors, _process_variables_of_date, \
+    _release_band_data_cache, _read_variables, iterate_post_processing, run_post_processing
+from multiply_post_processing.result_cache import ResultCache
+from multiply_post_processing.grid import OutputGrid
 
 __author__ = "Tonio Fincke (Brockmann Consult GmbH)"
 
@@ -49,6 +61,167 @@ def test_group_file_refs_by_date():
     assert 2 == len(file_refs_by_date['1999-01-03'])
 
 
+def test_get_file_refs_in_time_range():
+    file_refs = [FileRef('1', '1999-01-01', '1999-01-01', 'image/tiff'),
+                 FileRef('2', '1999-01-02', '1999-01-02', 'image/tiff'),
+                 FileRef('3', '1999-01-03', '1999-01-03', 'image/tiff'),
+                 FileRef('4', '1999-01-04', '1999-01-04', 'image/tiff')
+                 ]
+    file_refs_in_time_range = _get_file_refs_in_time_range(file_refs, '1999-01-02', '1999-01-03')
+
+    assert 2 == len(file_refs_in_time_range)
+    assert '2' == file_refs_in_time_range[0].url
+    assert '3' == file_refs_in_time_range[1].url
+
+
+def test_map_tasks():
+    tasks = [(2, 3), (3, 2), (4, 1), (5, 0), (6, 2)]
+
+    expected = [(0, 8), (1, 9), (2, 4), (3, 1), (4, 36)]
+    assert expected == list(_map_tasks(pow, tasks))
+    assert expected == list(_map_tasks(pow, tasks, workers=2))
+    assert expected == sorted(_map_tasks(pow, tasks, workers=2, ordered=False))
+
+
+def test_release_band_data_cache():
+    band_data_cache = _get_band_data_cache('run_1', 1)
+    assert band_data_cache is _get_band_data_cache('run_1', 1)
+
+    _release_band_data_cache('run_2')
+    assert band_data_cache is _get_band_data_cache('run_1', 1)
+
+    _release_band_data_cache('run_1')
+    assert band_data_cache is not _get_band_data_cache('run_1', 1)
+    _release_band_data_cache('run_1')
+
+
+def _derive_dummy_statistics_of_window(post_processors, pairs_of_post_processors, file_refs, grid, window, run_id,
+                                       band_cache_size):
+    return [(index, start, end, {'sum': window[0], 'count': 1})
+            for index, pairs_of_post_processor in enumerate(pairs_of_post_processors)
+            for start, end in pairs_of_post_processor]
+
+
+def test_get_scene_statistics(monkeypatch):
+    monkeypatch.setattr(multiply_post_processing.post_processing, '_derive_statistics_of_window',
+                        _derive_dummy_statistics_of_window)
+    file_refs = [FileRef(str(day), f'1999-01-0{day}', f'1999-01-0{day}', 'image/tiff') for day in range(1, 5)]
+    pairs = [('1999-01-01', '1999-01-02'), ('1999-01-02', '1999-01-03'), ('1999-01-03', '1999-01-04')]
+    windows = [(0, 0, 10, 10), (10, 0, 10, 10), (20, 0, 5, 10)]
+
+    statistics = _get_scene_statistics([BurnedSeverityPostProcessor([])], [pairs], file_refs, None, windows, 1,
+                                       'run', 1)
+
+    assert {(0, start, end) for start, end in pairs} == set(statistics)
+    for key in statistics:
+        assert {'sum': 30, 'count': 3} == statistics[key]
+
+
+def test_get_observations_window_tasks_hands_over_statistics_of_pairs():
+    file_refs = [FileRef(str(day), f'1999-01-0{day}', f'1999-01-0{day}', 'image/tiff') for day in range(1, 6)]
+    pairs = [('1999-01-01', '1999-01-02'), ('1999-01-02', '1999-01-03'), ('1999-01-03', '1999-01-04'),
+             ('1999-01-04', '1999-01-05')]
+    statistics = {(0, start, end): {'sum': i} for i, (start, end) in enumerate(pairs)}
+
+    tasks = _get_observations_window_tasks([BurnedSeverityPostProcessor([])], [pairs], file_refs, None,
+                                           [(0, 0, 10, 10), (10, 0, 10, 10)], 2, 'run', 1, 0, None, statistics)
+
+    assert 4 == len(tasks)
+    for task in tasks:
+        pairs_of_task = task[1][0]
+        assert 2 == len(pairs_of_task)
+        assert {(0, start, end): statistics[(0, start, end)] for start, end in pairs_of_task} == task[-2]
+        assert [(0, 0, 10, 10), (10, 0, 10, 10)] == task[-1]
+
+
+class _Observations(object):
+
+    def __init__(self, dates):
+        self.dates = dates
+
+    def get_observations_subset(self, start, end):
+        return _Observations([start, end])
+
+
+class _ObservationsFactory(object):
+
+    def create_observations(self, file_refs, reprojection):
+        return _Observations([file_ref.start_time for file_ref in file_refs])
+
+
+class StatisticsPostProcessor(EODataPostProcessor):
+
+    @classmethod
+    def get_num_time_steps(cls) -> int:
+        return 2
+
+    @classmethod
+    def get_name(cls) -> str:
+        return 'statistics'
+
+    @classmethod
+    def get_description(cls) -> str:
+        return 'A post processor that depends on statistics of the scene'
+
+    @classmethod
+    def get_indicator_descriptions(cls) -> List[Variable]:
+        return _INDICATOR_DESCRIPTIONS
+
+    @classmethod
+    def get_names_of_supported_eo_data_types(cls) -> List[str]:
+        return []
+
+    @classmethod
+    def get_names_of_required_bands(cls, data_type: str) -> List[str]:
+        return []
+
+    def process_observations(self, observations, statistics: Optional[dict] = None) -> dict:
+        return {'indicator_1': np.array([-1 if statistics is None else statistics['sum']])}
+
+
+def test_iterate_observations_window_derives_missing_statistics(tmpdir, monkeypatch):
+    monkeypatch.setattr(multiply_post_processing.post_processing, '_derive_statistics_of_window',
+                        _derive_dummy_statistics_of_window)
+    monkeypatch.setattr(multiply_post_processing.post_processing, 'ObservationsFactory', _ObservationsFactory)
+    monkeypatch.setattr(OutputGrid, 'get_reprojection', lambda grid, window=None: None)
+    grid = OutputGrid((570050.0, 10.0, 0.0, 4329950.0, 0.0, -10.0), 'EPSG:32630', 20, 10)
+    windows = [(0, 0, 10, 10), (10, 0, 10, 10)]
+    file_refs = [FileRef(str(day), f'1999-01-0{day}', f'1999-01-0{day}', 'image/tiff') for day in range(1, 3)]
+    result_cache = ResultCache(str(tmpdir), 1 << 20)
+
+    # the pair has no statistics, as if it had been left out of the statistics pass
+    results = list(_iterate_observations_window([StatisticsPostProcessor([])], [[('1999-01-01', '1999-01-02')]],
+                                                file_refs, grid, windows[0], 'run', 1, 0, result_cache, {}, windows))
+
+    assert 1 == len(results)
+    np.testing.assert_array_equal(np.array([10]), results[0][3]['indicator_1'])
+
+
+def _create_product(product_path: str, geo_transform: tuple, projection: str):
+    os.makedirs(product_path)
+    with open(os.path.join(product_path, 'metadata.xml'), 'w') as metadata_file:
+        metadata_file.write('<metadata/>')
+    dataset = gdal.GetDriverByName('GTiff').Create(os.path.join(product_path, 'B11_sur.tif'), 10, 10, 1,
+                                                   gdal.GDT_Int16)
+    dataset.SetGeoTransform(geo_transform)
+    dataset.SetProjection(projection)
+    dataset = None
+
+
+def test_get_intersecting_urls_of_product_directories(tmpdir, monkeypatch):
+    monkeypatch.setattr(multiply_post_processing.footprint, 'get_valid_type', lambda path: DataTypeConstants.AWS_S2_L2)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32630)
+    inside_product_path = os.path.join(str(tmpdir), 'inside')
+    _create_product(inside_product_path, (570000.0, 20.0, 0.0, 4330000.0, 0.0, -20.0), srs.ExportToWkt())
+    srs.ImportFromEPSG(32632)
+    outside_product_path = os.path.join(str(tmpdir), 'outside')
+    _create_product(outside_product_path, (500000.0, 20.0, 0.0, 4500000.0, 0.0, -20.0), srs.ExportToWkt())
+    grid = OutputGrid((570050.0, 10.0, 0.0, 4329950.0, 0.0, -10.0), 'EPSG:32630', 10, 10)
+
+    assert [inside_product_path] == _get_intersecting_urls([inside_product_path, outside_product_path], grid)
+
+
 def test_get_valid_files():
     data_path = './test/test_data/'
     cab_files = get_valid_files(data_path, ['cab'])
@@ -100,6 +273,82 @@ def test_run_post_processing():
             shutil.rmtree(output_path)
 
 
+def test_run_post_processing_rejects_compression_of_format():
+    with pytest.raises(ValueError):
+        run_post_processing(['indicator_1'], data_path='./test/test_data/', output_path='./test/test_data/output/',
+                            roi=ROI, spatial_resolution=SPATIAL_RESOLUTION, variable_names=['cdm', 'psoil'],
+                            roi_grid=ROI_GRID, destination_grid=DESTINATION_GRID, output_format='NetCDF',
+                            compression='LZW')
+    assert not os.path.exists('./test/test_data/output/')
+
+
+def test_iterate_post_processing():
+    results = list(iterate_post_processing(['indicator_1'], data_path='./test/test_data/', roi=ROI,
+                                           spatial_resolution=SPATIAL_RESOLUTION, variable_names=['cdm', 'psoil'],
+                                           roi_grid=ROI_GRID, destination_grid=DESTINATION_GRID))
+
+    assert 2 == len(results)
+    assert ['indicator_1', 'indicator_1'] == [result[0] for result in results]
+    assert ['20170605', '20170615'] == sorted([result[1][0].strftime('%Y%m%d') for result in results])
+    for indicator_name, time_range, array, grid in results:
+        assert time_range[0] == time_range[1]
+        assert (grid.height, grid.width) == array.shape
+
+
+def test_plan_post_processors():
+    post_processor_1 = DummyPostProcessor(['indicator_1'])
+    post_processor_2 = DummyPostProcessor(['indicator_2'])
+
+    groups = _plan_post_processors([post_processor_1, post_processor_2])
+
+    assert 1 == len(groups)
+    assert [post_processor_1, post_processor_2] == groups[0]
+
+
+def test_read_variables(tmpdir):
+    geo_transform = (570000.0, 10.0, 0.0, 4330000.0, 0.0, -10.0)
+    grid = OutputGrid(geo_transform, 'EPSG:32630', 20, 10)
+    data_files = {}
+    for i, variable_name in enumerate(['cdm', 'psoil']):
+        data_files[variable_name] = os.path.join(str(tmpdir), '{}.tif'.format(variable_name))
+        dataset = gdal.GetDriverByName('GTiff').Create(data_files[variable_name], 40, 40, 1, gdal.GDT_Float32)
+        dataset.SetGeoTransform(geo_transform)
+        dataset.SetProjection(grid.get_srs().ExportToWkt())
+        dataset.GetRasterBand(1).WriteArray(np.full((40, 40), i + 1, dtype=np.float32))
+        dataset = None
+
+    variable_data = _read_variables(data_files, grid)
+
+    assert ['cdm', 'psoil'] == list(variable_data)
+    np.testing.assert_array_equal(np.full((10, 20), 1), variable_data['cdm'])
+    np.testing.assert_array_equal(np.full((10, 20), 2), variable_data['psoil'])
+    # the variables are views on a single buffer
+    assert variable_data['cdm'].base is variable_data['psoil'].base
+
+
+def test_read_variables_keeps_data_types(tmpdir):
+    geo_transform = (570000.0, 10.0, 0.0, 4330000.0, 0.0, -10.0)
+    grid = OutputGrid(geo_transform, 'EPSG:32630', 20, 10)
+    data_files = {}
+    for variable_name, data_type, value in [('cdm', gdal.GDT_Float32, 0.5), ('lai', gdal.GDT_Int16, 300),
+                                            ('psoil', gdal.GDT_Float32, 1.5)]:
+        data_files[variable_name] = os.path.join(str(tmpdir), '{}.tif'.format(variable_name))
+        dataset = gdal.GetDriverByName('GTiff').Create(data_files[variable_name], 40, 40, 1, data_type)
+        dataset.SetGeoTransform(geo_transform)
+        dataset.SetProjection(grid.get_srs().ExportToWkt())
+        dataset.GetRasterBand(1).Fill(value)
+        dataset = None
+
+    variable_data = _read_variables(data_files, grid, num_threads=2)
+
+    assert ['cdm', 'lai', 'psoil'] == list(variable_data)
+    assert np.float32 == variable_data['cdm'].dtype
+    assert np.int16 == variable_data['lai'].dtype
+    np.testing.assert_array_equal(np.full((10, 20), 300), variable_data['lai'])
+    np.testing.assert_array_equal(np.full((10, 20), 1.5), variable_data['psoil'])
+    assert variable_data['cdm'].base is variable_data['psoil'].base
+
+
 class DummyPostProcessor(VariablePostProcessor):
 
     @classmethod
@@ -131,6 +380,42 @@ class DummyPostProcessor(VariablePostProcessor):
         return result
 
 
+class RecordingPostProcessor(DummyPostProcessor):
+
+    def __init__(self, indicator_names: List[str]):
+        super().__init__(indicator_names)
+        self.recorded_variable_data = None
+
+    def process_variables(self, variable_data: dict, masks: Optional[np.array] = None) -> dict:
+        self.recorded_variable_data = {name: (array.copy(), array.flags.writeable)
+                                       for name, array in variable_data.items()}
+        try:
+            variable_data['cdm'][0, 0] = 0
+        except ValueError:
+            pass
+        return super().process_variables(variable_data, masks)
+
+
+def test_process_variables_of_date_keeps_input_unchanged(monkeypatch):
+    buffer = np.arange(2 * 10 * 20, dtype=np.float32).reshape((2, 10, 20)) + 1
+    expected = {'cdm': buffer[0].copy(), 'psoil': buffer[1].copy()}
+    monkeypatch.setattr(multiply_post_processing.post_processing, '_read_variables',
+                        lambda data_files, grid, num_threads: {'cdm': buffer[0], 'psoil': buffer[1]})
+    post_processors = [RecordingPostProcessor(['indicator_1']), RecordingPostProcessor(['indicator_1'])]
+
+    grid = OutputGrid((570050.0, 10.0, 0.0, 4329950.0, 0.0, -10.0), 'EPSG:32630', 20, 10)
+
+    indicator_dicts = _process_variables_of_date(post_processors, {'cdm': 'cdm.tif', 'psoil': 'psoil.tif'}, grid)
+
+    for post_processor in post_processors:
+        for name in expected:
+            array, writeable = post_processor.recorded_variable_data[name]
+            np.testing.assert_array_equal(expected[name], array)
+            assert not writeable
+    np.testing.assert_array_equal(indicator_dicts[0]['indicator_1'], indicator_dicts[1]['indicator_1'])
+    np.testing.assert_array_equal(expected['cdm'], buffer[0])
+
+
 class DummyPostProcessorCreator(PostProcessorCreator):
 
     @classmethod
@@ -0,0 +1,65 @@
+import os
+import pstats
+
+from multiply_post_processing.instrumentation import instrument, Instrumentation, stage
+from multiply_post_processing.profiling import get_profile_path, StageProfiler
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+
+def _allocate():
+    return [bytearray(1024) for i in range(100)]
+
+
+def _compute():
+    return sum([i * i for i in range(1000)])
+
+
+def test_stage_profiler(tmpdir):
+    profiler = StageProfiler()
+    try:
+        profiler.enter('compute.dummy')
+        _compute()
+        profiler.enter('read')
+        data = _allocate()
+        profiler.exit('read')
+        profiler.exit('compute.dummy')
+        profiler.write(str(tmpdir))
+    finally:
+        profiler.close()
+
+    assert 100 == len(data)
+    read_stats = pstats.Stats(os.path.join(str(tmpdir), 'read.prof'))
+    assert '_allocate' in [function[2] for function in read_stats.stats]
+    compute_stats = pstats.Stats(os.path.join(str(tmpdir), 'compute.dummy.prof'))
+    assert '_compute' in [function[2] for function in compute_stats.stats]
+    assert '_allocate' not in [function[2] for function in compute_stats.stats]
+    assert os.path.exists(os.path.join(str(tmpdir), 'compute.dummy.txt'))
+    with open(os.path.join(str(tmpdir), 'read.allocations.txt'), 'r') as report_file:
+        assert 'test_profiling.py' in report_file.read()
+
+
+def test_merge_profiles_of_other_process(tmpdir):
+    worker_instrumentation = Instrumentation(profile=True)
+    try:
+        with worker_instrumentation.stage('compute.dummy'):
+            _compute()
+        snapshot = worker_instrumentation.get_snapshot()
+    finally:
+        worker_instrumentation.close()
+
+    profile_path = get_profile_path(str(tmpdir), True)
+    with instrument(None, profile_path) as instrumentation:
+        instrumentation.merge(snapshot)
+
+    assert 1 == instrumentation.get_snapshot()['stages']['compute.dummy']['calls']
+    compute_stats = pstats.Stats(os.path.join(profile_path, 'compute.dummy.prof'))
+    assert '_compute' in [function[2] for function in compute_stats.stats]
+
+
+def test_run_is_not_profiled_by_default(tmpdir):
+    assert get_profile_path(str(tmpdir), False) is None
+    with instrument(None, None) as instrumentation:
+        with stage('compute.dummy'):
+            _compute()
+    assert instrumentation is None
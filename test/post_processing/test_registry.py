@@ -0,0 +1,86 @@
+import json
+import os
+
+import multiply_post_processing.registry
+from multiply_post_processing.registry import get_available_indicator_names, get_entry_point_creators
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+
+class DummyCreator(object):
+
+    @classmethod
+    def get_name(cls) -> str:
+        return 'dummy'
+
+    @classmethod
+    def get_description(cls) -> str:
+        return 'A post processor for testing'
+
+    @classmethod
+    def get_indicator_names(cls) -> list:
+        return ['indicator_1', 'indicator_2']
+
+    @classmethod
+    def create_post_processor(cls, indicator_names: list) -> list:
+        return indicator_names
+
+
+class DummyEntryPoint(object):
+
+    def __init__(self):
+        self.name = 'dummy_creator'
+        self.value = 'dummy_module:DummyCreator'
+        self.num_loads = 0
+
+    def load(self):
+        self.num_loads += 1
+        return DummyCreator
+
+
+def test_get_entry_point_creators(tmpdir, monkeypatch):
+    entry_point = DummyEntryPoint()
+    monkeypatch.setattr(multiply_post_processing.registry, '_get_entry_points', lambda: [entry_point])
+    manifest_path = os.path.join(str(tmpdir), 'manifest.json')
+
+    creators = get_entry_point_creators(manifest_path)
+    assert 1 == len(creators)
+    assert 1 == entry_point.num_loads
+    assert os.path.exists(manifest_path)
+
+    creators = get_entry_point_creators(manifest_path)
+    assert 'dummy' == creators[0].get_name()
+    assert 'A post processor for testing' == creators[0].get_description()
+    assert ['indicator_1', 'indicator_2'] == creators[0].get_indicator_names()
+    assert 1 == entry_point.num_loads
+
+    assert ['indicator_1'] == creators[0].create_post_processor(['indicator_1'])
+    assert 2 == entry_point.num_loads
+
+
+def test_get_entry_point_creators_renews_outdated_manifest(tmpdir, monkeypatch):
+    entry_point = DummyEntryPoint()
+    monkeypatch.setattr(multiply_post_processing.registry, '_get_entry_points', lambda: [entry_point])
+    manifest_path = os.path.join(str(tmpdir), 'manifest.json')
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump({'other_creator=other_module:OtherCreator@None': {'name': 'other', 'description': '',
+                                                                    'indicator_names': []}}, manifest_file)
+
+    creators = get_entry_point_creators(manifest_path)
+
+    assert ['dummy'] == [creator.get_name() for creator in creators]
+    assert 1 == entry_point.num_loads
+    with open(manifest_path, 'r') as manifest_file:
+        assert ['dummy'] == [metadata['name'] for metadata in json.load(manifest_file).values()]
+
+
+def test_get_available_indicator_names(tmpdir, monkeypatch):
+    entry_point = DummyEntryPoint()
+    monkeypatch.setattr(multiply_post_processing.registry, '_get_entry_points', lambda: [entry_point])
+    manifest_path = os.path.join(str(tmpdir), 'manifest.json')
+    get_entry_point_creators(manifest_path)
+    creators = get_entry_point_creators(manifest_path)
+    monkeypatch.setattr(multiply_post_processing.registry, 'POST_PROCESSOR_CREATOR_REGISTRY', creators + creators)
+
+    assert ['indicator_1', 'indicator_2'] == get_available_indicator_names()
+    assert 1 == entry_point.num_loads
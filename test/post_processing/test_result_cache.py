@@ -0,0 +1,72 @@
+import numpy as np
+import os
+import time
+
+from multiply_post_processing.result_cache import get_cache_key, ResultCache
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+GRID_KEY = ((570000.0, 10.0, 0.0, 4330000.0, 0.0, -10.0), 'EPSG:32630', 250, 120)
+
+
+def test_put_and_get(tmpdir):
+    result_cache = ResultCache(str(tmpdir), 1024 * 1024)
+    assert 'key' not in result_cache
+    assert result_cache.get('key') is None
+
+    result_cache.put('key', {'indicator_1': np.ones((3, 4)), 'indicator_2': np.zeros((3, 4), dtype=np.int16)})
+
+    assert 'key' in result_cache
+    indicator_dict = result_cache.get('key')
+    assert ['indicator_1', 'indicator_2'] == sorted(indicator_dict.keys())
+    np.testing.assert_array_equal(np.ones((3, 4)), indicator_dict['indicator_1'])
+    assert np.int16 == indicator_dict['indicator_2'].dtype
+
+
+def test_evicts_least_recently_used(tmpdir):
+    array = np.ones((100, 100))
+    # room for two results, a third one exceeds the limit
+    result_cache = ResultCache(str(tmpdir), 3 * array.nbytes)
+    result_cache.put('a', {'indicator': array})
+    result_cache.put('b', {'indicator': array})
+    past = time.time() - 100
+    os.utime(os.path.join(str(tmpdir), 'a.npz'), (past, past))
+    os.utime(os.path.join(str(tmpdir), 'b.npz'), (past + 10, past + 10))
+    result_cache.get('a')
+    result_cache.put('c', {'indicator': array})
+
+    assert 'a' in result_cache
+    assert 'b' not in result_cache
+    assert 'c' in result_cache
+
+
+def test_get_cache_key():
+    input_states = {'input.tif': [1024, 1500000000.0]}
+    key = get_cache_key('dummy', '0.1', ['indicator_1'], GRID_KEY, input_states, '20170605')
+
+    assert key == get_cache_key('dummy', '0.1', ['indicator_1'], GRID_KEY, dict(input_states), '20170605')
+    assert key != get_cache_key('dummy', '0.2', ['indicator_1'], GRID_KEY, input_states, '20170605')
+    assert key != get_cache_key('dummy', '0.1', ['indicator_2'], GRID_KEY, input_states, '20170605')
+    assert key != get_cache_key('dummy', '0.1', ['indicator_1'], GRID_KEY + ((0, 0, 100, 100),), input_states,
+                                '20170605')
+    assert key != get_cache_key('dummy', '0.1', ['indicator_1'], GRID_KEY, {'input.tif': [1024, 1600000000.0]},
+                                '20170605')
+    assert key != get_cache_key('dummy', '0.1', ['indicator_1'], GRID_KEY, input_states, '20170615')
+
+
+def test_scans_cache_only_once_in_a_while(tmpdir, monkeypatch):
+    array = np.ones((10, 10))
+    result_cache = ResultCache(str(tmpdir), 1024 * 1024)
+    scans = []
+    evict = ResultCache._evict
+
+    def _evict(self):
+        scans.append(1)
+        return evict(self)
+
+    monkeypatch.setattr(ResultCache, '_evict', _evict)
+    for i in range(20):
+        result_cache.put(str(i), {'indicator': array})
+
+    assert 1 == len(scans)
+    assert 20 == len(os.listdir(str(tmpdir)))
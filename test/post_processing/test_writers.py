@@ -0,0 +1,145 @@
+import numpy as np
+import os
+import pytest
+
+from datetime import datetime
+from multiply_post_processing.writers import check_compression, get_creation_options, _get_overview_levels, \
+    NetCDFDataCubeWriter, WriteQueue
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+
+def test_write_queue():
+    written = []
+    write_queue = WriteQueue(queue_depth=1)
+    for i in range(5):
+        write_queue.submit('file', written.append, i)
+    write_queue.close()
+
+    assert [0, 1, 2, 3, 4] == written
+
+
+def test_write_queue_without_threads():
+    written = []
+    write_queue = WriteQueue(num_threads=0)
+    write_queue.submit('file', written.append, 0)
+
+    assert [0] == written
+    write_queue.close()
+
+
+def test_write_queue_keeps_order_per_key():
+    written = {'a': [], 'b': [], 'c': []}
+    write_queue = WriteQueue(queue_depth=2, num_threads=3)
+    for i in range(20):
+        for key in written:
+            write_queue.submit(key, written[key].append, i)
+    write_queue.flush()
+
+    for key in written:
+        assert list(range(20)) == written[key]
+    write_queue.close()
+
+
+def test_write_queue_raises_error_on_flush():
+    def fail():
+        raise ValueError('Disk full')
+
+    write_queue = WriteQueue(num_threads=2)
+    write_queue.submit('file', fail)
+
+    with pytest.raises(IOError):
+        write_queue.flush()
+    with pytest.raises(IOError):
+        write_queue.close()
+
+
+def test_write_queue_raises_error_on_submit():
+    def fail():
+        raise ValueError('Disk full')
+
+    written = []
+    write_queue = WriteQueue(num_threads=0)
+    write_queue.submit('file', fail)
+
+    with pytest.raises(IOError):
+        write_queue.submit('file', written.append, 0)
+    assert [] == written
+    write_queue.close(raise_error=False)
+
+
+def test_get_creation_options():
+    assert [] == get_creation_options('GeoTiff')
+    assert ['TILED=YES', 'BLOCKXSIZE=512', 'BLOCKYSIZE=512', 'BIGTIFF=IF_SAFER'] == get_creation_options('COG')
+    assert ['TILED=YES', 'BLOCKXSIZE=512', 'BLOCKYSIZE=512', 'BIGTIFF=IF_SAFER', 'COMPRESS=ZSTD', 'PREDICTOR=3'] == \
+           get_creation_options('GeoTiff', 'ZSTD')
+
+
+def test_get_creation_options_unknown_compression():
+    with pytest.raises(ValueError):
+        get_creation_options('GeoTiff', 'JPEG')
+
+
+def test_check_compression():
+    check_compression('GeoTiff', 'LZW')
+    check_compression('COG', 'ZSTD')
+    check_compression('NetCDF', 'DEFLATE')
+    check_compression('NetCDF', None)
+    with pytest.raises(ValueError):
+        check_compression('NetCDF', 'LZW')
+    with pytest.raises(ValueError):
+        check_compression('GeoTiff', 'JPEG')
+
+
+def test_get_overview_levels():
+    assert [] == _get_overview_levels(200, 100)
+    assert [2, 4, 8] == _get_overview_levels(2048, 1000)
+
+
+def test_net_cdf_data_cube_writer_appends_time_steps(tmpdir):
+    netCDF4 = pytest.importorskip('netCDF4')
+    file_name = os.path.join(str(tmpdir), 'ind.nc')
+    geo_transform = (500000.0, 10.0, 0.0, 4000000.0, 0.0, -10.0)
+    writer = NetCDFDataCubeWriter([file_name], ['ind'], geo_transform, 'EPSG:32632', 5, 4, chunk_size=2)
+    writer.write([np.zeros((4, 2))], datetime(2017, 6, 1), datetime(2017, 6, 6), 0, 0)
+    writer.write([np.ones((4, 3))], datetime(2017, 6, 1), datetime(2017, 6, 6), 2, 0)
+    writer.close()
+    writer = NetCDFDataCubeWriter([file_name], ['ind'], geo_transform, 'EPSG:32632', 5, 4, chunk_size=2)
+    writer.write([np.full((4, 5), 2.)], datetime(2017, 6, 6), datetime(2017, 6, 11))
+    writer.close()
+
+    data_set = netCDF4.Dataset(file_name)
+    try:
+        assert (2, 4, 5) == data_set.variables['ind'].shape
+        assert [1, 2, 2] == data_set.variables['ind'].chunking()
+        assert [17318., 17323.] == data_set.variables['time'][:].tolist()
+        assert [[17318., 17323.], [17323., 17328.]] == data_set.variables['time_bnds'][:].tolist()
+        assert [5.0, 15.0, 25.0, 35.0, 45.0] == (data_set.variables['x'][:] - 500000).tolist()
+        np.testing.assert_array_equal([[0, 0, 1, 1, 1]] * 4, data_set.variables['ind'][0])
+        np.testing.assert_array_equal(np.full((4, 5), 2.), data_set.variables['ind'][1])
+    finally:
+        data_set.close()
+
+
+def test_net_cdf_data_cube_writer_inserts_earlier_time_steps(tmpdir):
+    netCDF4 = pytest.importorskip('netCDF4')
+    file_name = os.path.join(str(tmpdir), 'ind.nc')
+    geo_transform = (500000.0, 10.0, 0.0, 4000000.0, 0.0, -10.0)
+    writer = NetCDFDataCubeWriter([file_name], ['ind'], geo_transform, 'EPSG:32632', 2, 2)
+    writer.write([np.full((2, 2), 1.)], datetime(2017, 6, 1), datetime(2017, 6, 6))
+    writer.write([np.full((2, 2), 3.)], datetime(2017, 6, 11), datetime(2017, 6, 16))
+    writer.close()
+    writer = NetCDFDataCubeWriter([file_name], ['ind'], geo_transform, 'EPSG:32632', 2, 2)
+    writer.write([np.full((2, 1), 2.)], datetime(2017, 6, 6), datetime(2017, 6, 11), 1, 0)
+    writer.write([np.full((2, 2), 4.)], datetime(2017, 6, 11), datetime(2017, 6, 16))
+    writer.close()
+
+    data_set = netCDF4.Dataset(file_name)
+    try:
+        assert [17318., 17323., 17328.] == data_set.variables['time'][:].tolist()
+        assert [[17318., 17323.], [17323., 17328.], [17328., 17333.]] == data_set.variables['time_bnds'][:].tolist()
+        np.testing.assert_array_equal(np.full((2, 2), 1.), data_set.variables['ind'][0])
+        np.testing.assert_array_equal([[np.nan, 2.], [np.nan, 2.]], data_set.variables['ind'][1].filled(np.nan))
+        np.testing.assert_array_equal(np.full((2, 2), 4.), data_set.variables['ind'][2])
+    finally:
+        data_set.close()